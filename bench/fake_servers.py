@@ -0,0 +1,307 @@
+import base64
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import google_crc32c
+
+SPRITE_KEYS = (
+    "front_default", "back_default", "front_shiny", "back_shiny",
+    "other/official-artwork/front_default", "other/home/front_default",
+    "versions/generation-v/black-white/animated/front_default",
+)
+
+
+class LatencyRecorder:
+    """Thread-safe list of per-request handling times, in seconds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: List[float] = []
+        self.errors = 0
+
+    def add(self, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            if error:
+                self.errors += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples = []
+            self.errors = 0
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            errors = self.errors
+        if not samples:
+            return {"requests": 0, "errors": errors, "p50_ms": 0.0, "p99_ms": 0.0}
+        return {
+            "requests": len(samples),
+            "errors": errors,
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+            "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, handler, latency_ms: float, error_rate: float, seed: int):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.recorder = LatencyRecorder()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self) -> "_Server":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _Server
+
+    def log_message(self, *args):
+        pass
+
+    def _inject(self) -> bool:
+        """Sleep for the configured latency; returns True if this request should fail"""
+        if self.server.latency_ms:
+            # Log-normal around the target gives a realistic long tail
+            time.sleep(self.server.random.lognormvariate(0, 0.5) * self.server.latency_ms / 1000)
+        return self.server.random.random() < self.server.error_rate
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status: int = 200):
+        self._send(status, json.dumps(data).encode())
+
+    def _fail(self):
+        if self.server.random.random() < 0.5:
+            self._send(429, b"{}", headers={"Retry-After": "0"})
+        else:
+            self._send(503, b"{}")
+
+    def _timed(self, handler):
+        start = time.perf_counter()
+        failed = self._inject()
+        if failed:
+            self._fail()
+        else:
+            handler()
+        self.server.recorder.add(time.perf_counter() - start, error=failed)
+
+
+class FakePokeApiHandler(_Handler):
+    """Synthetic PokeAPI: /api/v2/pokemon, /api/v2/pokemon/{id}/, /api/v2/pokemon-form/{id}/, /api/v2/ability
+    and /sprites/..."""
+
+    moves_per_pokemon = 80
+    ability_count = 300
+    sprite_bytes = 2048
+
+    def do_GET(self):
+        self._timed(self._route)
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        base = self.server.base_url
+
+        if parts.path.rstrip("/") == "/api/v2/pokemon":
+            limit = int(parse_qs(parts.query).get("limit", ["20"])[0])
+            results = [{"name": f"poke-{i}", "url": f"{base}/api/v2/pokemon/{i}/"} for i in range(1, limit + 1)]
+            return self._send_json({"count": limit, "results": results})
+
+        if parts.path.rstrip("/") == "/api/v2/ability":
+            query = parse_qs(parts.query)
+            limit = int(query.get("limit", ["20"])[0])
+            offset = int(query.get("offset", ["0"])[0])
+            ids = range(offset + 1, min(offset + limit, self.ability_count) + 1)
+            results = [{"name": f"ability-{i}", "url": f"{base}/api/v2/ability/{i}/"} for i in ids]
+            return self._send_json({"count": self.ability_count, "results": results})
+
+        match = re.fullmatch(r"/api/v2/pokemon/(\d+)/?", parts.path)
+        if match:
+            return self._send_json(self._pokemon(int(match.group(1)), base))
+
+        match = re.fullmatch(r"/api/v2/pokemon-form/(\d+)/?", parts.path)
+        if match:
+            form_id = int(match.group(1))
+            return self._send_json({
+                "id": form_id,
+                "name": f"poke-{form_id}-form",
+                "sprites": {
+                    "front_default": f"{base}/sprites/forms/{form_id}/front_default.png",
+                    "back_default": f"{base}/sprites/forms/{form_id}/back_default.png",
+                },
+            })
+
+        if parts.path.startswith("/sprites/"):
+            # Body derived from the path; "shared" sprites are identical across pokemon to exercise dedup
+            seed = parts.path.encode()
+            body = (seed * (self.sprite_bytes // len(seed) + 1))[:self.sprite_bytes]
+            return self._send(200, body, "image/png")
+
+        self._send_json({"detail": "Not found."}, status=404)
+
+    def _pokemon(self, pokemon_id: int, base: str) -> dict:
+        sprites: dict = {}
+        for key in SPRITE_KEYS:
+            node = sprites
+            *path, leaf = key.split("/")
+            for part in path:
+                node = node.setdefault(part, {})
+            node[leaf] = f"{base}/sprites/pokemon/{pokemon_id}/{key.replace('/', '_')}.png"
+        sprites["other"]["showdown"] = {"front_default": f"{base}/sprites/shared/placeholder.png"}
+        return {
+            "id": pokemon_id,
+            "name": f"poke-{pokemon_id}",
+            "base_experience": 64 + pokemon_id % 200,
+            "height": 3 + pokemon_id % 40,
+            "weight": 20 + pokemon_id % 900,
+            "order": pokemon_id,
+            "abilities": [
+                {
+                    "ability": {"name": f"ability-{a}", "url": f"{base}/api/v2/ability/{a}/"},
+                    "is_hidden": a % 2 == 0,
+                    "slot": slot + 1,
+                }
+                for slot, a in enumerate((pokemon_id % 300 + 1, (pokemon_id * 7) % 300 + 1))
+            ],
+            "types": [{"slot": 1, "type": {"name": "normal", "url": f"{base}/api/v2/type/1/"}}],
+            "stats": [
+                {"base_stat": 40 + pokemon_id % 60, "effort": 0, "stat": {"name": name, "url": f"{base}/api/v2/stat/{i}/"}}
+                for i, name in enumerate(("hp", "attack", "defense", "special-attack", "special-defense", "speed"), 1)
+            ],
+            "forms": [{"name": f"poke-{pokemon_id}-form", "url": f"{base}/api/v2/pokemon-form/{pokemon_id}/"}],
+            # Real documents are dominated by the moves array
+            "moves": [
+                {
+                    "move": {"name": f"move-{m}", "url": f"{base}/api/v2/move/{m}/"},
+                    "version_group_details": [
+                        {"level_learned_at": m % 50, "move_learn_method": {"name": "level-up", "url": f"{base}/x/"}}
+                    ],
+                }
+                for m in range(self.moves_per_pokemon)
+            ],
+            "sprites": sprites,
+        }
+
+
+class FakeGcsHandler(_Handler):
+    """Just enough of the GCS JSON API for google-cloud-storage uploads (multipart and resumable) and listings"""
+
+    objects: dict = {}
+    sessions: dict = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        self._timed(self._list)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if parse_qs(urlsplit(self.path).query).get("uploadType") == ["resumable"]:
+            return self._timed(lambda: self._start_session(body))
+        self._timed(lambda: self._upload(body))
+
+    def do_PUT(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        self._timed(lambda: self._upload_chunk(body))
+
+    def _start_session(self, body: bytes):
+        parts = urlsplit(self.path)
+        bucket = re.fullmatch(r"/upload/storage/v1/b/([^/]+)/o", parts.path).group(1)
+        query = parse_qs(parts.query)
+        name = json.loads(body or b"{}").get("name") or query.get("name", [None])[0]
+        with self.lock:
+            upload_id = str(len(self.sessions) + 1)
+            self.sessions[upload_id] = {"bucket": bucket, "name": name, "query": query, "data": bytearray()}
+        location = f"{self.server.base_url}{parts.path}?uploadType=resumable&upload_id={upload_id}"
+        self._send(200, b"", headers={"Location": location})
+
+    def _upload_chunk(self, body: bytes):
+        upload_id = parse_qs(urlsplit(self.path).query).get("upload_id", [""])[0]
+        with self.lock:
+            session = self.sessions.get(upload_id)
+        if session is None:
+            return self._send_json({"error": {"code": 404}}, status=404)
+        # Content-Range: bytes <first>-<last>/<total or *>, or bytes */<total> for an empty final request
+        match = re.fullmatch(r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)", self.headers.get("Content-Range", ""))
+        if match and match.group(1) is not None:
+            session["data"][int(match.group(1)):] = body
+        total = match.group(2) if match else "*"
+        if total == "*" or len(session["data"]) < int(total):
+            received = len(session["data"])
+            headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+            return self._send(308, b"", headers=headers)
+        self._store(session["bucket"], session["name"], bytes(session["data"]), session["query"])
+
+    def _list(self):
+        parts = urlsplit(self.path)
+        match = re.fullmatch(r"/storage/v1/b/([^/]+)/o", parts.path)
+        if not match:
+            return self._send_json({"error": {"code": 404}}, status=404)
+        prefix = parse_qs(parts.query).get("prefix", [""])[0]
+        with self.lock:
+            items = [meta for name, meta in self.objects.items() if name.startswith(prefix)]
+        self._send_json({"kind": "storage#objects", "items": items})
+
+    def _upload(self, body: bytes):
+        parts = urlsplit(self.path)
+        match = re.fullmatch(r"/upload/storage/v1/b/([^/]+)/o", parts.path)
+        if not match:
+            return self._send_json({"error": {"code": 404}}, status=404)
+        bucket = match.group(1)
+        query = parse_qs(parts.query)
+        name = query.get("name", [None])[0]
+        data = body
+        boundary = re.search(r'boundary="?([^";]+)"?', self.headers.get("Content-Type", ""))
+        if boundary:
+            # Multipart upload: JSON object resource, then the media part
+            sections = body.split(b"--" + boundary.group(1).encode())
+            resource, data = (section.split(b"\r\n\r\n", 1)[1] for section in sections[1:3])
+            data = data[:-2] if data.endswith(b"\r\n") else data
+            name = json.loads(resource).get("name", name)
+        self._store(bucket, name, data, query)
+
+    def _store(self, bucket: str, name: str, data: bytes, query: dict):
+        crc32c = base64.b64encode(google_crc32c.Checksum(data).digest()).decode()
+        meta = {
+            "kind": "storage#object", "bucket": bucket, "name": name,
+            "size": str(len(data)), "crc32c": crc32c, "generation": "1",
+        }
+        with self.lock:
+            if query.get("ifGenerationMatch") == ["0"] and name in self.objects:
+                return self._send_json({"error": {"code": 412, "message": "conditionNotMet"}}, status=412)
+            self.objects[name] = meta
+        self._send_json(meta)
+
+
+def start_fake_pokeapi(latency_ms: float = 0, error_rate: float = 0, seed: int = 0) -> _Server:
+    return _Server(FakePokeApiHandler, latency_ms, error_rate, seed).start()
+
+
+def start_fake_gcs(latency_ms: float = 0, error_rate: float = 0, seed: int = 1) -> _Server:
+    return _Server(FakeGcsHandler, latency_ms, error_rate, seed).start()
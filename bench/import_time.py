@@ -0,0 +1,77 @@
+"""Import cost of each CLI path, measured in fresh interpreters with `python -X importtime`.
+
+    python -m bench.import_time
+    python -m bench.import_time --runs 10 --top 8
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What each command imports before it does any work
+TARGETS: Dict[str, str] = {
+    "--help": "etl.cli",
+    "fetch": "etl.extract.PokeApiClient",
+    "download": "etl.download.media_downloader",
+    "download --engine async": "etl.download.async_media_downloader",
+    "upload": "etl.upload.media_uploader",
+    "load-db": "sql_manager.bulk_loader",
+    "export": "sql_manager.snapshot_export",
+}
+# Backends that must stay out of the paths that don't use them
+HEAVY = ("google.cloud.storage", "psycopg2", "aiohttp", "PIL")
+
+
+def import_profile(module: str) -> Tuple[float, List[Tuple[float, str]], List[str]]:
+    """Total ms, top-level imports by cumulative ms, and which heavy backends got loaded"""
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    roots = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Top-level entries have no indentation in the name column
+        if not name[1:].startswith(" "):
+            roots.append((int(cumulative) / 1000, name.strip()))
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return sum(ms for ms, _ in roots), sorted(roots, reverse=True), loaded
+
+
+def wall_ms(args: List[str], runs: int) -> float:
+    """Median wall time of a whole command, interpreter start-up included"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=REPO_ROOT, capture_output=True, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import time per CLI path")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per wall-time sample")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports listed per path")
+    args = parser.parse_args()
+
+    baseline = wall_ms(["-c", "pass"], args.runs)
+    print(f"🐍 Bare interpreter:               {baseline:7.1f} ms")
+    print(f"⌨️  main.py --help:                 {wall_ms(['main.py', '--help'], args.runs):7.1f} ms wall")
+    print()
+    for command, module in TARGETS.items():
+        total, roots, loaded = import_profile(module)
+        print(f"📦 {command:<26} {total:7.1f} ms imports ({module})  heavy: {', '.join(loaded) or 'none'}")
+        for ms, name in roots[:args.top]:
+            print(f"      {ms:7.1f} ms  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""Offline benchmark: downloader, uploader and DB loader against local PokeAPI / GCS stand-ins.
+
+    python -m bench.run_bench --sizes 100,1000 --latency-ms 20 --error-rate 0.01
+    python -m bench.run_bench --sizes 100 --compare bench_results/<older>.json
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bench.fake_servers import start_fake_gcs, start_fake_pokeapi
+
+BENCH_SCHEMA = "etl_bench"
+REGRESSION_THRESHOLD = 0.10
+
+
+def _usage() -> dict:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_mb = usage.ru_maxrss / 1024 / (1024 if sys.platform == "darwin" else 1)
+    return {"peak_rss_mb": round(rss_mb, 1), "cpu_s": round(usage.ru_utime + usage.ru_stime, 2)}
+
+
+# -------- SCENARIOS (each runs in a fresh process so RSS/CPU are its own) --------
+def _bench_downloader(engine: str, size: int, api_url: str) -> dict:
+    if engine == "async":
+        from etl.download.async_media_downloader import AsyncMediaDownloader
+        downloader = AsyncMediaDownloader(limit=size, api_url=api_url)
+    else:
+        from etl.download.media_downloader import FastThreadMediaDownloader
+        downloader = FastThreadMediaDownloader(limit=size, api_url=api_url, use_cache=False)
+
+    start = time.perf_counter()
+    downloader.run()
+    elapsed = time.perf_counter() - start
+    files = downloader.total_sprites + downloader.total_form_media
+    return {"items": files, "failed": downloader.failed_downloads, "seconds": elapsed}
+
+
+def _fake_gcs_client(gcs_url: str):
+    from google.auth.credentials import AnonymousCredentials
+    from etl.upload.media_uploader import gcs_client
+    return gcs_client(
+        project="bench",
+        credentials=AnonymousCredentials(),
+        client_options={"api_endpoint": gcs_url},
+    )
+
+
+def _bench_uploader(size: int, gcs_url: str, files_per_pokemon: int = 5, file_bytes: int = 2048) -> dict:
+    from etl.upload.media_uploader import MediaUploader
+
+    root = "upload_src"
+    for i in range(size):
+        folder = os.path.join(root, f"poke-{i}")
+        os.makedirs(folder, exist_ok=True)
+        for j in range(files_per_pokemon):
+            with open(os.path.join(folder, f"sprite_{j}.png"), "wb") as f:
+                f.write(os.urandom(file_bytes))
+
+    uploader = MediaUploader(client=_fake_gcs_client(gcs_url))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(
+            lambda name: uploader.upload_folder(os.path.join(root, name), name),
+            sorted(os.listdir(root)),
+        ))
+    elapsed = time.perf_counter() - start
+    uploaded = sum(len(urls) for urls in results)
+    return {"items": uploaded, "failed": size * files_per_pokemon - uploaded, "seconds": elapsed}
+
+
+def _bench_db(size: int, db_url: str) -> dict:
+    import psycopg2
+
+    from sql_manager.bulk_loader import BulkLoader
+    from sql_manager.pool import LazyConnectionPool
+
+    schema_sql = open(os.path.join(os.path.dirname(__file__), "..", "sql_manager", "queries.sql")).read()
+    conn = psycopg2.connect(db_url)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+        cursor.execute(f"SET search_path TO {BENCH_SCHEMA}")
+        for statement in re.split(r"\n(?=create |alter )", schema_sql, flags=re.I):
+            if statement.strip():
+                cursor.execute(statement)
+    conn.close()
+
+    bench_pool = LazyConnectionPool(dsn=db_url, options=f"-c search_path={BENCH_SCHEMA}")
+    loader = BulkLoader(connection_pool=bench_pool)
+    start = time.perf_counter()
+    loaded = loader.load_all({
+        "ability": ((f"ability-{a}", f"https://pokeapi.co/api/v2/ability/{a}/", a) for a in range(1, 301)),
+        "pokes": ((i, f"poke-{i}", 64, 7, 69, i) for i in range(1, size + 1)),
+        "pokes_ability": ((i % 300 + 1, i) for i in range(1, size + 1)),
+        "poke_media": (
+            (f"poke-{i}", f"https://storage.googleapis.com/bench/{i}/{j}.png", None)
+            for i in range(1, size + 1) for j in range(10)
+        ),
+    })
+    elapsed = time.perf_counter() - start
+    bench_pool.closeall()
+    return {"items": sum(loaded.values()), "failed": 0, "seconds": elapsed, "rows_per_s": loader.rows_per_second()}
+
+
+def _child(scenario: dict, queue) -> None:
+    os.chdir(tempfile.mkdtemp(prefix="poke_bench_"))
+    os.environ.setdefault("BUCKET_NAME", "bench")
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if scenario["stage"] == "download":
+                result = _bench_downloader(scenario["engine"], scenario["size"], scenario["api_url"])
+            elif scenario["stage"] == "upload":
+                result = _bench_uploader(scenario["size"], scenario["gcs_url"])
+            else:
+                result = _bench_db(scenario["size"], scenario["db_url"])
+        result.update(_usage())
+        queue.put(result)
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_scenario(scenario: dict) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_child, args=(scenario, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    if "error" not in result:
+        result["items_per_s"] = round(result["items"] / result["seconds"], 1) if result["seconds"] else 0.0
+        result["seconds"] = round(result["seconds"], 3)
+    return result
+
+
+# -------- REPORTING --------
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict) -> int:
+    old = {s["name"]: s for s in baseline["scenarios"]}
+    regressions = 0
+    print(f"\nComparing against {baseline['commit']} ({baseline['timestamp']})")
+    for scenario in current["scenarios"]:
+        before = old.get(scenario["name"])
+        if not before or "error" in scenario or "error" in before or not before["items_per_s"]:
+            continue
+        change = scenario["items_per_s"] / before["items_per_s"] - 1
+        flag = "  REGRESSION" if change < -REGRESSION_THRESHOLD else ""
+        regressions += bool(flag)
+        print(f"  {scenario['name']:<28} {before['items_per_s']:>10.1f} -> {scenario['items_per_s']:>10.1f} items/s "
+              f"({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline ETL benchmark")
+    parser.add_argument("--sizes", default="100,1000", help="Comma separated pokemon counts (100..10000)")
+    parser.add_argument("--stages", default="download,upload,db", help="Subset of download,upload,db")
+    parser.add_argument("--engines", default="thread,async", help="Downloader engines to compare")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Median injected latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 429/503")
+    parser.add_argument("--db-url", default=os.getenv("BENCH_DB_URL"), help="Postgres for the db stage")
+    parser.add_argument("--output", default=None, help="Result file (default bench_results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to diff against")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    stages = args.stages.split(",")
+    pokeapi = start_fake_pokeapi(args.latency_ms, args.error_rate)
+    gcs = start_fake_gcs(args.latency_ms, args.error_rate)
+
+    scenarios = []
+    for size in sizes:
+        if "download" in stages:
+            for engine in args.engines.split(","):
+                scenarios.append({"name": f"download-{engine}-{size}", "stage": "download", "engine": engine,
+                                  "size": size, "api_url": f"{pokeapi.base_url}/api/v2"})
+        if "upload" in stages:
+            scenarios.append({"name": f"upload-{size}", "stage": "upload", "size": size, "gcs_url": gcs.base_url})
+        if "db" in stages and args.db_url:
+            scenarios.append({"name": f"db-{size}", "stage": "db", "size": size, "db_url": args.db_url})
+    if "db" in stages and not args.db_url:
+        print("Skipping db stage: pass --db-url or set BENCH_DB_URL")
+
+    results = []
+    for scenario in scenarios:
+        # The fake servers live in this process, so their latency recorders can be read directly
+        server = {"download": pokeapi, "upload": gcs}.get(scenario["stage"])
+        if server:
+            server.recorder.reset()
+        print(f"▶ {scenario['name']} ...", flush=True)
+        result = run_scenario(scenario)
+        if server:
+            result["latency"] = server.recorder.summary()
+        result["name"] = scenario["name"]
+        results.append(result)
+        if "error" in result:
+            print(f"  ❌ {result['error']}")
+        else:
+            latency = result.get("latency")
+            latency_text = f"  p50={latency['p50_ms']}ms p99={latency['p99_ms']}ms" if latency else ""
+            print(f"  {result['items_per_s']:>10.1f} items/s{latency_text}  "
+                  f"rss={result['peak_rss_mb']}MB cpu={result['cpu_s']}s")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {"latency_ms": args.latency_ms, "error_rate": args.error_rate},
+        "scenarios": results,
+    }
+    output = args.output or os.path.join("bench_results", f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📄 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            return 1 if compare(report, json.load(f)) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
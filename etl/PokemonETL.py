@@ -1,68 +1,155 @@
-# import logging
-# import os
-# import shutil
-# from concurrent.futures import ThreadPoolExecutor
-# from datetime import datetime
-#
-# from etl.download.media_downloader import MediaDownloader
-# from etl.extract.PokeApiClient import PokeApiClient
-# from etl.pokemon.pokemon_factory import PokemonFactory
-# from etl.upload.media_uploader import MediaUploader
-# from utils.helper import extract_urls
-# from utils.logger import logger
-# from utils.settings import URL
-#
-# logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
-#
-# class PokemonETLManager:
-#     def __init__(self):
-#         self.client = PokeApiClient(URL)
-#         self.downloader = MediaDownloader()
-#         self.uploader = MediaUploader()
-#         self.temp_dir = 'downloads'
-#         self.pokemon_data_list = []
-#
-#     def download_phase_task(self, p_id: int):
-#         try:
-#             raw_data = self.client.fetch_raw_pokemon_data(p_id)
-#             poke_obj = PokemonFactory.from_api(raw_data)
-#
-#             self.pokemon_data_list.append(poke_obj)
-#
-#             urls = extract_urls(raw_data.get('sprites', {}))
-#             if urls:
-#                 local_folder = os.path.join(self.temp_dir, poke_obj.name)
-#                 self.downloader.download_batch(urls, local_folder)
-#             return poke_obj.name
-#         except Exception as e:
-#             logger.warning(f"Download phase failed for id={p_id}: {e}")
-#             return None
-#
-#     def upload_phase_task(self, pokemon_name: str):
-#         try:
-#             local_folder = os.path.join(self.temp_dir, pokemon_name)
-#             if os.path.exists(local_folder):
-#                 self.uploader.upload_folder(local_folder, pokemon_name)
-#                 shutil.rmtree(local_folder)
-#                 return True
-#         except Exception as e:
-#             return False
-#
-#     def run(self, limit):
-#         start_time = datetime.now()
-#
-#         ids = self.client.fetch_all_ids(limit)
-#         logger.info(f"--- STARTING DOWNLOAD PHASE ---")
-#         with ThreadPoolExecutor(max_workers=100) as executor:
-#             downloaded_names = list(executor.map(self.download_phase_task, ids))
-#
-#         successful_names = [name for name in downloaded_names if name]
-#
-#         logger.info(f"--- STARTING UPLOAD PHASE ---")
-#         with ThreadPoolExecutor(max_workers=120) as executor:
-#             executor.map(self.upload_phase_task, successful_names)
-#
-#         # logger.info("Bulk inserting to Database...")
-#         # self.poke_saver.save_pokemon(self.pokemon_data_list)
-#
-#         logger.info(f"Total Duration: {datetime.now() - start_time}")
\ No newline at end of file
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from utils.logger import logger
+from utils.tracing import tracer
+
+if TYPE_CHECKING:
+    from etl.pokemon.pokemon_batch import PokemonBatch
+
+STAGES = ("fetch", "download", "upload", "load-db", "export")
+
+
+class PokemonETLManager:
+    """fetch -> download -> upload -> load-db -> export; each stage imports its backend (requests, GCS, psycopg2, aiohttp)
+    only when it runs, so a fetch-only run never pays for the others"""
+
+    def __init__(
+            self,
+            limit: int = 1325,
+            api_url: str = "https://pokeapi.co/api/v2",
+            workers: int = 32,
+            download_dir: str = "downloads",
+    ):
+        self.limit = limit
+        self.api_url = api_url.rstrip("/")
+        self.workers = workers
+        self.download_dir = download_dir
+        self.batch: Optional["PokemonBatch"] = None
+
+    # -------- FETCH --------
+    def fetch(self, tsv_dir: Optional[str] = None) -> "PokemonBatch":
+        """Pokemon documents (projected to the fields we keep) into a columnar batch"""
+        from etl.extract.PokeApiClient import PokeApiClient
+        from etl.pokemon.pokemon_factory import PokemonFactory
+
+        client = PokeApiClient(f"{self.api_url}/pokemon{{}}")
+        ids = client.fetch_all_ids(self.limit)
+
+        def fetch_one(pokemon_id: int) -> Optional[dict]:
+            try:
+                with tracer.span("fetch", f"#{pokemon_id}") as span:
+                    data = client.fetch_raw_pokemon_data(pokemon_id)
+                    if data:
+                        span.item = data.get("name")
+                return data
+            except Exception as e:
+                logger.warning(f"Fetch failed for id={pokemon_id}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fetch") as executor:
+            documents = [data for data in executor.map(fetch_one, ids) if data]
+        with tracer.span("parse", documents=len(documents)):
+            self.batch = PokemonFactory.to_batch(documents)
+        print(f"✅ Fetched {len(self.batch):,}/{len(ids):,} Pokemon "
+              f"({len(self.batch.abilities)} abilities, {len(self.batch.types)} types)")
+
+        if tsv_dir:
+            os.makedirs(tsv_dir, exist_ok=True)
+            for table in self.batch.rows_by_table():
+                with open(os.path.join(tsv_dir, f"{table}.tsv"), "w", encoding="utf-8") as f:
+                    self.batch.write_tsv(table, f)
+            print(f"📄 Tables written to {os.path.abspath(tsv_dir)}")
+        return self.batch
+
+    # -------- DOWNLOAD --------
+    def download(self, engine: str = "threads", staged: bool = False, optimize: bool = False) -> None:
+        os.makedirs(self.download_dir, exist_ok=True)
+        if engine == "async":
+            from etl.download.async_media_downloader import AsyncMediaDownloader
+
+            downloader = AsyncMediaDownloader(limit=self.limit, api_url=self.api_url, download_dir=self.download_dir)
+            downloader.run()
+            return
+
+        from etl.download.media_downloader import FastThreadMediaDownloader
+
+        optimizer = None
+        if optimize:
+            from etl.transform.image_optimizer import ImageOptimizer
+            optimizer = ImageOptimizer()
+        downloader = FastThreadMediaDownloader(
+            limit=self.limit, api_url=self.api_url, optimizer=optimizer, download_dir=self.download_dir
+        )
+        if staged:
+            downloader.run_staged()
+        else:
+            downloader.run()
+
+    # -------- UPLOAD --------
+    def upload(self, dedup: bool = False) -> int:
+        """Upload every downloads/<name> tree to pokemon/<name>/; returns files uploaded or skipped"""
+        from etl.upload.media_uploader import FAILED, MediaUploader
+
+        if not os.path.isdir(self.download_dir):
+            print(f"⚠️  Nothing to upload: {os.path.abspath(self.download_dir)} does not exist")
+            return 0
+        uploader = MediaUploader(dedup=dedup)
+        done = failed = 0
+        for name in sorted(os.listdir(self.download_dir)):
+            local_root = os.path.join(self.download_dir, name)
+            if not os.path.isdir(local_root):
+                continue
+            with tracer.span("upload", name):
+                for result in uploader.upload_tree(local_root, name):
+                    if result.status == FAILED:
+                        failed += 1
+                    else:
+                        done += 1
+        uploader.flush()
+        print(f"☁️  Uploaded {done:,} files to gs://{uploader.bucket.name}/pokemon ({failed:,} failed)")
+        return done
+
+    # -------- LOAD DB --------
+    def load_db(self) -> dict:
+        """Bulk load the fetched batch (fetching first if this run hasn't)"""
+        from sql_manager.bulk_loader import BulkLoader
+
+        batch = self.batch if self.batch is not None else self.fetch()
+        loader = BulkLoader()
+        # One SELECT up front; pokes_ability links then resolve in memory, new abilities in one query per batch
+        loader.ability_sync.load_index()
+        counts = loader.load_batch(batch)
+        print("🗄️  Loaded " + ", ".join(f"{table}={rows:,}" for table, rows in counts.items()))
+        return counts
+
+    # -------- EXPORT --------
+    def export(self, snapshot_path: Optional[str] = None, full: bool = False) -> dict:
+        """Refresh the columnar snapshot from the database; unchanged partitions are reused"""
+        from sql_manager.snapshot_export import SnapshotExporter
+
+        exporter = SnapshotExporter(path=snapshot_path) if snapshot_path else SnapshotExporter()
+        stats = exporter.export(full=full)
+        print(f"📸 Snapshot {os.path.abspath(exporter.path)}: {stats['rows']:,} pokemon, {stats['media_rows']:,} media, "
+              f"{stats['rebuilt']}/{stats['partitions']} partitions rebuilt, {stats['bytes'] / 1024:,.1f} KiB")
+        return stats
+
+    def run(self, stages: Iterable[str] = STAGES, **options) -> None:
+        wanted = set(stages)
+        for stage in (stage for stage in STAGES if stage in wanted):
+            start = time.perf_counter()
+            print(f"\n--- {stage.upper()} ---")
+            with tracer.span(f"{stage} stage"):
+                if stage == "fetch":
+                    self.fetch(options.get("tsv_dir"))
+                elif stage == "download":
+                    self.download(options.get("engine", "threads"), options.get("staged", False), options.get("optimize", False))
+                elif stage == "upload":
+                    self.upload(options.get("dedup", False))
+                elif stage == "load-db":
+                    self.load_db()
+                else:
+                    self.export(options.get("snapshot_path"), options.get("full_export", False))
+            logger.info(f"Stage {stage} took {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,89 @@
+"""Pokemon ETL command line.
+
+    python main.py fetch --limit 10
+    python main.py download --limit 151 --staged
+    python main.py upload --dedup
+    python main.py load-db --limit 151
+    python main.py export --full
+    python main.py all --limit 151 --skip upload
+
+Only argparse and logging are imported up front; requests, GCS, psycopg2 and aiohttp load when a stage that needs them runs.
+"""
+import argparse
+import sys
+import time
+from typing import List, Optional
+
+from etl.PokemonETL import STAGES, PokemonETLManager
+from utils.tracing import enable_tracing_at_exit
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--limit", type=int, default=1325, help="Number of Pokemon")
+    common.add_argument("--api-url", default="https://pokeapi.co/api/v2")
+    common.add_argument("--workers", type=int, default=32, help="Parallel fetches for fetch/load-db")
+    common.add_argument("--download-dir", default="downloads")
+    common.add_argument("--trace", default=None, help="Write a sampled Chrome/Perfetto trace here (TRACE_PATH)")
+    common.add_argument("--trace-sample", type=float, default=None, help="Share of pokemon traced (TRACE_SAMPLE_RATE)")
+
+    fetch_options = argparse.ArgumentParser(add_help=False)
+    fetch_options.add_argument("--tsv", dest="tsv_dir", default=None, help="Also write every table as TSV here")
+
+    download_options = argparse.ArgumentParser(add_help=False)
+    download_options.add_argument("--engine", choices=("threads", "async"), default="threads")
+    download_options.add_argument("--staged", action="store_true", help="Bounded stage pipeline (threads engine)")
+    download_options.add_argument("--optimize", action="store_true", help="Lossless PNG recompression (threads engine)")
+
+    upload_options = argparse.ArgumentParser(add_help=False)
+    upload_options.add_argument("--dedup", action="store_true", help="Content-addressed uploads")
+
+    export_options = argparse.ArgumentParser(add_help=False)
+    export_options.add_argument("--snapshot", dest="snapshot_path", default=None, help="Snapshot file (SNAPSHOT_PATH)")
+    export_options.add_argument("--full", dest="full_export", action="store_true", help="Rebuild every partition")
+
+    parser = argparse.ArgumentParser(prog="pokemon-etl", description="Pokemon ETL pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("fetch", parents=[common, fetch_options], help="Fetch pokemon documents")
+    sub.add_parser("download", parents=[common, download_options], help="Download sprites and form media")
+    sub.add_parser("upload", parents=[common, upload_options], help="Upload the downloads/ tree to GCS")
+    sub.add_parser("load-db", parents=[common], help="Fetch and bulk load pokemon, abilities, types and stats")
+    sub.add_parser("export", parents=[common, export_options], help="Refresh the columnar snapshot from the database")
+    run_all = sub.add_parser(
+        "all", parents=[common, fetch_options, download_options, upload_options, export_options],
+        help="Every stage in order",
+    )
+    run_all.add_argument("--skip", action="append", choices=STAGES, default=[], help="Leave a stage out (repeatable)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    stages = [stage for stage in STAGES if stage not in args.skip] if args.command == "all" else [args.command]
+
+    # Imported after parsing so --help stays fast; all three are no-ops unless METRICS_PORT /
+    # METRICS_SNAPSHOT_PATH / TRACE_PATH (or --trace) are set
+    from utils.metrics import enable_snapshot_at_exit, start_metrics_server
+
+    start_metrics_server()
+    enable_snapshot_at_exit()
+    enable_tracing_at_exit(args.trace, args.trace_sample)
+    start = time.perf_counter()
+    manager = PokemonETLManager(
+        limit=args.limit, api_url=args.api_url, workers=args.workers, download_dir=args.download_dir
+    )
+    manager.run(
+        stages,
+        tsv_dir=getattr(args, "tsv_dir", None),
+        engine=getattr(args, "engine", "threads"),
+        staged=getattr(args, "staged", False),
+        optimize=getattr(args, "optimize", False),
+        dedup=getattr(args, "dedup", False),
+        snapshot_path=getattr(args, "snapshot_path", None),
+        full_export=getattr(args, "full_export", False),
+    )
+    print(f"\n⏱️  {', '.join(stages)} finished in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
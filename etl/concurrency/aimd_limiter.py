@@ -0,0 +1,130 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from utils.metrics import metrics
+
+OVERLOAD_STATUSES = {429, 500, 502, 503, 504}
+
+
+def is_overload(exc: BaseException) -> bool:
+    """429/5xx responses, timeouts and dropped connections mean the upstream wants less traffic"""
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in OVERLOAD_STATUSES
+    return isinstance(exc, (requests.Timeout, requests.ConnectionError))
+
+
+class AIMDLimiter:
+    """Concurrency limit that grows additively while a stage is healthy and shrinks multiplicatively on overload"""
+
+    def __init__(
+            self,
+            name: str,
+            initial: int,
+            max_limit: int,
+            min_limit: int = 1,
+            decrease_factor: float = 0.7,
+            latency_tolerance: float = 2.0,
+            cooldown: float = 1.0,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._last_decrease = 0.0
+
+        # Latency EWMA compared against a slowly re-baselining floor
+        self._latency_ewma = None
+        self._latency_floor = None
+
+        self.successes = 0
+        self.overloads = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+
+            if overloaded:
+                self.overloads += 1
+                self._decrease(now)
+            else:
+                self.successes += 1
+                self._observe_latency(latency)
+                if self._latency_ewma > self._latency_floor * self.latency_tolerance:
+                    self._decrease(now)
+                elif self._in_flight + 1 >= int(self._limit):
+                    # Only grow while the current limit is actually being used; +1 per full window of successes
+                    before = int(self._limit)
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+                    if int(self._limit) != before:
+                        metrics.set_gauge("concurrency_limit", int(self._limit), stage=self.name)
+
+            self._cond.notify(max(1, int(self._limit) - self._in_flight))
+
+    def _observe_latency(self, latency: float) -> None:
+        if self._latency_ewma is None:
+            self._latency_ewma = latency
+            self._latency_floor = latency
+            return
+        self._latency_ewma = 0.9 * self._latency_ewma + 0.1 * latency
+        # The floor follows the EWMA down immediately and drifts up slowly, so a permanently slower link re-baselines
+        if self._latency_ewma < self._latency_floor:
+            self._latency_floor = self._latency_ewma
+        else:
+            self._latency_floor += (self._latency_ewma - self._latency_floor) * 0.01
+
+    def _decrease(self, now: float) -> None:
+        # One cut per cooldown so a burst of failures from the same window doesn't collapse the limit
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+        self.decreases += 1
+        metrics.set_gauge("concurrency_limit", int(self._limit), stage=self.name)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(time.monotonic() - start, overloaded=is_overload(e))
+            raise
+        self.release(time.monotonic() - start)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "successes": self.successes,
+                "overloads": self.overloads,
+                "decreases": self.decreases,
+                "latency_ms": round((self._latency_ewma or 0) * 1000, 1),
+            }
+
+    def __str__(self) -> str:
+        s = self.stats()
+        return f"{s['name']}={s['limit']} ({s['in_flight']} busy, {s['latency_ms']}ms)"
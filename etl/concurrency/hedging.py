@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from utils.metrics import metrics
+
+
+class DeadlineExceeded(TimeoutError):
+    """The run deadline passed before this request could finish"""
+
+
+class RunDeadline:
+    """Wall-clock budget for a whole run; per-request timeouts shrink as it runs out"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self._expires_at: Optional[float] = None
+        self.exceeded = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the clock; later calls keep the original start"""
+        with self._lock:
+            if self.seconds and self._expires_at is None:
+                self._expires_at = time.monotonic() + self.seconds
+
+    def remaining(self) -> Optional[float]:
+        if self._expires_at is None:
+            return None
+        return self._expires_at - time.monotonic()
+
+    def check(self) -> None:
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            with self._lock:
+                self.exceeded += 1
+            metrics.inc("deadline_exceeded_total")
+            raise DeadlineExceeded(f"run deadline of {self.seconds}s passed")
+
+    def timeout(self, default: float) -> float:
+        """default, or whatever is left of the run if that is shorter"""
+        self.check()
+        remaining = self.remaining()
+        return default if remaining is None else max(0.001, min(default, remaining))
+
+
+class LatencyTracker:
+    """Sliding window of recent successful latencies with a percentile threshold"""
+
+    def __init__(self, window: int = 512, percentile: float = 0.95, min_samples: int = 20, min_delay: float = 0.02):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._cached: Optional[float] = None
+        self._since_sort = 0
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_sort += 1
+
+    def threshold(self) -> Optional[float]:
+        """Hedge delay, or None while there are too few samples to trust a percentile"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            # Re-sorting the window on every request would cost more than it is worth
+            if self._cached is None or self._since_sort >= 32:
+                ordered = sorted(self._samples)
+                self._cached = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+                self._since_sort = 0
+            return max(self.min_delay, self._cached)
+
+
+class HedgeBudget:
+    """Token bucket refilled by primary requests: at most `ratio` extra requests per primary, plus a small burst"""
+
+    def __init__(self, ratio: float = 0.05, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self.primaries = 0
+        self.hedges = 0
+        self.denied = 0
+
+    def on_primary(self) -> None:
+        with self._lock:
+            self.primaries += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.hedges += 1
+                return True
+            self.denied += 1
+            return False
+
+
+class HedgeAttempt:
+    """Handle given to each attempt so the loser's connection can be closed once the other wins"""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._response = None
+        self._lock = threading.Lock()
+
+    def bind(self, response) -> None:
+        with self._lock:
+            self._response = response
+            cancelled = self.cancelled.is_set()
+        if cancelled:
+            response.close()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        with self._lock:
+            response = self._response
+        if response is not None:
+            # Closing the socket makes a blocked read in the other thread fail right away
+            response.close()
+
+
+class Hedger:
+    """Runs an attempt; if it is still going after the recent p95, sends one duplicate and keeps the first success"""
+
+    def __init__(
+            self,
+            name: str,
+            budget: HedgeBudget,
+            deadline: Optional[RunDeadline] = None,
+            max_workers: int = 64,
+            tracker: Optional[LatencyTracker] = None,
+    ):
+        self.name = name
+        self.budget = budget
+        self.deadline = deadline or RunDeadline()
+        self.tracker = tracker or LatencyTracker()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hedge-{name}")
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.won = 0
+
+    def _timed(self, fn: Callable, attempt: HedgeAttempt):
+        start = time.perf_counter()
+        result = fn(attempt)
+        if not attempt.cancelled.is_set():
+            self.tracker.add(time.perf_counter() - start)
+        return result
+
+    def call(self, fn: Callable[[HedgeAttempt], object]):
+        self.deadline.check()
+        self.budget.on_primary()
+        primary = HedgeAttempt()
+        attempts = {self.pool.submit(self._timed, fn, primary): primary}
+
+        delay = self.tracker.threshold()
+        remaining = self.deadline.remaining()
+        first_wait = delay if remaining is None else (remaining if delay is None else min(delay, remaining))
+        done, _ = wait(list(attempts), timeout=first_wait)
+        if not done and delay is not None and self.budget.try_spend():
+            hedge = HedgeAttempt()
+            attempts[self.pool.submit(self._timed, fn, hedge)] = hedge
+            with self._lock:
+                self.sent += 1
+            metrics.inc("hedges_total", kind=self.name)
+
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=self.deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                for attempt in attempts.values():
+                    attempt.cancel()
+                self.deadline.check()
+            for future in done:
+                if future.exception() is None:
+                    for other, attempt in attempts.items():
+                        if other is not future:
+                            attempt.cancel()
+                    if attempts[future] is not primary:
+                        with self._lock:
+                            self.won += 1
+                        metrics.inc("hedge_wins_total", kind=self.name)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hedges": self.sent, "won": self.won, "threshold_s": self.tracker.threshold()}
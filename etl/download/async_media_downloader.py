@@ -0,0 +1,254 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import aiohttp
+
+from etl.extract.json_projection import POKEMON_FIELDS, project
+from utils.helper import iter_media_urls
+from utils.tracing import enable_tracing_at_exit, tracer
+
+
+class AsyncMediaDownloader:
+    """Single event loop counterpart of FastThreadMediaDownloader"""
+
+    def __init__(
+            self,
+            limit=1325,
+            fetch_concurrency: int = 60,
+            download_concurrency: int = 250,
+            form_concurrency: int = 40,
+            chunk_size: int = 65536,
+            connection_limit: int = 400,
+            api_url: str = "https://pokeapi.co/api/v2",
+            download_dir: str = "downloads",
+    ):
+        self.limit = limit
+        self.api_url = api_url.rstrip("/")
+        self.fetch_concurrency = fetch_concurrency
+        self.download_concurrency = download_concurrency
+        self.form_concurrency = form_concurrency
+        self.chunk_size = chunk_size
+        self.connection_limit = connection_limit
+        self._seen_urls = set()
+        self.download_dir = download_dir
+        os.makedirs(self.download_dir, exist_ok=True)
+
+        # Statistics, only ever touched from the event loop thread
+        self.total_sprites = 0
+        self.total_forms_processed = 0
+        self.total_form_media = 0
+        self.failed_downloads = 0
+        self.pokemon_processed = 0
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._fetch_sem: Optional[asyncio.Semaphore] = None
+        self._download_sem: Optional[asyncio.Semaphore] = None
+        self._form_sem: Optional[asyncio.Semaphore] = None
+        self._timeout = aiohttp.ClientTimeout(total=10)
+
+    # -------- STEP 1: GET POKEMON LIST --------
+    async def get_pokemon_list(self) -> List[str]:
+        url = f"{self.api_url}/pokemon?limit={self.limit}"
+        async with self.session.get(url) as r:
+            data = await r.json()
+        return [p["url"] for p in data["results"]]
+
+    # -------- STEP 2: FETCH POKEMON DATA (SPRITES + FORMS) --------
+    async def fetch_pokemon_data(self, pokemon_url: str) -> tuple[str, Iterator[Tuple[str, str]], List[dict]]:
+        """Fetch both sprites and forms data for a Pokemon"""
+        async with self._fetch_sem:
+            with tracer.span("fetch", pokemon_url) as span:
+                async with self.session.get(pokemon_url) as r:
+                    r.raise_for_status()
+                    # Keep the raw bytes and build objects only for the fields we read, not the moves array
+                    body = await r.read()
+                data = project((body,), POKEMON_FIELDS)
+                name = data.get("name", "unknown")
+                span.item = name
+        sprites = data.get("sprites", {})
+        forms = data.get("forms", [])
+        return name, iter_media_urls(sprites), forms
+
+    def _claim_url(self, url: str) -> bool:
+        # No lock needed: the check and the add run without an await in between
+        if url in self._seen_urls:
+            return False
+        self._seen_urls.add(url)
+        return True
+
+    # -------- STEP 3: FETCH FORM MEDIA --------
+    async def fetch_form_media(self, form: dict, form_base_dir: str, pokemon_name: str) -> int:
+        """Fetch all media for a single form"""
+        form_url = form.get("url")
+        if not form_url:
+            return 0
+
+        try:
+            async with self._form_sem:
+                with tracer.span("form", pokemon_name, form=form.get("name")):
+                    async with self.session.get(form_url) as r:
+                        r.raise_for_status()
+                        form_data = await r.json()
+            form_name = form_data.get("name") or form.get("name") or "form"
+
+            form_dir = os.path.join(form_base_dir, form_name)
+            await asyncio.to_thread(os.makedirs, form_dir, exist_ok=True)
+
+            tasks = [
+                self.download_one(url, form_dir, sprite_key, f"{pokemon_name}_{form_name}")
+                for sprite_key, url in iter_media_urls(form_data)
+                if self._claim_url(url)
+            ]
+            results = await asyncio.gather(*tasks)
+            return sum(1 for result in results if result)
+
+        except Exception as e:
+            print(f"  ❌ Form failed: {form.get('name', 'unknown')} - {e}")
+            return 0
+
+    # -------- STEP 4: DOWNLOAD FILE --------
+    async def download_one(self, url: str, folder_path: str, sprite_key: str, pokemon_name: str) -> Optional[str]:
+        """Download a single media file and write it off the event loop"""
+        ext = os.path.splitext(url)[1] or ".png"
+        safe_key = sprite_key.replace("/", "_").replace("\\", "_")
+        filename = f"{safe_key}_{pokemon_name}{ext}"
+        full_path = os.path.join(folder_path, filename)
+
+        try:
+            if await asyncio.to_thread(os.path.exists, full_path):
+                return full_path
+
+            async with self._download_sem:
+                with tracer.span("download", pokemon_name, url=url):
+                    async with self.session.get(url) as r:
+                        r.raise_for_status()
+                        body = bytearray()
+                        async for chunk in r.content.iter_chunked(self.chunk_size):
+                            body.extend(chunk)
+
+            # Sprites are small, so one hop to the default executor per file is enough
+            with tracer.span("write", pokemon_name, bytes=len(body)):
+                await asyncio.to_thread(self._write_file, full_path, body)
+
+            return full_path
+
+        except Exception:
+            self.failed_downloads += 1
+            return None
+
+    @staticmethod
+    def _write_file(full_path: str, body: bytes) -> None:
+        with open(full_path, "wb") as f:
+            f.write(body)
+
+    async def _download_sprites(self, sprite_items: Iterable[Tuple[str, str]], sprite_dir: str, name: str) -> None:
+        tasks = [
+            self.download_one(url, sprite_dir, sprite_key, name)
+            for sprite_key, url in sprite_items
+            if self._claim_url(url)
+        ]
+        for result in await asyncio.gather(*tasks):
+            if result is not None:
+                self.total_sprites += 1
+
+    async def _download_forms(self, forms: List[dict], form_base_dir: str, name: str) -> None:
+        self.total_forms_processed += len(forms)
+        counts = await asyncio.gather(
+            *(self.fetch_form_media(form, form_base_dir, name) for form in forms)
+        )
+        self.total_form_media += sum(counts)
+
+    async def process_pokemon(self, pokemon_url: str, total: int) -> None:
+        try:
+            name, sprite_items, forms = await self.fetch_pokemon_data(pokemon_url)
+        except Exception as e:
+            print(f"❌ Pokemon fetch failed: {e}")
+            return
+
+        self.pokemon_processed += 1
+        if self.pokemon_processed % 10 == 0:
+            print(f"⏳ Processed {self.pokemon_processed}/{total} Pokemon...")
+
+        pokemon_dir = os.path.join(self.download_dir, name)
+        sprite_dir = os.path.join(pokemon_dir, "sprites")
+        form_base_dir = os.path.join(pokemon_dir, "forms")
+        await asyncio.to_thread(os.makedirs, sprite_dir, exist_ok=True)
+
+        await asyncio.gather(
+            self._download_sprites(sprite_items, sprite_dir, name),
+            self._download_forms(forms, form_base_dir, name),
+        )
+
+    # -------- MAIN RUN --------
+    async def run_async(self):
+        print("=" * 70)
+        print("🎮 POKEMON MEDIA DOWNLOADER (async)")
+        print("=" * 70)
+        print(f"📊 Target: {self.limit} Pokemon")
+        print(f"⚙️  Concurrency: fetch={self.fetch_concurrency}, download={self.download_concurrency}, forms={self.form_concurrency}")
+        print(f"📁 Output: {os.path.abspath(self.download_dir)}")
+        print("=" * 70)
+        print()
+
+        start_time = datetime.now()
+
+        self._fetch_sem = asyncio.Semaphore(self.fetch_concurrency)
+        self._download_sem = asyncio.Semaphore(self.download_concurrency)
+        self._form_sem = asyncio.Semaphore(self.form_concurrency)
+
+        connector = aiohttp.TCPConnector(limit=self.connection_limit)
+        async with aiohttp.ClientSession(
+                connector=connector,
+                timeout=self._timeout,
+                headers={"User-Agent": "Pokemon-ETL/1.0"},
+        ) as session:
+            self.session = session
+            with tracer.span("download run", mode="async"):
+                pokemon_urls = await self.get_pokemon_list()
+                await asyncio.gather(
+                    *(self.process_pokemon(url, len(pokemon_urls)) for url in pokemon_urls)
+                )
+        self.session = None
+
+        # Calculate statistics
+        duration = datetime.now() - start_time
+        total_files = self.total_sprites + self.total_form_media
+        speed = total_files / duration.total_seconds() if duration.total_seconds() > 0 else 0
+
+        # Print final statistics
+        print("\n" + "=" * 70)
+        print("📊 FINAL STATISTICS")
+        print("=" * 70)
+        print(f"✅ Pokemon Processed:            {self.pokemon_processed:,}")
+        print(f"✅ Total Sprites Downloaded:     {self.total_sprites:,}")
+        print(f"✅ Total Forms Processed:        {self.total_forms_processed:,}")
+        print(f"✅ Total Form Media Downloaded:  {self.total_form_media:,}")
+        print(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+        print(f"📁 TOTAL FILES DOWNLOADED:       {total_files:,}")
+        print(f"❌ Failed Downloads:             {self.failed_downloads:,}")
+        print(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+        print(f"⏱️  Total Time:                   {duration}")
+        print(f"⚡ Download Speed:                {speed:.1f} files/second")
+        print(f"📂 Output Directory:             {os.path.abspath(self.download_dir)}")
+        print("=" * 70)
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+
+if __name__ == "__main__":
+    print(f"⏰ Start: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    enable_tracing_at_exit()
+
+    downloader = AsyncMediaDownloader(
+        limit=135,  # Number of Pokemon to download
+        fetch_concurrency=60,  # Concurrent Pokemon fetches
+        download_concurrency=250,  # Concurrent file downloads
+        form_concurrency=40,  # Concurrent form fetches
+    )
+
+    downloader.run()
+
+    print(f"\n⏰ End: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -1,11 +1,32 @@
+import argparse
+import hashlib
+import io
+import mimetypes
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import nullcontext
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, Collection, Dict, Iterator, List, Optional, Tuple
 import threading
 
-import requests
-from requests.adapters import HTTPAdapter
+from etl.concurrency.aimd_limiter import AIMDLimiter
+from etl.concurrency.hedging import HedgeAttempt, HedgeBudget, Hedger, LatencyTracker, RunDeadline
+from etl.extract.json_projection import POKEMON_FIELDS, project
+from etl.extract.response_cache import ResponseCache, get_shared_cache
+from etl.manifest.manifest_store import DONE, FAILED, ManifestStore
+from etl.pack.pack_file import PackEntry, PackSet
+from etl.pipeline import Pipeline, Stage
+from etl.pokemon.pokemon_batch import PokemonBatch
+from etl.transform.image_optimizer import ImageOptimizer, split_variants
+from etl.transport.http_transport import new_session, transport_stats
+from utils.helper import HashingReader, iter_media_urls
+from utils.metrics import enable_snapshot_at_exit, metrics, start_metrics_server
+from utils.settings import HEDGE_BUDGET_RATIO, HEDGE_PERCENTILE, RUN_DEADLINE_SECONDS
+from utils.tracing import enable_tracing_at_exit, tracer
+
+if TYPE_CHECKING:
+    # google-cloud-storage costs ~100ms to import; local and pack runs never need it
+    from etl.upload.media_uploader import MediaUploader
 
 
 class FastThreadMediaDownloader:
@@ -16,16 +37,65 @@ class FastThreadMediaDownloader:
             download_workers: int = 250,
             form_workers: int = 40,
             chunk_size: int = 65536,
+            cache: Optional[ResponseCache] = None,
+            use_cache: bool = True,
+            uploader: Optional["MediaUploader"] = None,
+            manifest: Optional[ManifestStore] = None,
+            since: Optional[int] = None,
+            adaptive: bool = True,
+            api_url: str = "https://pokeapi.co/api/v2",
+            packs: Optional[PackSet] = None,
+            hedge: bool = True,
+            deadline_seconds: Optional[float] = RUN_DEADLINE_SECONDS or None,
+            optimizer: Optional[ImageOptimizer] = None,
+            download_dir: str = "downloads",
     ):
         self.limit = limit
+        self.api_url = api_url.rstrip("/")
         self.fetch_workers = fetch_workers
         self.download_workers = download_workers
         self.form_workers = form_workers
         self.chunk_size = chunk_size
         self._seen_urls = set()
         self._url_lock = threading.Lock()
-        self.download_dir = "downloads"
-        os.makedirs(self.download_dir, exist_ok=True)
+        self.download_dir = download_dir
+        self.cache = (cache or get_shared_cache()) if use_cache else None
+        # With an uploader, media is streamed from the HTTP response into GCS and never hits the disk.
+        # With packs, media is appended to a few pack files; an uploader then pushes whole packs at the end.
+        self.uploader = uploader
+        self.packs = packs
+        self.streaming = uploader is not None and packs is None
+        self.writes_files = uploader is None and packs is None
+        # Optional lossless recompression (+ thumbnail/WebP variants) between download and write/pack/upload
+        self.optimizer = optimizer
+        if self.writes_files:
+            os.makedirs(self.download_dir, exist_ok=True)
+
+        # Persistent record of finished work; reruns skip anything marked done
+        self.manifest = manifest
+        self.since = since
+        self._pending = {}
+        self._db_rows = False
+
+        # Worker counts are ceilings; with adaptive=True each stage starts low and AIMD finds the working level
+        self.fetch_limiter = self.download_limiter = self.form_limiter = None
+        if adaptive:
+            self.fetch_limiter = AIMDLimiter("fetch", initial=min(8, fetch_workers), max_limit=fetch_workers)
+            self.download_limiter = AIMDLimiter("download", initial=min(32, download_workers), max_limit=download_workers)
+            self.form_limiter = AIMDLimiter("forms", initial=min(8, form_workers), max_limit=form_workers)
+
+        # The deadline starts with the run; every request timeout is capped by what is left of it.
+        # Hedging sends one duplicate of a request that outlives the recent p95; both kinds share one budget.
+        self.deadline = RunDeadline(deadline_seconds)
+        self.json_hedger = self.media_hedger = None
+        if hedge:
+            budget = HedgeBudget(HEDGE_BUDGET_RATIO)
+            self.json_hedger = Hedger(
+                "json", budget, self.deadline, (fetch_workers + form_workers) * 2, LatencyTracker(percentile=HEDGE_PERCENTILE)
+            )
+            self.media_hedger = Hedger(
+                "media", budget, self.deadline, download_workers * 2, LatencyTracker(percentile=HEDGE_PERCENTILE)
+            )
 
         # Statistics with thread-safe counters
         self._stats_lock = threading.Lock()
@@ -33,129 +103,334 @@ class FastThreadMediaDownloader:
         self.total_forms_processed = 0
         self.total_form_media = 0
         self.failed_downloads = 0
+        self.failed_forms = 0
         self.pokemon_processed = 0
 
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": "Pokemon-ETL/1.0"})
+        # Per-host rate limits, connection caps and Retry-After aware retries are shared process-wide
+        self.session = new_session()
 
-        adapter = HTTPAdapter(
-            pool_connections=400,
-            pool_maxsize=400,
-            max_retries=3,
-            pool_block=True,
-        )
-        self.session.mount("https://", adapter)
-        self.session.mount("http://", adapter)
+    @staticmethod
+    def _slot(limiter: Optional[AIMDLimiter]):
+        return limiter.slot() if limiter else nullcontext()
+
+    def get_json(
+            self,
+            url: str,
+            limiter: Optional[AIMDLimiter] = None,
+            fields: Optional[Collection[str]] = None,
+            hedger: Optional[Hedger] = None,
+    ) -> dict:
+        """GET a PokeAPI JSON document, through the response cache when enabled; fields limits what is parsed"""
+        # A hedge shares the limiter slot of its primary, so hedging never raises the concurrency ceiling
+        with self._slot(limiter):
+            if hedger:
+                return hedger.call(lambda attempt: self._get_json_once(url, fields, attempt))
+            return self._get_json_once(url, fields)
+
+    def _get_json_once(self, url: str, fields: Optional[Collection[str]], attempt: Optional[HedgeAttempt] = None) -> dict:
+        timeout = self.deadline.timeout(10)
+        if self.cache:
+            return self.cache.get_json(self.session, url, timeout=timeout, fields=fields, attempt=attempt)
+        with self.session.get(url, timeout=timeout, stream=fields is not None or attempt is not None) as r:
+            if attempt:
+                attempt.bind(r)
+            r.raise_for_status()
+            if fields is None:
+                return r.json()
+            return project(r.iter_content(self.chunk_size), fields)
+
+    def fetch_media(self, url: str) -> bytes:
+        """GET a media body, hedged when enabled"""
+        if self.media_hedger:
+            return self.media_hedger.call(lambda attempt: self._fetch_media_once(url, attempt))
+        return self._fetch_media_once(url)
+
+    def _fetch_media_once(self, url: str, attempt: Optional[HedgeAttempt] = None) -> bytes:
+        with self.session.get(url, stream=True, timeout=self.deadline.timeout(10)) as r:
+            if attempt:
+                attempt.bind(r)
+            r.raise_for_status()
+            return r.content
 
     # -------- STEP 1: GET POKEMON LIST --------
     def get_pokemon_list(self) -> List[str]:
-        url = f"https://pokeapi.co/api/v2/pokemon?limit={self.limit}"
-        data = self.session.get(url, timeout=10).json()
-        return [p["url"] for p in data["results"]]
+        url = f"{self.api_url}/pokemon?limit={self.limit}"
+        data = self.get_json(url)
+        urls = [p["url"] for p in data["results"]]
+        if self.since is not None:
+            urls = [u for u in urls if self.pokemon_id(u) > self.since]
+        if self.manifest:
+            completed = self.manifest.completed_pokemon_urls()
+            urls = [u for u in urls if u not in completed]
+        return urls
+
+    @staticmethod
+    def pokemon_id(pokemon_url: str) -> int:
+        return int(pokemon_url.rstrip("/").split("/")[-1])
 
     # -------- STEP 2: FETCH POKEMON DATA (SPRITES + FORMS) --------
-    def fetch_pokemon_data(self, pokemon_url: str) -> tuple[str, List[Tuple[str, str]], List[dict]]:
+    def fetch_pokemon_data(self, pokemon_url: str) -> tuple[str, Iterator[Tuple[str, str]], List[dict]]:
         """Fetch both sprites and forms data for a Pokemon"""
-        data = self.session.get(pokemon_url, timeout=10).json()
+        with metrics.timer("stage_seconds", stage="fetch"), tracer.span("fetch", pokemon_url) as span:
+            # Only the fields the pipeline reads are materialized; the moves array is skipped while parsing
+            data = self.get_json(pokemon_url, self.fetch_limiter, fields=POKEMON_FIELDS, hedger=self.json_hedger)
+            span.item = data.get("name")
         sprites = data.get("sprites", {})
         forms = data.get("forms", [])
         name = data.get("name", "unknown")
-        return name, self.extract_urls(sprites), forms
-
-    def extract_urls(self, data, prefix: str = "") -> List[Tuple[str, str]]:
-        """Recursively extract all image URLs from nested data"""
-        urls: List[Tuple[str, str]] = []
-        if isinstance(data, dict):
-            for key, value in data.items():
-                next_prefix = f"{prefix}_{key}" if prefix else key
-                urls.extend(self.extract_urls(value, next_prefix))
-        elif isinstance(data, str) and data.startswith("http"):
-            urls.append((prefix or "sprite", data))
-        return urls
+        return name, iter_media_urls(sprites), forms
 
     # -------- STEP 3: FETCH FORM MEDIA --------
-    def fetch_form_media(self, form: dict, form_base_dir: str, pokemon_name: str) -> int:
-        """Fetch all media for a single form"""
+    def form_media(self, form: dict, form_base_dir: str, pokemon_name: str) -> List[Tuple[str, str, str, str]]:
+        """Fetch a form and return download_one arguments (url, folder, key, file name) for its unseen media"""
         form_url = form.get("url")
         if not form_url:
-            return 0
+            return []
 
-        try:
-            # Fetch form data
-            form_data = self.session.get(form_url, timeout=10).json()
-            form_name = form_data.get("name") or form.get("name") or "form"
+        with metrics.timer("stage_seconds", stage="form"), tracer.span("form", pokemon_name, form=form.get("name")):
+            form_data = self.get_json(form_url, self.form_limiter, hedger=self.json_hedger)
+        form_name = form_data.get("name") or form.get("name") or "form"
+        if self.manifest:
+            self.manifest.record_form(form_url, pokemon_name, form_name, DONE)
 
-            # Create form directory
-            form_dir = os.path.join(form_base_dir, form_name)
+        # Create form directory
+        form_dir = os.path.join(form_base_dir, form_name)
+        if self.writes_files:
             os.makedirs(form_dir, exist_ok=True)
 
-            # Extract all media URLs from form data
-            form_media_urls = self.extract_urls(form_data)
+        return [
+            (url, form_dir, sprite_key, f"{pokemon_name}_{form_name}")
+            for sprite_key, url in iter_media_urls(form_data)
+            if self._claim_url(url)
+        ]
 
-            # Download each media file
+    def _form_failed(self, form: dict, pokemon_name: str, error: Exception) -> None:
+        print(f"  ❌ Form failed: {form.get('name', 'unknown')} - {error}")
+        with self._stats_lock:
+            self.failed_forms += 1
+        self._note_failure(pokemon_name)
+        if self.manifest and form.get("url"):
+            self.manifest.record_form(form["url"], pokemon_name, form.get("name"), FAILED)
+
+    def fetch_form_media(self, form: dict, form_base_dir: str, pokemon_name: str) -> int:
+        """Fetch all media for a single form"""
+        try:
             downloaded = 0
-            for sprite_key, url in form_media_urls:
-                with self._url_lock:
-                    if url in self._seen_urls:
-                        continue
-                    self._seen_urls.add(url)
-
-                result = self.download_one(url, form_dir, sprite_key, f"{pokemon_name}_{form_name}")
-                if result:
+            for args in self.form_media(form, form_base_dir, pokemon_name):
+                if self.download_one(*args, owner=pokemon_name):
                     downloaded += 1
-
             return downloaded
 
         except Exception as e:
-            print(f"  ❌ Form failed: {form.get('name', 'unknown')} - {e}")
+            self._form_failed(form, pokemon_name, e)
             return 0
 
+    def _claim_url(self, url: str) -> bool:
+        """True for the first caller with this url; media shared between pokemon is downloaded once"""
+        with self._url_lock:
+            if url in self._seen_urls:
+                return False
+            self._seen_urls.add(url)
+            return True
+
+    def _release_url(self, url: str) -> None:
+        """Forget a claim whose download failed, so a later attempt (e.g. a retried batch) can fetch it again"""
+        with self._url_lock:
+            self._seen_urls.discard(url)
+
     # -------- STEP 4: DOWNLOAD FILE --------
-    def download_one(self, url: str, folder_path: str, sprite_key: str, pokemon_name: str) -> Optional[str]:
+    def _transform(self, full_path: str, body: bytes, owner: str) -> Tuple[Tuple[str, bytes], ...]:
+        """(path, bytes) for the file and any variants; just the file unless an optimizer is set"""
+        if not self.optimizer:
+            return ((full_path, body),)
+        with metrics.timer("stage_seconds", stage="optimize"), tracer.span("optimize", owner):
+            return split_variants(full_path, self.optimizer.optimize(body))
+
+    def download_one(
+            self,
+            url: str,
+            folder_path: str,
+            sprite_key: str,
+            pokemon_name: str,
+            owner: Optional[str] = None,
+    ) -> Optional[str]:
         """Download a single media file"""
+        owner = owner or pokemon_name
         try:
             ext = os.path.splitext(url)[1] or ".png"
             safe_key = sprite_key.replace("/", "_").replace("\\", "_")
             filename = f"{safe_key}_{pokemon_name}{ext}"
             full_path = os.path.join(folder_path, filename)
 
+            if self.packs:
+                with metrics.timer("stage_seconds", stage="download"):
+                    return self.pack_one(url, full_path, owner)
+
+            if self.streaming:
+                with metrics.timer("stage_seconds", stage="stream"):
+                    return self.stream_one(url, full_path, owner)
+
             # Skip if already exists
             if os.path.exists(full_path):
+                if self.manifest:
+                    self.manifest.record_media(url, owner, DONE, path=full_path, size=os.path.getsize(full_path))
                 return full_path
 
-            # Download file
-            r = self.session.get(url, stream=True, timeout=10)
-            r.raise_for_status()
-
-            with open(full_path, "wb") as f:
-                for chunk in r.iter_content(self.chunk_size):
-                    if chunk:
-                        f.write(chunk)
-
+            # Download file; the body is read whole so a hedged duplicate can't interleave writes to the file
+            with self._slot(self.download_limiter), metrics.timer("stage_seconds", stage="download"), \
+                    tracer.span("download", owner, url=url):
+                body = self.fetch_media(url)
+            metrics.inc("media_bytes_in_total", len(body))
+            outputs = self._transform(full_path, body, owner)
+            with tracer.span("write", owner, bytes=sum(len(data) for _, data in outputs)):
+                for path, data in outputs:
+                    with open(path, "wb") as f:
+                        f.write(data)
+
+            if self.manifest:
+                stored = outputs[0][1]
+                self.manifest.record_media(
+                    url, owner, DONE, path=full_path, size=len(stored), checksum=hashlib.sha256(stored).hexdigest()
+                )
             return full_path
 
         except Exception as e:
             with self._stats_lock:
                 self.failed_downloads += 1
+            self._release_url(url)
+            metrics.inc("media_failures_total", error=type(e).__name__)
+            self._note_failure(owner)
+            if self.manifest:
+                self.manifest.record_media(url, owner, FAILED)
             return None
 
-    # -------- MAIN RUN --------
-    def run(self):
-        print("=" * 70)
-        print("🎮 POKEMON MEDIA DOWNLOADER")
-        print("=" * 70)
-        print(f"📊 Target: {self.limit} Pokemon")
-        print(f"⚙️  Workers: fetch={self.fetch_workers}, download={self.download_workers}, forms={self.form_workers}")
-        print(f"📁 Output: {os.path.abspath(self.download_dir)}")
-        print("=" * 70)
-        print()
-
-        start_time = datetime.now()
-        pokemon_urls = self.get_pokemon_list()
-
-        with ThreadPoolExecutor(max_workers=self.fetch_workers) as fetch_pool, \
-                ThreadPoolExecutor(max_workers=self.download_workers) as download_pool, \
-                ThreadPoolExecutor(max_workers=self.form_workers) as form_pool:
+    def pack_one(self, url: str, full_path: str, owner: str) -> str:
+        """Append a media body to its shard's pack under its downloads/-relative name"""
+        name = os.path.relpath(full_path, self.download_dir).replace(os.sep, "/")
+        existing = self.packs.entry(owner, name)
+        if existing is not None:
+            # Packed by a run that stopped before its manifest write; record it now so it isn't pending forever
+            self._record_packed(url, owner, existing)
+            return name
+        with self._slot(self.download_limiter), tracer.span("download", owner, url=url):
+            body = self.fetch_media(url)
+        metrics.inc("media_bytes_in_total", len(body))
+        outputs = self._transform(full_path, body, owner)
+        with tracer.span("write", owner, pack=True):
+            entry = self.packs.add(owner, name, outputs[0][1])
+            for path, data in outputs[1:]:
+                self.packs.add(owner, os.path.relpath(path, self.download_dir).replace(os.sep, "/"), data)
+        self._record_packed(url, owner, entry)
+        return name
+
+    def _record_packed(self, url: str, owner: str, entry: PackEntry) -> None:
+        if self.manifest:
+            pack_path = self.packs.pack_path(self.packs.shard_of(owner))
+            self.manifest.record_media(
+                url, owner, DONE, path=f"{pack_path}#{entry.name}", size=entry.length, checksum=entry.sha256
+            )
+
+    def stream_one(self, url: str, full_path: str, owner: str) -> str:
+        """Pipe a media response body into GCS, mirroring the downloads/ layout under pokemon/"""
+        if self.optimizer:
+            return self._upload_optimized(url, full_path, owner)
+        rel_path = os.path.relpath(full_path, self.download_dir).replace(os.sep, "/")
+        blob_path = f"pokemon/{rel_path}"
+        # Not hedged: the body goes straight into an upload, which a second attempt can't share
+        timeout = self.deadline.timeout(10)
+        with self._slot(self.download_limiter), tracer.span("stream", owner, url=url), \
+                self.session.get(url, stream=True, timeout=timeout) as r:
+            r.raise_for_status()
+            r.raw.decode_content = True
+            # Content-Length is only the body size when the transfer is not content-encoded
+            size = None
+            if "Content-Encoding" not in r.headers and r.headers.get("Content-Length"):
+                size = int(r.headers["Content-Length"])
+            reader = HashingReader(r.raw)
+            # With dedup the object lands at media/<sha256>, so the manifest records the path actually written
+            stored_path, public_url = self.uploader.upload_stream(
+                reader,
+                blob_path,
+                size=size,
+                content_type=r.headers.get("Content-Type"),
+                pokemon_name=owner,
+            )
+        metrics.inc("media_bytes_in_total", reader.size)
+        if self.manifest:
+            self.manifest.record_media(
+                url, owner, DONE, size=reader.size, checksum=reader.hexdigest(), gcs_path=stored_path
+            )
+        return public_url
+
+    def _upload_optimized(self, url: str, full_path: str, owner: str) -> str:
+        """Optimizing needs the whole body, so this buffers it instead of piping the response into GCS"""
+        with self._slot(self.download_limiter), tracer.span("download", owner, url=url):
+            body = self.fetch_media(url)
+        metrics.inc("media_bytes_in_total", len(body))
+        outputs = self._transform(full_path, body, owner)
+        uploaded = []
+        with tracer.span("upload", owner, files=len(outputs)):
+            for path, data in outputs:
+                blob_path = "pokemon/" + os.path.relpath(path, self.download_dir).replace(os.sep, "/")
+                uploaded.append(self.uploader.upload_stream(
+                    io.BytesIO(data), blob_path, size=len(data), content_type=mimetypes.guess_type(path)[0],
+                    pokemon_name=owner,
+                ))
+        stored_path, public_url = uploaded[0]
+        if self.manifest:
+            stored = outputs[0][1]
+            self.manifest.record_media(
+                url, owner, DONE, size=len(stored), checksum=hashlib.sha256(stored).hexdigest(), gcs_path=stored_path
+            )
+        return public_url
+
+    # -------- MANIFEST BOOKKEEPING --------
+    def _start_pokemon(self, name: str, pokemon_url: str) -> None:
+        # One extra token held by the scheduler so the pokemon can't finish while tasks are still being submitted
+        with self._stats_lock:
+            self._pending[name] = [1, False, pokemon_url]
+
+    def _hold(self, name: str) -> None:
+        with self._stats_lock:
+            self._pending[name][0] += 1
+
+    def _add_task(self, name: str, future) -> None:
+        self._hold(name)
+        future.add_done_callback(lambda _f: self._finish_task(name))
+
+    def _note_failure(self, name: str) -> None:
+        with self._stats_lock:
+            if name in self._pending:
+                self._pending[name][1] = True
+
+    def _finish_task(self, name: str) -> None:
+        with self._stats_lock:
+            entry = self._pending[name]
+            entry[0] -= 1
+            if entry[0]:
+                return
+            del self._pending[name]
+        _, failed, pokemon_url = entry
+        if self.manifest:
+            self.manifest.record_pokemon(self.pokemon_id(pokemon_url), name, pokemon_url, FAILED if failed else DONE)
+
+    # -------- CONCURRENCY --------
+    def max_in_flight(self) -> int:
+        """Queued + running downloads allowed before the scheduler waits; follows the live download limit"""
+        limit = self.download_limiter.limit if self.download_limiter else self.download_workers
+        return limit * 4
+
+    def limits_summary(self) -> str:
+        limiters = [self.fetch_limiter, self.download_limiter, self.form_limiter]
+        return " ".join(str(limiter) for limiter in limiters if limiter)
+
+    def process(self, pokemon_urls: List[str]) -> int:
+        """Fetch and download everything for the given pokemon URLs; returns how many pokemon failed to fetch"""
+        self.deadline.start()
+        fetch_failures = 0
+        with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="fetch") as fetch_pool, \
+                ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="download") as download_pool, \
+                ThreadPoolExecutor(max_workers=self.form_workers, thread_name_prefix="forms") as form_pool:
 
             # Submit all Pokemon fetch tasks
             fetch_futures = {
@@ -165,40 +440,41 @@ class FastThreadMediaDownloader:
 
             download_futures = []
             form_futures = []
-            max_in_flight = self.download_workers * 4
 
             # Process Pokemon as they complete
             for fetch_future in as_completed(fetch_futures):
+                name = None
                 try:
                     name, sprite_items, forms = fetch_future.result()
+                    self._start_pokemon(name, fetch_futures[fetch_future])
 
                     with self._stats_lock:
                         self.pokemon_processed += 1
                         current = self.pokemon_processed
+                    metrics.inc("pokemon_processed_total")
 
                     # Print progress every 10 Pokemon
                     if current % 10 == 0:
-                        print(f"⏳ Processed {current}/{len(pokemon_urls)} Pokemon...")
+                        print(f"⏳ Processed {current}/{len(pokemon_urls)} Pokemon... {self.limits_summary()}")
 
                     # Create directory structure
                     pokemon_dir = os.path.join(self.download_dir, name)
                     sprite_dir = os.path.join(pokemon_dir, "sprites")
                     form_base_dir = os.path.join(pokemon_dir, "forms")
-                    os.makedirs(sprite_dir, exist_ok=True)
+                    if self.writes_files:
+                        os.makedirs(sprite_dir, exist_ok=True)
 
                     # Submit sprite downloads
                     for sprite_key, url in sprite_items:
-                        with self._url_lock:
-                            if url in self._seen_urls:
-                                continue
-                            self._seen_urls.add(url)
+                        if not self._claim_url(url):
+                            continue
 
-                        download_futures.append(
-                            download_pool.submit(self.download_one, url, sprite_dir, sprite_key, name)
-                        )
+                        future = download_pool.submit(self.download_one, url, sprite_dir, sprite_key, name)
+                        self._add_task(name, future)
+                        download_futures.append(future)
 
                         # Throttle in-flight downloads
-                        if len(download_futures) >= max_in_flight:
+                        if len(download_futures) >= self.max_in_flight():
                             done, download_futures = wait(download_futures, return_when=FIRST_COMPLETED)
                             download_futures = list(download_futures)
 
@@ -207,6 +483,10 @@ class FastThreadMediaDownloader:
                                 if f.result() is not None:
                                     with self._stats_lock:
                                         self.total_sprites += 1
+                                    metrics.inc("media_files_total", kind="sprite")
+                        metrics.set_gauge("queue_depth", len(download_futures), stage="download")
+
+                    metrics.set_gauge("queue_depth", len(form_futures), stage="form")
 
                     # Submit form fetch tasks
                     if forms:
@@ -214,12 +494,23 @@ class FastThreadMediaDownloader:
                             self.total_forms_processed += len(forms)
 
                         for form in forms:
-                            form_futures.append(
-                                form_pool.submit(self.fetch_form_media, form, form_base_dir, name)
-                            )
+                            future = form_pool.submit(self.fetch_form_media, form, form_base_dir, name)
+                            self._add_task(name, future)
+                            form_futures.append(future)
 
                 except Exception as e:
                     print(f"❌ Pokemon fetch failed: {e}")
+                    metrics.inc("pokemon_failures_total")
+                    fetch_failures += 1
+                    if name is not None:
+                        self._note_failure(name)
+                    if self.manifest:
+                        pokemon_url = fetch_futures[fetch_future]
+                        self.manifest.record_pokemon(self.pokemon_id(pokemon_url), None, pokemon_url, FAILED)
+                finally:
+                    # Release the scheduler's token even when submitting failed part-way
+                    if name is not None:
+                        self._finish_task(name)
 
             # Wait for remaining sprite downloads
             print("\n⏳ Finishing sprite downloads...")
@@ -227,6 +518,7 @@ class FastThreadMediaDownloader:
                 if future.result() is not None:
                     with self._stats_lock:
                         self.total_sprites += 1
+                    metrics.inc("media_files_total", kind="sprite")
 
             # Wait for all form downloads and count results
             print("⏳ Finishing form downloads...")
@@ -235,9 +527,176 @@ class FastThreadMediaDownloader:
                     count = future.result()
                     with self._stats_lock:
                         self.total_form_media += count
+                    metrics.inc("media_files_total", count, kind="form")
                 except Exception as e:
                     print(f"❌ Form download error: {e}")
 
+        metrics.set_gauge("queue_depth", 0, stage="download")
+        metrics.set_gauge("queue_depth", 0, stage="form")
+        return fetch_failures
+
+    # -------- STAGED RUN (bounded queues end to end) --------
+    def _detail_stage(self, pokemon_url: str):
+        """pokemon url -> pokemon document (for the db stage), sprite downloads and form fetches"""
+        try:
+            with metrics.timer("stage_seconds", stage="fetch"), tracer.span("fetch", pokemon_url) as span:
+                data = self.get_json(pokemon_url, self.fetch_limiter, fields=POKEMON_FIELDS, hedger=self.json_hedger)
+                span.item = data.get("name")
+        except Exception as e:
+            print(f"❌ Pokemon fetch failed: {e}")
+            metrics.inc("pokemon_failures_total")
+            if self.manifest:
+                self.manifest.record_pokemon(self.pokemon_id(pokemon_url), None, pokemon_url, FAILED)
+            return
+        name = data.get("name", "unknown")
+        forms = data.get("forms", [])
+        with self._stats_lock:
+            self.pokemon_processed += 1
+            self.total_forms_processed += len(forms)
+            current = self.pokemon_processed
+        metrics.inc("pokemon_processed_total")
+        if current % 10 == 0:
+            print(f"⏳ Processed {current}/{self.limit} Pokemon... {self.limits_summary()}")
+
+        pokemon_dir = os.path.join(self.download_dir, name)
+        sprite_dir = os.path.join(pokemon_dir, "sprites")
+        if self.writes_files:
+            os.makedirs(sprite_dir, exist_ok=True)
+        # Started only once nothing before the try can raise, so its token is always finished
+        self._start_pokemon(name, pokemon_url)
+        try:
+            if self._db_rows:
+                yield "pokemon", data
+            for sprite_key, url in iter_media_urls(data.get("sprites", {})):
+                if self._claim_url(url):
+                    self._hold(name)
+                    yield "media", (url, sprite_dir, sprite_key, name), name, "sprite"
+            for form in forms:
+                self._hold(name)
+                yield "form", form, os.path.join(pokemon_dir, "forms"), name
+        finally:
+            self._finish_task(name)
+
+    def _form_stage(self, item):
+        """form -> its media downloads; everything else passes through"""
+        if item[0] != "form":
+            yield item
+            return
+        _, form, form_base_dir, name = item
+        try:
+            for args in self.form_media(form, form_base_dir, name):
+                self._hold(name)
+                yield "media", args, name, "form"
+        except Exception as e:
+            self._form_failed(form, name, e)
+        finally:
+            self._finish_task(name)
+
+    def _media_stage(self, item):
+        """download (or stream to GCS) one file; emits a poke_media row when the db stage wants one"""
+        if item[0] != "media":
+            yield item
+            return
+        _, args, owner, kind = item
+        try:
+            result = self.download_one(*args, owner=owner)
+        finally:
+            self._finish_task(owner)
+        if result is None:
+            return
+        with self._stats_lock:
+            if kind == "sprite":
+                self.total_sprites += 1
+            else:
+                self.total_form_media += 1
+        metrics.inc("media_files_total", kind=kind)
+        if self._db_rows and self.streaming:
+            yield "media_row", (owner, result, None)
+
+    def _db_stage(self, loader, batch_size: int):
+        """Returns (handler, on_close) that load pokemon and media rows in fixed-size batches"""
+        state = {"batch": PokemonBatch(), "media": []}
+        lock = threading.Lock()
+        # A dedup content store records poke_media (with hashes) itself
+        record_media = not (self.uploader and self.uploader.content_store and self.uploader.content_store.loader)
+
+        def flush(force: bool = False):
+            with lock:
+                batch, media = state["batch"], state["media"]
+                if not force and len(batch) < batch_size and len(media) < batch_size:
+                    return
+                state["batch"], state["media"] = PokemonBatch(), []
+            with tracer.span("db flush", pokemon=len(batch), media=len(media)):
+                if len(batch):
+                    loader.load_batch(batch)
+                if media:
+                    loader.load("poke_media", media)
+
+        def handler(item):
+            if item[0] == "pokemon":
+                state["batch"].append(item[1])
+            elif item[0] == "media_row" and record_media:
+                with lock:
+                    state["media"].append(item[1])
+            flush()
+
+        return handler, lambda: flush(force=True)
+
+    def run_staged(self, loader=None, queue_size: int = 256, db_batch_size: int = 500) -> Dict[str, dict]:
+        """list -> detail -> forms -> media (+ upload when streaming) -> db, joined by bounded queues"""
+        self._print_banner(" (staged)")
+        start_time = datetime.now()
+        self.deadline.start()
+        if self.manifest:
+            self._seen_urls.update(self.manifest.completed_media_urls())
+
+        self._db_rows = loader is not None
+        stages = [
+            Stage("detail", self._detail_stage, self.fetch_workers, queue_size),
+            Stage("forms", self._form_stage, self.form_workers, queue_size),
+            Stage("media", self._media_stage, self.download_workers, queue_size),
+        ]
+        if loader is not None:
+            handler, on_close = self._db_stage(loader, db_batch_size)
+            stages.append(Stage("db", handler, 1, queue_size, on_close=on_close))
+
+        pipeline = Pipeline(stages)
+        with tracer.span("download run", mode="staged"):
+            stage_stats = pipeline.run(self.get_pokemon_list())
+        self._finish_run(start_time)
+        for name, s in stage_stats.items():
+            print(f"🚰 {name:<8} {s['processed']:>8,} items  max queue {s['max_depth']:>4}  "
+                  f"stalled {s['stall_s']:>7.1f} worker-s  idle {s['idle_s']:>7.1f} worker-s  errors {s['errors']}")
+        return stage_stats
+
+    # -------- MAIN RUN --------
+    def _print_banner(self, mode: str = "") -> None:
+        print("=" * 70)
+        print(f"🎮 POKEMON MEDIA DOWNLOADER{mode}")
+        print("=" * 70)
+        print(f"📊 Target: {self.limit} Pokemon")
+        print(f"⚙️  Workers: fetch={self.fetch_workers}, download={self.download_workers}, forms={self.form_workers}")
+        if self.packs:
+            print(f"📦 Output: {os.path.abspath(self.packs.directory)} ({self.packs.shards} pack shards)")
+        elif self.uploader:
+            print(f"☁️  Output: gs://{self.uploader.bucket.name}/pokemon (streamed, no local files)")
+        else:
+            print(f"📁 Output: {os.path.abspath(self.download_dir)}")
+        print("=" * 70)
+        print()
+
+    def _finish_run(self, start_time: datetime) -> None:
+        if self.optimizer:
+            self.optimizer.close()
+        if self.packs:
+            self.packs.close()
+            if self.uploader:
+                self.uploader.upload_packs(self.packs.paths())
+        if self.manifest:
+            self.manifest.flush()
+        if self.uploader:
+            self.uploader.flush()
+
         # Calculate statistics
         duration = datetime.now() - start_time
         total_files = self.total_sprites + self.total_form_media
@@ -257,20 +716,116 @@ class FastThreadMediaDownloader:
         print(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
         print(f"⏱️  Total Time:                   {duration}")
         print(f"⚡ Download Speed:                {speed:.1f} files/second")
+        if self.download_limiter:
+            print(f"🎛️  Final Limits:                 {self.limits_summary()}")
+        for hedger in (self.json_hedger, self.media_hedger):
+            if hedger:
+                h = hedger.stats()
+                threshold = f"{h['threshold_s'] * 1000:.0f}ms" if h["threshold_s"] is not None else "warming up"
+                label = f"Hedged {hedger.name}:"
+                print(f"🪁 {label:<30}{h['hedges']:,} sent, {h['won']:,} won (p{HEDGE_PERCENTILE * 100:.0f} {threshold})")
+        if self.deadline.exceeded:
+            label = f"Deadline ({self.deadline.seconds:g}s) hit:"
+            print(f"⌛ {label:<30}{self.deadline.exceeded:,} requests not started")
+        for host, host_stats in transport_stats().items():
+            if host_stats["requests"]:
+                print(f"🌐 {host}: {host_stats['requests']:,} requests, {host_stats['retries']:,} retries")
         print(f"📂 Output Directory:             {os.path.abspath(self.download_dir)}")
+        if self.cache:
+            cache_stats = self.cache.stats()
+            print(f"🗄️  HTTP Cache:                   {cache_stats['hits']:,} hits / {cache_stats['misses']:,} misses")
+        if self.uploader and self.uploader.content_store:
+            dedup = self.uploader.content_store.stats()
+            print(f"🧬 Unique Blobs Uploaded:        {dedup['uploads']:,} ({dedup['bytes_uploaded'] / 1024 / 1024:.1f} MB)")
+            print(f"♻️  Duplicate Uploads Saved:      {dedup['uploads_saved']:,} ({dedup['bytes_saved'] / 1024 / 1024:.1f} MB)")
+        if self.packs:
+            pack_stats = self.packs.stats()
+            print(f"📦 Packs:                        {pack_stats['packs']:,} files, {pack_stats['entries']:,} entries "
+                  f"({pack_stats['bytes'] / 1024 / 1024:.1f} MB)")
+        if self.optimizer:
+            opt = self.optimizer.stats()
+            saved_pct = 100 * opt["bytes_saved"] / opt["bytes_in"] if opt["bytes_in"] else 0
+            print(f"🗜️  Optimized:                    {opt['files']:,} files ({opt['cache_hits']:,} cached), "
+                  f"{opt['bytes_saved'] / 1024 / 1024:.2f} MB saved ({saved_pct:.1f}%), {opt['cpu_seconds']:.1f} cpu-s")
+            if opt["variant_bytes"]:
+                print(f"🖼️  Variants:                     {opt['variant_bytes'] / 1024 / 1024:.2f} MB")
+        if self.manifest:
+            failed = self.manifest.failed_counts()
+            print(f"📒 Manifest failures:            {failed['pokemon']:,} pokemon / {failed['forms']:,} forms / {failed['media']:,} media (retried next run)")
         print("=" * 70)
 
 
+    def run(self):
+        self._print_banner()
+        start_time = datetime.now()
+        self.deadline.start()
+        if self.manifest:
+            # Media finished by an earlier run counts as already seen
+            self._seen_urls.update(self.manifest.completed_media_urls())
+        pokemon_urls = self.get_pokemon_list()
+        with tracer.span("download run", mode="threads"):
+            self.process(pokemon_urls)
+        self._finish_run(start_time)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download Pokemon media")
+    parser.add_argument("--limit", type=int, default=135, help="Number of Pokemon to download")
+    parser.add_argument("--manifest", default=None, help="Manifest path (defaults to MANIFEST_PATH)")
+    parser.add_argument("--no-manifest", action="store_true", help="Ignore and don't update the manifest")
+    parser.add_argument("--since", default=None,
+                        help="Only Pokemon with a higher ID; 'last' = highest ID already done in the manifest")
+    parser.add_argument("--packs", default=None, help="Append media into pack files in this directory")
+    parser.add_argument("--pack-shards", type=int, default=16, help="Number of pack files with --packs")
+    parser.add_argument("--staged", action="store_true",
+                        help="Run as bounded stages (detail -> forms -> media) with flat memory")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Recompress PNGs losslessly on a process pool before writing or uploading")
+    parser.add_argument("--thumbnail", type=int, default=None, help="With --optimize, also write NxN thumbnails (Pillow)")
+    parser.add_argument("--webp", action="store_true", help="With --optimize, also write lossless WebP variants (Pillow)")
+    parser.add_argument("--no-hedge", action="store_true", help="Never send duplicate requests for slow responses")
+    parser.add_argument("--deadline", type=float, default=RUN_DEADLINE_SECONDS or None,
+                        help="Stop starting requests after this many seconds; unfinished work is retried next run")
+    parser.add_argument("--trace", default=None, help="Write a sampled Chrome/Perfetto trace here at exit")
+    parser.add_argument("--trace-sample", type=float, default=None, help="Share of pokemon traced (TRACE_SAMPLE_RATE)")
+    args = parser.parse_args()
+
+    # All three are no-ops unless METRICS_PORT / METRICS_SNAPSHOT_PATH / TRACE_PATH are set
+    start_metrics_server()
+    enable_snapshot_at_exit()
+    enable_tracing_at_exit(args.trace, args.trace_sample)
+
     print(f"⏰ Start: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
+    manifest = None
+    if not args.no_manifest:
+        manifest = ManifestStore(args.manifest) if args.manifest else ManifestStore()
+
+    since = None
+    if args.since == "last":
+        since = manifest.max_pokemon_id() if manifest else 0
+    elif args.since is not None:
+        since = int(args.since)
+
     downloader = FastThreadMediaDownloader(
-        limit=135,  # Number of Pokemon to download
+        limit=args.limit,  # Number of Pokemon to download
         fetch_workers=60,  # Parallel Pokemon fetchers
         download_workers=250,  # Parallel file downloaders
         form_workers=40,  # Parallel form fetchers
+        manifest=manifest,
+        since=since,
+        packs=PackSet(args.packs, shards=args.pack_shards) if args.packs else None,
+        hedge=not args.no_hedge,
+        deadline_seconds=args.deadline,
+        optimizer=ImageOptimizer(thumbnail=args.thumbnail, webp=args.webp) if args.optimize else None,
     )
 
-    downloader.run()
+    if args.staged:
+        downloader.run_staged()
+    else:
+        downloader.run()
+
+    if manifest:
+        manifest.close()
 
     print(f"\n⏰ End: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""Sharded media download: N processes (on one box or many) share a run through the Postgres work table.
+
+    python -m etl.download.sharded_runner --run-id dex-2024-06 --limit 1325 --processes 4
+    # on another machine, join the same run without re-seeding
+    python -m etl.download.sharded_runner --run-id dex-2024-06 --processes 4 --no-seed
+    # one trace per worker: traces/dex.worker-0.json, traces/dex.worker-1.json, ...
+    python -m etl.download.sharded_runner --run-id dex-2024-06 --limit 1325 --processes 4 --trace traces/dex.json
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Optional
+
+from etl.download.media_downloader import FastThreadMediaDownloader
+from sql_manager.work_queue import WorkQueue
+from utils.settings import WORK_BATCH_SIZE, WORK_LEASE_SECONDS
+from utils.tracing import enable_tracing_at_exit, tracer
+
+
+def seed_run(run_id: str, limit: int, api_url: str, batch_size: int = WORK_BATCH_SIZE) -> int:
+    """Create the work table and enqueue every pokemon id of the list; safe to repeat"""
+    queue = WorkQueue(run_id)
+    queue.setup()
+    downloader = FastThreadMediaDownloader(limit=limit, api_url=api_url)
+    ids = [downloader.pokemon_id(url) for url in downloader.get_pokemon_list()]
+    return queue.enqueue(ids, batch_size)
+
+
+def worker_main(run_id: str, worker_index: int, api_url: str, lease_seconds: int = WORK_LEASE_SECONDS) -> None:
+    """Claim batches until none are left; a crash leaves the lease to expire and another worker takes over"""
+    queue = WorkQueue(run_id, lease_seconds=lease_seconds, owner=f"{socket.gethostname()}:{os.getpid()}:{worker_index}")
+    downloader = FastThreadMediaDownloader(limit=0, api_url=api_url)
+    batches = failed = 0
+
+    while lease := queue.claim():
+        start = time.perf_counter()
+        try:
+            with queue.leased(lease), tracer.span("batch", batch=lease.batch_id, attempt=lease.attempt):
+                urls = [f"{downloader.api_url}/pokemon/{pokemon_id}/" for pokemon_id in lease.ids]
+                failed_before = downloader.failed_downloads + downloader.failed_forms
+                fetch_failures = downloader.process(urls)
+                media_failures = downloader.failed_downloads + downloader.failed_forms - failed_before
+                if fetch_failures or media_failures:
+                    # Raising releases the batch for a retry instead of marking it done; failed media urls were
+                    # released by the downloader, so the retry fetches them again
+                    raise RuntimeError(
+                        f"batch {lease.batch_id}: {fetch_failures} pokemon and {media_failures} media/forms failed"
+                    )
+        except Exception as e:
+            # One bad batch costs an attempt, not the worker; keep claiming
+            failed += 1
+            print(f"⚠️  [{queue.owner}] batch {lease.batch_id} attempt {lease.attempt} failed: {e}")
+            continue
+        if lease.lost:
+            print(f"⚠️  [{queue.owner}] batch {lease.batch_id} was re-leased to another worker")
+            continue
+        batches += 1
+        print(f"✅ [{queue.owner}] batch {lease.batch_id} ({len(lease.ids)} pokemon) "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    print(f"🏁 [{queue.owner}] no batches left: {batches} batches ({failed} failed attempts), "
+          f"{downloader.total_sprites + downloader.total_form_media:,} files, "
+          f"{downloader.failed_downloads:,} failed downloads")
+
+
+def _worker_entry(
+        run_id: str,
+        worker_index: int,
+        api_url: str,
+        lease_seconds: int,
+        trace_path: Optional[str] = None,
+        trace_sample: Optional[float] = None,
+) -> None:
+    # Spawned workers start with a fresh tracer: each one writes its own file, labelled with its index
+    enable_tracing_at_exit(trace_path, trace_sample, process_name=f"worker {worker_index}")
+    try:
+        worker_main(run_id, worker_index, api_url, lease_seconds)
+    except Exception as e:
+        print(f"❌ Worker {worker_index} stopped: {e}")
+        raise
+
+
+def run_sharded(
+        run_id: str,
+        processes: int,
+        api_url: str = "https://pokeapi.co/api/v2",
+        limit: Optional[int] = None,
+        batch_size: int = WORK_BATCH_SIZE,
+        lease_seconds: int = WORK_LEASE_SECONDS,
+        trace_path: Optional[str] = None,
+        trace_sample: Optional[float] = None,
+) -> dict:
+    """Seed the run (unless limit is None) and work it with local processes; returns the batch status counts"""
+    start_time = datetime.now()
+    if limit is not None:
+        batches = seed_run(run_id, limit, api_url, batch_size)
+        print(f"📦 Run {run_id}: {batches} batches of up to {batch_size} pokemon")
+
+    # spawn: every worker gets a fresh interpreter, its own connection pool and its own GIL
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=_worker_entry, args=(run_id, index, api_url, lease_seconds, trace_path, trace_sample))
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    progress = WorkQueue(run_id).progress()
+    print(f"📊 Run {run_id} after {datetime.now() - start_time}: {progress}")
+    return progress
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded Pokemon media download over a Postgres work queue")
+    parser.add_argument("--run-id", required=True, help="Name shared by every worker of this run")
+    parser.add_argument("--limit", type=int, default=1325, help="Number of Pokemon to enqueue")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Local worker processes")
+    parser.add_argument("--batch-size", type=int, default=WORK_BATCH_SIZE, help="Pokemon per leased batch")
+    parser.add_argument("--lease-seconds", type=int, default=WORK_LEASE_SECONDS, help="Lease length before expiry")
+    parser.add_argument("--no-seed", action="store_true", help="Join an already seeded run")
+    parser.add_argument("--api-url", default="https://pokeapi.co/api/v2")
+    parser.add_argument("--trace", default=None, help="Trace each worker to <path>.worker-<n>.json (TRACE_PATH)")
+    parser.add_argument("--trace-sample", type=float, default=None, help="Share of pokemon traced (TRACE_SAMPLE_RATE)")
+    args = parser.parse_args()
+
+    run_sharded(
+        args.run_id,
+        args.processes,
+        api_url=args.api_url,
+        limit=None if args.no_seed else args.limit,
+        batch_size=args.batch_size,
+        lease_seconds=args.lease_seconds,
+        trace_path=args.trace,
+        trace_sample=args.trace_sample,
+    )
@@ -1,10 +1,7 @@
+from utils.helper import iter_media_urls
+
+
 class MediaExtractor:
     @staticmethod
     def extract_urls(data: dict) -> list[str]:
-        urls = []
-        if isinstance(data, dict):
-            for v in data.values():
-                urls.extend(MediaExtractor.extract_urls(v))
-        elif isinstance(data, str) and data.startswith("http"):
-            urls.append(data)
-        return urls
+        return [url for _, url in iter_media_urls(data)]
@@ -1,29 +1,25 @@
-import requests
-from google.cloud import client, storage
-from requests.adapters import HTTPAdapter
+from typing import Collection, Optional
 
-from utils.settings import PROJECT_ID
+from etl.extract.json_projection import POKEMON_FIELDS, project
+from etl.extract.response_cache import ResponseCache, get_shared_cache
+from etl.transport.http_transport import new_session
 
 
 class PokeApiClient:
-    def __init__(self, base_url: str):
-        self.client = client or storage.Client(project=PROJECT_ID)
+    def __init__(self, base_url: str, cache: Optional[ResponseCache] = None, use_cache: bool = True):
         self.base_url = base_url
-        self.session = requests.Session()
+        self.cache = (cache or get_shared_cache()) if use_cache else None
+        # Shared per-host rate limit and connection budget with the downloader and uploader
+        self.session = new_session(base_url)
 
-        adapter = HTTPAdapter(
-            pool_connections=100,
-            pool_maxsize=100,
-        )
-        self.session.mount('http://', adapter)
-        self.session.mount('https://', adapter
-                           )
-
-    def fetch_raw_pokemon_data(self, pokemon_id: int) -> dict:
+    def fetch_raw_pokemon_data(self, pokemon_id: int, fields: Collection[str] = POKEMON_FIELDS) -> dict:
+        """Pokemon document reduced to the given top-level fields, parsed as it streams in"""
         url = self.base_url.format(f"/{pokemon_id}")
-        response = self.session.get(url, timeout=5)
-        response.raise_for_status()
-        return response.json()
+        if self.cache:
+            return self.cache.get_json(self.session, url, timeout=5, fields=fields)
+        with self.session.get(url, timeout=5, stream=True) as response:
+            response.raise_for_status()
+            return project(response.iter_content(65536), fields)
 
     def fetch_all_ids(self, limit) -> list[int]:
         url = self.base_url.format(f"?limit={limit}")
@@ -0,0 +1,135 @@
+import codecs
+import json
+import re
+from typing import Collection, Iterable
+
+# Top-level keys of /pokemon/{id} the pipeline actually reads; everything else (mostly "moves") is skipped
+POKEMON_FIELDS = (
+    "id", "name", "base_experience", "height", "weight", "order",
+    "sprites", "forms", "abilities", "types", "stats",
+)
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# What may follow a complete number; anything else ("1." | "5", "-1.5e" | "-07") means it continues in the next chunk
+_AFTER_NUMBER = frozenset(" \t\n\r,]}")
+
+
+class _ChunkReader:
+    """Cursor over a chunked JSON byte stream; only the unread tail of the stream is kept in memory"""
+
+    def __init__(self, chunks: Iterable[bytes], compact_at: int = 65536):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.compact_at = compact_at
+        self.buf = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def _fill(self, min_chars: int = 1) -> bool:
+        """Append at least min_chars of decoded text; False once the stream is used up"""
+        if self.exhausted:
+            return False
+        if self.pos >= self.compact_at:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        parts = [self.buf]
+        added = 0
+        while added < min_chars:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                parts.append(self._utf8.decode(b"", final=True))
+                self.exhausted = True
+                break
+            text = self._utf8.decode(chunk)
+            parts.append(text)
+            added += len(text)
+        self.buf = "".join(parts)
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}", self.buf, self.pos)
+        self.pos += 1
+
+    def end_of(self, close: str) -> bool:
+        """Consume the separator after a member: True on the closing bracket, False on a comma"""
+        char = self.peek()
+        if char not in (",", close):
+            raise json.JSONDecodeError(f"Expecting ',' or {close!r}", self.buf, self.pos)
+        self.pos += 1
+        return char == close
+
+    def value(self):
+        """Decode one complete value with the C scanner, reading more chunks until it fits"""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Truncated value: grow the pending text geometrically so long values stay linear
+                if not self._fill(max(1, len(self.buf) - self.pos)):
+                    raise
+                continue
+            if self.buf[self.pos] in "-0123456789" and (end == len(self.buf) or self.buf[end] not in _AFTER_NUMBER):
+                # The scanner stops at the longest valid prefix, so "1." reads as 1; only a delimiter ends a number
+                if self._fill():
+                    continue
+            elif end == len(self.buf) and self._fill():
+                # A literal may continue in the next chunk
+                continue
+            self.pos = end
+            return obj
+
+    def skip(self) -> None:
+        """Read past one value, materializing at most one of its members at a time"""
+        char = self.peek()
+        if char == "[":
+            self.pos += 1
+            if self.peek() == "]":
+                self.pos += 1
+                return
+            while True:
+                self.value()
+                if self.end_of("]"):
+                    return
+        elif char == "{":
+            self.pos += 1
+            if self.peek() == "}":
+                self.pos += 1
+                return
+            while True:
+                self.value()
+                self.expect(":")
+                self.value()
+                if self.end_of("}"):
+                    return
+        else:
+            self.value()
+
+
+def project(chunks: Iterable[bytes], fields: Collection[str] = POKEMON_FIELDS) -> dict:
+    """Parse a JSON object from byte chunks, keeping only the given top-level keys"""
+    reader = _ChunkReader(chunks)
+    wanted = set(fields)
+    result = {}
+    reader.expect("{")
+    if reader.peek() == "}":
+        return result
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key in wanted:
+            result[key] = reader.value()
+        else:
+            reader.skip()
+        if reader.end_of("}"):
+            return result
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Collection, Optional
+
+import requests
+
+from etl.extract.json_projection import project
+from utils.logger import logger
+from utils.settings import HTTP_CACHE_DIR, HTTP_CACHE_MAX_MB, HTTP_CACHE_OFFLINE
+
+
+class ResponseCache:
+    """On-disk JSON response cache keyed by URL, revalidated with conditional GETs"""
+
+    def __init__(
+            self,
+            cache_dir: str = HTTP_CACHE_DIR,
+            max_bytes: int = HTTP_CACHE_MAX_MB * 1024 * 1024,
+            offline: bool = HTTP_CACHE_OFFLINE,
+            chunk_size: int = 65536,
+    ):
+        self.cache_dir = cache_dir
+        self.body_dir = os.path.join(cache_dir, "bodies")
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.chunk_size = chunk_size
+        os.makedirs(self.body_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(cache_dir, "index.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries(
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_access ON entries(last_access)")
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def _body_path(self, url: str) -> str:
+        return os.path.join(self.body_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def _lookup(self, url: str) -> Optional[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT etag, last_modified FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+
+    def _touch(self, url: str) -> None:
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url))
+
+    def _tmp_path(self, url: str) -> str:
+        # Sharded workers share the cache directory and thread idents repeat across processes, so the pid is needed
+        return f"{self._body_path(url)}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def _store(self, url: str, body: bytes, etag: Optional[str], last_modified: Optional[str]) -> None:
+        tmp_path = self._tmp_path(url)
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        self._commit(url, tmp_path, len(body), etag, last_modified)
+
+    def _commit(self, url: str, tmp_path: str, size: int, etag: Optional[str], last_modified: Optional[str]) -> None:
+        os.replace(tmp_path, self._body_path(url))
+
+        with self._lock:
+            old = self._db.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries(url, etag, last_modified, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, size, time.time()),
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _iter_file(self, f):
+        while chunk := f.read(self.chunk_size):
+            yield chunk
+
+    def _open_body(self, url: str):
+        """Open the cached body now, so an eviction by another thread can't remove it before it is read"""
+        try:
+            return open(self._body_path(url), "rb")
+        except FileNotFoundError:
+            return None
+
+    def _tee(self, chunks, f):
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits; caller holds the lock"""
+        rows = self._db.execute("SELECT url, size FROM entries ORDER BY last_access").fetchall()
+        target = self.max_bytes * 0.9
+        evicted = []
+        for url, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((url,))
+            self.total_bytes -= size
+            try:
+                os.remove(self._body_path(url))
+            except OSError:
+                pass
+        self._db.executemany("DELETE FROM entries WHERE url = ?", evicted)
+
+    def get_json(
+            self,
+            session: requests.Session,
+            url: str,
+            timeout: float = 10,
+            fields: Optional[Collection[str]] = None,
+            attempt=None,
+    ):
+        """Cached GET; with fields, only those top-level keys are parsed, streaming from socket or disk. A hedge
+        attempt, when given, is bound to the response so the losing request's connection can be closed"""
+        entry = self._lookup(url)
+        # Without a readable body the request goes out unconditional, as if the entry did not exist
+        body = self._open_body(url) if entry is not None else None
+        try:
+            if body and self.offline:
+                with self._lock:
+                    self.hits += 1
+                self._touch(url)
+                return self._load(body, fields)
+
+            headers = {}
+            if body:
+                etag, last_modified = entry
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+
+            # Closed on every path, so an error status doesn't keep a streamed connection out of the pool. A hedged
+            # attempt always streams: a body read inside get() would finish before bind() could cut it short
+            stream = fields is not None or attempt is not None
+            with session.get(url, headers=headers, timeout=timeout, stream=stream) as response:
+                if attempt:
+                    attempt.bind(response)
+                if response.status_code == 304 and body:
+                    with self._lock:
+                        self.hits += 1
+                        self.revalidated += 1
+                    self._touch(url)
+                    return self._load(body, fields)
+                return self._fetched(url, response, fields)
+        finally:
+            if body:
+                body.close()
+
+    def _fetched(self, url: str, response: requests.Response, fields: Optional[Collection[str]]):
+        response.raise_for_status()
+        with self._lock:
+            self.misses += 1
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if fields is None:
+            # Parsed before storing, so a body cut short (a cancelled hedge) never lands in the cache
+            data = response.json()
+            self._store(url, response.content, etag, last_modified)
+            return data
+
+        # Write the body to the cache while the projection consumes it, so it is never held whole
+        tmp_path = self._tmp_path(url)
+        try:
+            with open(tmp_path, "wb") as f:
+                data = project(self._tee(response.iter_content(self.chunk_size), f), fields)
+                size = f.tell()
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._commit(url, tmp_path, size, etag, last_modified)
+        return data
+
+    def _load(self, body, fields: Optional[Collection[str]]):
+        if fields is None:
+            return json.loads(body.read())
+        return project(self._iter_file(body), fields)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "bytes": self.total_bytes,
+            }
+
+    def log_stats(self) -> None:
+        s = self.stats()
+        logger.info(
+            f"HTTP cache: {s['hits']} hits ({s['revalidated']} revalidated), "
+            f"{s['misses']} misses, {s['bytes'] / 1024 / 1024:.1f} MB on disk"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> ResponseCache:
+    """Process-wide cache instance so every client hits the same index"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
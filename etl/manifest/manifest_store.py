@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Set
+
+from utils.settings import MANIFEST_PATH
+
+DONE = "done"
+FAILED = "failed"
+
+
+class ManifestStore:
+    """SQLite record of finished pokemon, forms and media so reruns only schedule what is missing"""
+
+    def __init__(self, path: str = MANIFEST_PATH, batch_size: int = 500, flush_interval: float = 2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._pending_pokemon: List[tuple] = []
+        self._pending_forms: List[tuple] = []
+        self._pending_media: List[tuple] = []
+        self._last_flush = time.monotonic()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pokemon(
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS forms(
+                url TEXT PRIMARY KEY,
+                pokemon_name TEXT NOT NULL,
+                name TEXT,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS media(
+                url TEXT PRIMARY KEY,
+                pokemon_name TEXT NOT NULL,
+                path TEXT,
+                status TEXT NOT NULL,
+                size INTEGER,
+                checksum TEXT,
+                gcs_path TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS media_pokemon ON media(pokemon_name);
+            """
+        )
+        self._db.commit()
+
+    # -------- READS (used when scheduling) --------
+    def completed_pokemon_urls(self) -> Set[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT url FROM pokemon WHERE status = ?", (DONE,)).fetchall()
+        return {url for (url,) in rows}
+
+    def completed_media_urls(self) -> Set[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT url FROM media WHERE status = ?", (DONE,)).fetchall()
+        return {url for (url,) in rows}
+
+    def max_pokemon_id(self) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM pokemon WHERE status = ?", (DONE,)).fetchone()
+        return row[0]
+
+    def failed_counts(self) -> dict:
+        with self._lock:
+            return {
+                table: self._db.execute(f"SELECT COUNT(*) FROM {table} WHERE status = ?", (FAILED,)).fetchone()[0]
+                for table in ("pokemon", "forms", "media")
+            }
+
+    # -------- WRITES (buffered, flushed in batches) --------
+    def record_pokemon(self, pokemon_id: int, name: Optional[str], url: str, status: str) -> None:
+        with self._lock:
+            self._pending_pokemon.append((pokemon_id, name, url, status, time.time()))
+            self._maybe_flush()
+
+    def record_form(self, url: str, pokemon_name: str, name: Optional[str], status: str) -> None:
+        with self._lock:
+            self._pending_forms.append((url, pokemon_name, name, status, time.time()))
+            self._maybe_flush()
+
+    def record_media(
+            self,
+            url: str,
+            pokemon_name: str,
+            status: str,
+            path: Optional[str] = None,
+            size: Optional[int] = None,
+            checksum: Optional[str] = None,
+            gcs_path: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            self._pending_media.append((url, pokemon_name, path, status, size, checksum, gcs_path, time.time()))
+            self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        pending = len(self._pending_pokemon) + len(self._pending_forms) + len(self._pending_media)
+        if pending >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Write buffered rows in one transaction; caller holds the lock"""
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO pokemon(id, name, url, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                self._pending_pokemon,
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO forms(url, pokemon_name, name, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                self._pending_forms,
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO media(url, pokemon_name, path, status, size, checksum, gcs_path, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending_media,
+            )
+        self._pending_pokemon.clear()
+        self._pending_forms.clear()
+        self._pending_media.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._db.close()
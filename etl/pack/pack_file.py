@@ -0,0 +1,267 @@
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+# Pack file: append-only records of  <u16 name length><u32 body length><name utf-8><body>
+# so a pack whose index was never written can still be scanned and re-indexed.
+RECORD_HEADER = struct.Struct("<HI")
+
+# Index file: header, fixed-size entries sorted by name key, then the names blob.
+# The key is the first 8 bytes of blake2b(name), so lookups are a bisect over the mmap'd entries.
+INDEX_MAGIC = b"PKIX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sHI")  # magic, version, entry count
+INDEX_ENTRY = struct.Struct("<QQIII32s")  # key, body offset, body length, name offset, name length, sha256
+
+
+class PackEntry(NamedTuple):
+    name: str
+    offset: int
+    length: int
+    sha256: str
+
+
+def name_key(name: str) -> int:
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "little")
+
+
+def index_path(pack_path: str) -> str:
+    return os.path.splitext(pack_path)[0] + ".idx"
+
+
+def scan_pack(pack_path: str) -> Iterator[PackEntry]:
+    """Walk the record headers of a pack (used to rebuild a lost or stale index)"""
+    with open(pack_path, "rb") as f:
+        while True:
+            start = f.tell()
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            name_len, body_len = RECORD_HEADER.unpack(header)
+            name = f.read(name_len).decode()
+            body = f.read(body_len)
+            if len(body) < body_len:
+                # Torn final record from a crash; everything before it is intact
+                return
+            yield PackEntry(name, start + RECORD_HEADER.size + name_len, body_len, hashlib.sha256(body).hexdigest())
+
+
+def write_index(pack_path: str, entries: List[PackEntry]) -> None:
+    ordered = sorted(entries, key=lambda e: name_key(e.name))
+    names = bytearray()
+    packed = []
+    for entry in ordered:
+        encoded = entry.name.encode()
+        packed.append(INDEX_ENTRY.pack(
+            name_key(entry.name), entry.offset, entry.length, len(names), len(encoded), bytes.fromhex(entry.sha256),
+        ))
+        names.extend(encoded)
+
+    path = index_path(pack_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(packed)))
+        f.writelines(packed)
+        f.write(names)
+    os.replace(tmp_path, path)
+
+
+class PackWriter:
+    """Thread-safe appender for one pack; the index is rewritten on flush/close"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, PackEntry] = {}
+        if os.path.exists(path):
+            # Reopening continues the pack; scanning also picks up records a crash left unindexed
+            for entry in scan_pack(path):
+                self.entries[entry.name] = entry
+        self._file = open(path, "r+b" if os.path.exists(path) else "wb")
+        # Drop a torn record left by a crash, then continue appending after the last good one
+        self._file.truncate(self._valid_size())
+        self._file.seek(0, os.SEEK_END)
+        # The on-disk index may predate records appended before a crash
+        self._dirty = bool(self.entries)
+
+    def _valid_size(self) -> int:
+        if not self.entries:
+            return 0
+        return max(entry.offset + entry.length for entry in self.entries.values())
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self.entries
+
+    def get(self, name: str) -> Optional[PackEntry]:
+        with self._lock:
+            return self.entries.get(name)
+
+    def add(self, name: str, body: bytes) -> PackEntry:
+        encoded = name.encode()
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            start = self._file.tell()
+            self._file.write(RECORD_HEADER.pack(len(encoded), len(body)))
+            self._file.write(encoded)
+            self._file.write(body)
+            entry = PackEntry(name, start + RECORD_HEADER.size + len(encoded), len(body), digest)
+            self.entries[name] = entry
+            self._dirty = True
+        return entry
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            self._file.flush()
+            write_index(self.path, list(self.entries.values()))
+            self._dirty = False
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._file.close()
+
+
+class PackReader:
+    """Random access into a pack through its mmap'd index: O(log n) lookups, zero-copy bodies"""
+
+    def __init__(self, path: str):
+        self.path = path
+        if not os.path.exists(index_path(path)):
+            write_index(path, list(scan_pack(path)))
+
+        with open(index_path(path), "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{index_path(path)} is not a version {INDEX_VERSION} pack index")
+        self._names_start = INDEX_HEADER.size + self.count * INDEX_ENTRY.size
+
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, i: int) -> tuple:
+        return INDEX_ENTRY.unpack_from(self._index, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+
+    def _name(self, name_offset: int, name_len: int) -> str:
+        start = self._names_start + name_offset
+        return self._index[start:start + name_len].decode()
+
+    def _key(self, i: int) -> int:
+        return self._entry(i)[0]
+
+    def find(self, name: str) -> Optional[PackEntry]:
+        key = name_key(name)
+        i = bisect.bisect_left(_KeyView(self), key)
+        # Keys are 64-bit hashes; walk the (almost always single) run of equal keys comparing names
+        while i < self.count:
+            entry_key, offset, length, name_offset, name_len, digest = self._entry(i)
+            if entry_key != key:
+                return None
+            if self._name(name_offset, name_len) == name:
+                return PackEntry(name, offset, length, digest.hex())
+            i += 1
+        return None
+
+    def __contains__(self, name: str) -> bool:
+        return self.find(name) is not None
+
+    def get(self, name: str) -> memoryview:
+        entry = self.find(name)
+        if entry is None:
+            raise KeyError(name)
+        return memoryview(self._data)[entry.offset:entry.offset + entry.length]
+
+    def __iter__(self) -> Iterator[PackEntry]:
+        for i in range(self.count):
+            _, offset, length, name_offset, name_len, digest = self._entry(i)
+            yield PackEntry(self._name(name_offset, name_len), offset, length, digest.hex())
+
+    def close(self) -> None:
+        self._index.close()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+
+class _KeyView:
+    """Sequence view over the sorted index keys so bisect can search the mmap directly"""
+
+    def __init__(self, reader: PackReader):
+        self.reader = reader
+
+    def __len__(self) -> int:
+        return self.reader.count
+
+    def __getitem__(self, i: int) -> int:
+        return self.reader._key(i)
+
+
+class PackSet:
+    """Media spread over `shards` packs by a stable hash of the pokemon name"""
+
+    def __init__(self, directory: str = "packs", shards: int = 16, prefix: str = "media"):
+        self.directory = directory
+        self.shards = shards
+        self.prefix = prefix
+        self._writers: Dict[int, PackWriter] = {}
+        self._lock = threading.Lock()
+
+    def shard_of(self, pokemon_name: str) -> int:
+        return zlib.crc32(pokemon_name.encode()) % self.shards
+
+    def pack_path(self, shard: int) -> str:
+        return os.path.join(self.directory, f"{self.prefix}-{shard:03d}.pack")
+
+    def writer(self, pokemon_name: str) -> PackWriter:
+        shard = self.shard_of(pokemon_name)
+        with self._lock:
+            if shard not in self._writers:
+                self._writers[shard] = PackWriter(self.pack_path(shard))
+            return self._writers[shard]
+
+    def add(self, pokemon_name: str, name: str, body: bytes) -> PackEntry:
+        return self.writer(pokemon_name).add(name, body)
+
+    def contains(self, pokemon_name: str, name: str) -> bool:
+        return name in self.writer(pokemon_name)
+
+    def entry(self, pokemon_name: str, name: str) -> Optional[PackEntry]:
+        """The record already packed under name, if any"""
+        return self.writer(pokemon_name).get(name)
+
+    def paths(self) -> List[str]:
+        with self._lock:
+            return [writer.path for writer in self._writers.values()]
+
+    def flush(self) -> None:
+        with self._lock:
+            writers = list(self._writers.values())
+        for writer in writers:
+            writer.flush()
+
+    def close(self) -> None:
+        """Close every pack; paths() and stats() stay available for upload and reporting"""
+        with self._lock:
+            writers = list(self._writers.values())
+        for writer in writers:
+            writer.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            writers = list(self._writers.values())
+        return {
+            "packs": len(writers),
+            "entries": sum(len(writer.entries) for writer in writers),
+            "bytes": sum(entry.length for writer in writers for entry in writer.entries.values()),
+        }
@@ -0,0 +1,159 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils.logger import logger
+from utils.metrics import metrics
+
+_DONE = object()
+
+
+class Stage:
+    """One pipeline step: `workers` threads call handler(item) and pass whatever it returns/yields downstream"""
+
+    def __init__(
+            self,
+            name: str,
+            handler: Callable,
+            workers: int = 1,
+            queue_size: int = 64,
+            on_close: Optional[Callable] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        # Called once by the last worker to stop, e.g. to flush a partial batch; may return more items
+        self.on_close = on_close
+        # Bounded inbox: producers block when it is full, which is what keeps memory flat
+        self.inbox: queue.Queue = queue.Queue(maxsize=queue_size)
+
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.stall_seconds = 0.0
+        self.idle_seconds = 0.0
+        self._running = 0
+
+    def _add(self, processed: int = 0, errors: int = 0, stall: float = 0.0, idle: float = 0.0) -> None:
+        with self._lock:
+            self.processed += processed
+            self.errors += errors
+            self.stall_seconds += stall
+            self.idle_seconds += idle
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "errors": self.errors,
+                "queue_depth": self.inbox.qsize(),
+                "max_depth": self.max_depth,
+                "stall_s": round(self.stall_seconds, 2),
+                "idle_s": round(self.idle_seconds, 2),
+            }
+
+
+class Pipeline:
+    """Stages joined by bounded queues; a slow stage backs up its producers instead of buffering without limit"""
+
+    def __init__(self, stages: List[Stage], report_every: float = 5.0):
+        self.stages = stages
+        self.report_every = report_every
+        self.source_stall = 0.0
+
+    def _put(self, stage: Optional[Stage], item, owner: Optional[Stage]) -> None:
+        """Blocking put into the next stage; time spent blocked is charged to the producing stage as stall"""
+        if stage is None:
+            return
+        start = time.perf_counter()
+        stage.inbox.put(item)
+        stalled = time.perf_counter() - start
+        depth = stage.inbox.qsize()
+        with stage._lock:
+            stage.max_depth = max(stage.max_depth, depth)
+        if owner is not None:
+            owner._add(stall=stalled)
+            metrics.inc("stage_stall_seconds_total", stalled, stage=owner.name)
+        else:
+            self.source_stall += stalled
+
+    def _worker(self, index: int) -> None:
+        stage = self.stages[index]
+        downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            start = time.perf_counter()
+            item = stage.inbox.get()
+            stage._add(idle=time.perf_counter() - start)
+            if item is _DONE:
+                break
+            try:
+                outputs = stage.handler(item)
+                for output in outputs or ():
+                    self._put(downstream, output, stage)
+                stage._add(processed=1)
+            except Exception as e:
+                stage._add(errors=1)
+                metrics.inc("stage_errors_total", stage=stage.name, error=type(e).__name__)
+                logger.warning(f"Stage {stage.name} failed on an item: {e}")
+
+        # The last worker out tells every worker of the next stage to stop
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if not last:
+            return
+        if stage.on_close:
+            try:
+                for output in stage.on_close() or ():
+                    self._put(downstream, output, stage)
+            except Exception as e:
+                stage._add(errors=1)
+                logger.warning(f"Stage {stage.name} failed while closing: {e}")
+        if downstream is not None:
+            for _ in range(downstream.workers):
+                downstream.inbox.put(_DONE)
+
+    def _report(self, stop: threading.Event) -> None:
+        while not stop.wait(self.report_every):
+            self.publish()
+            logger.info(f"Pipeline: {self.summary()}")
+
+    def publish(self) -> None:
+        for stage in self.stages:
+            metrics.set_gauge("queue_depth", stage.inbox.qsize(), stage=stage.name)
+
+    def run(self, source: Iterable) -> Dict[str, dict]:
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage._running = stage.workers
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        stop = threading.Event()
+        reporter = threading.Thread(target=self._report, args=(stop,), daemon=True)
+        reporter.start()
+
+        first = self.stages[0]
+        for item in source:
+            self._put(first, item, None)
+        for _ in range(first.workers):
+            first.inbox.put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        stop.set()
+        self.publish()
+        return self.stats()
+
+    def stats(self) -> Dict[str, dict]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def summary(self) -> str:
+        return " | ".join(
+            f"{name}: {s['processed']:,} done, depth {s['queue_depth']}/{s['max_depth']}, stalled {s['stall_s']}s"
+            for name, s in self.stats().items()
+        )
@@ -0,0 +1,163 @@
+import sys
+import threading
+from array import array
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from etl.pokemon.pokemon import Pokemon
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+# Stand-in for JSON null inside the int columns (PokeAPI has null base_experience on some forms)
+MISSING = -(2 ** 31)
+
+
+def _url_id(url: str) -> int:
+    return int(url.rstrip("/").split("/")[-1])
+
+
+def _encode(value: Optional[int]) -> int:
+    return MISSING if value is None else value
+
+
+def _decode(value: int) -> Optional[int]:
+    return None if value == MISSING else value
+
+
+class _Columns:
+    """Aligned typed columns: one array("i") per int column, one list per str column"""
+
+    def __init__(self, int_columns: Sequence[str], str_columns: Sequence[str] = ()):
+        self.names = tuple(str_columns) + tuple(int_columns)
+        self.data: Dict[str, object] = {name: [] for name in str_columns}
+        self.data.update({name: array("i") for name in int_columns})
+        self.ints = tuple(int_columns)
+
+    def __len__(self) -> int:
+        return len(self.data[self.names[0]])
+
+    def extend(self, rows: List[tuple]) -> None:
+        # rows are in self.names order; ints are already encoded
+        for name, values in zip(self.names, zip(*rows)):
+            self.data[name].extend(values)
+
+    def rows(self, columns: Sequence[str], count: int) -> Iterator[tuple]:
+        # count is taken under the batch lock, so rows appended meanwhile never come out half-written
+        decode = [name in self.ints for name in columns]
+        for row in zip(*(islice(self.data[name], count) for name in columns)):
+            yield tuple(_decode(v) if is_int else v for v, is_int in zip(row, decode))
+
+
+class PokemonBatch:
+    """Columnar, append-only store of pokemon plus their ability, type and stat links; safe to fill from many threads"""
+
+    POKEMON_COLUMNS = ("id_pokes", "base_experience", "height", "weight", "poke_order")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pokemon = _Columns(self.POKEMON_COLUMNS, ("name",))
+        self.ability_links = _Columns(("ability_url_id", "id_pokes", "slot", "is_hidden"))
+        self.type_links = _Columns(("type_url_id", "id_pokes", "slot"))
+        self.stat_links = _Columns(("stat_url_id", "id_pokes", "base_stat", "effort"))
+        # Lookup tables are tiny (a few hundred abilities, ~20 types, 8 stats): url_id -> (name, url)
+        self.abilities: Dict[int, Tuple[str, str]] = {}
+        self.types: Dict[int, Tuple[str, str]] = {}
+        self.stats: Dict[int, Tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.pokemon)
+
+    def append(self, data: dict) -> None:
+        """Add one /pokemon/{id} document (full or projected to POKEMON_FIELDS)"""
+        self.extend((data,))
+
+    def extend(self, documents) -> None:
+        """Convert documents outside the lock, then append every column under it in one go"""
+        pokemon, abilities, types, stats = [], [], [], []
+        ability_names, type_names, stat_names = {}, {}, {}
+        for data in documents:
+            pid = data["id"]
+            pokemon.append((
+                sys.intern(data["name"]), pid, _encode(data.get("base_experience")),
+                _encode(data.get("height")), _encode(data.get("weight")), _encode(data.get("order")),
+            ))
+            for entry in data.get("abilities") or ():
+                ref = entry["ability"]
+                url_id = _url_id(ref["url"])
+                ability_names[url_id] = (ref["name"], ref["url"])
+                abilities.append((url_id, pid, _encode(entry.get("slot")), int(bool(entry.get("is_hidden")))))
+            for entry in data.get("types") or ():
+                ref = entry["type"]
+                url_id = _url_id(ref["url"])
+                type_names[url_id] = (ref["name"], ref["url"])
+                types.append((url_id, pid, _encode(entry.get("slot"))))
+            for entry in data.get("stats") or ():
+                ref = entry["stat"]
+                url_id = _url_id(ref["url"])
+                stat_names[url_id] = (ref["name"], ref["url"])
+                stats.append((url_id, pid, _encode(entry.get("base_stat")), _encode(entry.get("effort"))))
+
+        with self._lock:
+            if pokemon:
+                self.pokemon.extend(pokemon)
+            if abilities:
+                self.ability_links.extend(abilities)
+            if types:
+                self.type_links.extend(types)
+            if stats:
+                self.stat_links.extend(stats)
+            self.abilities.update(ability_names)
+            self.types.update(type_names)
+            self.stats.update(stat_names)
+
+    def __getitem__(self, index: int) -> Pokemon:
+        with self._lock:
+            data = self.pokemon.data
+            return Pokemon(
+                id=data["id_pokes"][index],
+                name=data["name"][index],
+                base_experience=_decode(data["base_experience"][index]),
+                height=_decode(data["height"][index]),
+                weight=_decode(data["weight"][index]),
+                poke_order=_decode(data["poke_order"][index]),
+            )
+
+    # -------- EXPORT --------
+    def rows(self, table: str) -> Iterator[tuple]:
+        """Rows for a BulkLoader table, produced lazily from the column buffers"""
+        links = {
+            "pokes": (self.pokemon, ("id_pokes", "name", "base_experience", "height", "weight", "poke_order")),
+            "pokes_ability": (self.ability_links, ("ability_url_id", "id_pokes")),
+            "pokes_type": (self.type_links, ("type_url_id", "id_pokes", "slot")),
+            "pokes_stat": (self.stat_links, ("stat_url_id", "id_pokes", "base_stat", "effort")),
+        }
+        with self._lock:
+            if table in links:
+                columns, names = links[table]
+                return columns.rows(names, len(columns))
+            lookup = sorted({"ability": self.abilities, "types": self.types, "stats": self.stats}[table].items())
+        if table == "ability":
+            return ((name, url, url_id) for url_id, (name, url) in lookup)
+        return ((url_id, name) for url_id, (name, _) in lookup)
+
+    def rows_by_table(self) -> Dict[str, Iterator[tuple]]:
+        tables = ("ability", "types", "stats", "pokes", "pokes_ability", "pokes_type", "pokes_stat")
+        return {table: self.rows(table) for table in tables}
+
+    def write_tsv(self, table: str, f: TextIO) -> int:
+        """Export one table in COPY text format (tab separated, \\N for null); returns rows written"""
+        count = 0
+        for row in self.rows(table):
+            f.write("\t".join("\\N" if v is None else str(v).translate(_COPY_ESCAPES) for v in row))
+            f.write("\n")
+            count += 1
+        return count
+
+    def nbytes(self) -> int:
+        """Bytes held by the int column buffers"""
+        return sum(
+            values.itemsize * len(values)
+            for columns in (self.pokemon, self.ability_links, self.type_links, self.stat_links)
+            for values in columns.data.values()
+            if isinstance(values, array)
+        )
@@ -1,4 +1,7 @@
+from typing import Iterable, Optional
+
 from etl.pokemon.pokemon import Pokemon
+from etl.pokemon.pokemon_batch import PokemonBatch
 
 
 class PokemonFactory:
@@ -13,3 +16,10 @@ class PokemonFactory:
             weight=data["weight"],
             poke_order=data["order"]
         )
+
+    @staticmethod
+    def to_batch(documents: Iterable[dict], batch: Optional[PokemonBatch] = None) -> PokemonBatch:
+        """Append API documents, with their ability/type/stat links, to a columnar batch"""
+        batch = batch if batch is not None else PokemonBatch()
+        batch.extend(documents)
+        return batch
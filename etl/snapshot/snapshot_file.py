@@ -0,0 +1,332 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from etl.pack.pack_file import name_key
+from etl.pokemon.pokemon_batch import MISSING
+
+# Snapshot file: compressed column blocks, then the uncompressed index, then a JSON directory and a footer
+# pointing at it. Rows are partitioned by id_pokes // width; each partition holds its pokemon and their media,
+# so an incremental rebuild copies the blocks of unchanged partitions byte for byte.
+SNAPSHOT_MAGIC = b"PKSN"
+SNAPSHOT_VERSION = 1
+FOOTER = struct.Struct("<Q4sH")  # directory offset, magic, version
+SLOT = struct.Struct("<QI")  # key, row (EMPTY = free slot)
+SORTED_ID = struct.Struct("<i")
+EMPTY = 0xFFFFFFFF
+UNMATCHED = -1  # partition of poke_media rows whose name matches no pokes row
+
+# (column, kind): "i" = int32 with MISSING for NULL, "s" = utf-8 strings, "z" = strings with "" for NULL
+POKES_COLUMNS = (
+    ("id_pokes", "i"), ("name", "s"), ("base_experience", "i"), ("height", "i"),
+    ("weight", "i"), ("poke_order", "i"), ("media_start", "i"), ("media_count", "i"),
+)
+MEDIA_COLUMNS = (("name", "s"), ("media_url", "s"), ("content_hash", "z"))
+PUBLIC_COLUMNS = tuple(column for column, _ in POKES_COLUMNS[:6])
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK = (1 << 64) - 1
+
+
+def _slot_of(key: int, bits: int) -> int:
+    return ((key * _GOLDEN) & _MASK) >> (64 - bits)
+
+
+def _id_key(pokemon_id: int) -> int:
+    return pokemon_id & _MASK
+
+
+# -------- COLUMN ENCODING --------
+def encode_column(kind: str, values: Sequence) -> bytes:
+    if kind == "i":
+        return array("i", (MISSING if v is None else v for v in values)).tobytes()
+    encoded = [("" if v is None else v).encode() for v in values]
+    offsets = array("I", [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return offsets.tobytes() + b"".join(encoded)
+
+
+def decode_column(kind: str, data: bytes, count: int) -> list:
+    if kind == "i":
+        values = array("i")
+        values.frombytes(data)
+        return [None if v == MISSING else v for v in values]
+    offsets = array("I")
+    offsets.frombytes(data[:4 * (count + 1)])
+    blob = data[4 * (count + 1):]
+    values = [blob[offsets[i]:offsets[i + 1]].decode() for i in range(count)]
+    return [v or None for v in values] if kind == "z" else values
+
+
+def _hash_slots(keys: List[int]) -> Tuple[bytes, int]:
+    """Open-addressing table (linear probing, load <= 0.5) mapping key -> row"""
+    bits = max(3, (2 * len(keys) - 1).bit_length())
+    table = [(0, EMPTY)] * (1 << bits)
+    for row, key in enumerate(keys):
+        slot = _slot_of(key, bits)
+        while table[slot][1] != EMPTY:
+            slot = (slot + 1) & ((1 << bits) - 1)
+        table[slot] = (key, row)
+    return b"".join(SLOT.pack(key, row) for key, row in table), bits
+
+
+class SnapshotWriter:
+    """Writes a snapshot partition by partition to a temp file and swaps it in on finish()"""
+
+    def __init__(self, path: str, width: int, level: int = 6):
+        self.path = path
+        self.width = width
+        self.level = level
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._ids: List[int] = []
+        self._names: List[str] = []
+        self.partitions: List[dict] = []
+        self.media_rows = 0
+
+    def _align(self) -> int:
+        pad = -self._file.tell() % 8
+        self._file.write(b"\0" * pad)
+        return self._file.tell()
+
+    def _write_block(self, data: bytes) -> List[int]:
+        offset = self._file.tell()
+        compressed = zlib.compress(data, self.level)
+        self._file.write(compressed)
+        return [offset, len(compressed)]
+
+    def add_partition(self, part: int, fingerprint: str, pokes: Sequence[tuple], media: Sequence[tuple]) -> None:
+        """pokes: (id_pokes, name, base_experience, height, weight, poke_order) sorted by id;
+        media: (id_pokes or None, name, media_url, content_hash) sorted by id then url"""
+        spans: Dict[int, List[int]] = {}
+        for i, (owner_id, *_rest) in enumerate(media):
+            span = spans.setdefault(owner_id, [i, 0])
+            span[1] += 1
+        rows = [(*row, *spans.get(row[0], (0, 0))) for row in pokes]
+
+        blocks = {"pokes": {}, "media": {}}
+        for index, (column, kind) in enumerate(POKES_COLUMNS):
+            blocks["pokes"][column] = self._write_block(encode_column(kind, [row[index] for row in rows]))
+        for index, (column, kind) in enumerate(MEDIA_COLUMNS, start=1):
+            blocks["media"][column] = self._write_block(encode_column(kind, [row[index] for row in media]))
+        self._add_entry(part, fingerprint, len(pokes), len(media), blocks)
+        self._ids.extend(row[0] for row in pokes)
+        self._names.extend(row[1] for row in pokes)
+
+    def copy_partition(self, reader: "SnapshotReader", part: int) -> None:
+        """Reuse an unchanged partition of an older snapshot without decompressing it"""
+        entry = reader.partition(part)
+        blocks = {"pokes": {}, "media": {}}
+        for table, columns in entry["blocks"].items():
+            for column, (offset, length) in columns.items():
+                blocks[table][column] = [self._file.tell(), length]
+                self._file.write(reader.raw(offset, length))
+        self._add_entry(part, entry["fingerprint"], entry["rows"], entry["media_rows"], blocks)
+        start = entry["start_row"]
+        for row in range(start, start + entry["rows"]):
+            self._ids.append(reader.id_at(row))
+            self._names.append(reader.name_at(row))
+
+    def _add_entry(self, part: int, fingerprint: str, rows: int, media_rows: int, blocks: dict) -> None:
+        self.partitions.append({
+            "part": part, "fingerprint": fingerprint, "start_row": len(self._ids),
+            "rows": rows, "media_rows": media_rows, "blocks": blocks,
+        })
+        self.media_rows += media_rows
+
+    def finish(self) -> int:
+        """Write index, directory and footer, then atomically replace the old snapshot; returns the file size"""
+        index = {}
+        offset = self._align()
+        self._file.write(array("i", self._ids).tobytes())
+        index["sorted_ids"] = [offset, len(self._ids)]
+
+        for name, keys in (("id_slots", [_id_key(i) for i in self._ids]), ("name_slots", [name_key(n) for n in self._names])):
+            table, bits = _hash_slots(keys)
+            offset = self._align()
+            self._file.write(table)
+            index[name] = [offset, bits]
+
+        offset = self._align()
+        self._file.write(encode_column("s", self._names))
+        index["names"] = [offset, len(self._names)]
+
+        directory = {
+            "version": SNAPSHOT_VERSION,
+            "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "width": self.width,
+            "rows": len(self._ids),
+            "media_rows": self.media_rows,
+            "partitions": self.partitions,
+            "index": index,
+        }
+        directory_offset = self._file.tell()
+        self._file.write(json.dumps(directory, separators=(",", ":")).encode())
+        self._file.write(FOOTER.pack(directory_offset, SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+        size = self._file.tell()
+        self._file.close()
+        # Readers that already mapped the old file keep reading it until they reopen
+        os.replace(self._tmp_path, self.path)
+        return size
+
+    def abort(self) -> None:
+        self._file.close()
+        os.remove(self._tmp_path)
+
+
+class SnapshotReader:
+    """Read-only view of a snapshot: O(1) lookups by id or name through the mmap'd hash index, range scans over
+    the sorted id column; column blocks are decompressed per partition on demand and kept in a small LRU"""
+
+    def __init__(self, path: str, cached_blocks: int = 64):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        directory_offset, magic, version = FOOTER.unpack_from(self._mm, len(self._mm) - FOOTER.size)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} snapshot")
+        self.directory = json.loads(self._mm[directory_offset:len(self._mm) - FOOTER.size])
+        self.width = self.directory["width"]
+        self.built_at = self.directory["built_at"]
+        self.partitions = self.directory["partitions"]
+        self._by_part = {entry["part"]: entry for entry in self.partitions}
+        # Partitions without pokes rows (UNMATCHED) never own a row, so they stay out of the row -> partition map
+        self._owners = [entry for entry in self.partitions if entry["rows"]]
+        self._starts = [entry["start_row"] for entry in self._owners]
+
+        index = self.directory["index"]
+        self._ids_offset, self.count = index["sorted_ids"]
+        self._id_slots, self._id_bits = index["id_slots"]
+        self._name_slots, self._name_bits = index["name_slots"]
+        names_offset, _ = index["names"]
+        self._name_offsets = names_offset
+        self._names_blob = names_offset + 4 * (self.count + 1)
+
+        self._cache: "OrderedDict[tuple, list]" = OrderedDict()
+        self._cached_blocks = cached_blocks
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -------- INDEX --------
+    def id_at(self, row: int) -> int:
+        return SORTED_ID.unpack_from(self._mm, self._ids_offset + row * SORTED_ID.size)[0]
+
+    def name_at(self, row: int) -> str:
+        start, end = struct.unpack_from("<II", self._mm, self._name_offsets + 4 * row)
+        return self._mm[self._names_blob + start:self._names_blob + end].decode()
+
+    def _probe(self, table_offset: int, bits: int, key: int) -> Iterator[int]:
+        slot = _slot_of(key, bits)
+        while True:
+            slot_key, row = SLOT.unpack_from(self._mm, table_offset + slot * SLOT.size)
+            if row == EMPTY:
+                return
+            if slot_key == key:
+                yield row
+            slot = (slot + 1) & ((1 << bits) - 1)
+
+    def row_of_id(self, pokemon_id: int) -> Optional[int]:
+        return next(self._probe(self._id_slots, self._id_bits, _id_key(pokemon_id)), None) if self.count else None
+
+    def row_of_name(self, name: str) -> Optional[int]:
+        if not self.count:
+            return None
+        # 64-bit name hashes can collide in theory; the names column settles it
+        for row in self._probe(self._name_slots, self._name_bits, name_key(name)):
+            if self.name_at(row) == name:
+                return row
+        return None
+
+    # -------- BLOCKS --------
+    def partition(self, part: int) -> dict:
+        return self._by_part[part]
+
+    def raw(self, offset: int, length: int) -> bytes:
+        return self._mm[offset:offset + length]
+
+    def _column(self, entry: dict, table: str, column: str) -> list:
+        key = (entry["part"], table, column)
+        values = self._cache.get(key)
+        if values is not None:
+            self._cache.move_to_end(key)
+            return values
+        kind = dict(POKES_COLUMNS if table == "pokes" else MEDIA_COLUMNS)[column]
+        offset, length = entry["blocks"][table][column]
+        count = entry["rows"] if table == "pokes" else entry["media_rows"]
+        values = decode_column(kind, zlib.decompress(self._mm[offset:offset + length]), count)
+        self._cache[key] = values
+        if len(self._cache) > self._cached_blocks:
+            self._cache.popitem(last=False)
+        return values
+
+    def _locate(self, row: int) -> Tuple[dict, int]:
+        entry = self._owners[bisect.bisect_right(self._starts, row) - 1]
+        return entry, row - entry["start_row"]
+
+    def row(self, row: int, columns: Sequence[str] = PUBLIC_COLUMNS) -> dict:
+        entry, i = self._locate(row)
+        return {column: self._column(entry, "pokes", column)[i] for column in columns}
+
+    # -------- LOOKUPS --------
+    def get(self, pokemon_id: int, columns: Sequence[str] = PUBLIC_COLUMNS) -> Optional[dict]:
+        row = self.row_of_id(pokemon_id)
+        return None if row is None else self.row(row, columns)
+
+    def by_name(self, name: str, columns: Sequence[str] = PUBLIC_COLUMNS) -> Optional[dict]:
+        row = self.row_of_name(name)
+        return None if row is None else self.row(row, columns)
+
+    def range(self, low: int, high: int, columns: Sequence[str] = PUBLIC_COLUMNS) -> Iterator[dict]:
+        """Pokemon with low <= id_pokes <= high, in id order"""
+        row = bisect.bisect_left(_SortedIds(self), low)
+        while row < self.count and self.id_at(row) <= high:
+            yield self.row(row, columns)
+            row += 1
+
+    def media(self, key: Union[int, str]) -> List[dict]:
+        """poke_media rows of a pokemon, by id or name"""
+        row = self.row_of_id(key) if isinstance(key, int) else self.row_of_name(key)
+        if row is not None:
+            entry, i = self._locate(row)
+            start = self._column(entry, "pokes", "media_start")[i]
+            count = self._column(entry, "pokes", "media_count")[i]
+            rows = range(start, start + count)
+        elif isinstance(key, str) and UNMATCHED in self._by_part:
+            entry = self._by_part[UNMATCHED]
+            rows = [i for i, name in enumerate(self._column(entry, "media", "name")) if name == key]
+        else:
+            return []
+        columns = {column: self._column(entry, "media", column) for column, _ in MEDIA_COLUMNS}
+        return [{column: values[i] for column, values in columns.items()} for i in rows]
+
+    def close(self) -> None:
+        self._cache.clear()
+        self._mm.close()
+
+
+class _SortedIds:
+    """Sequence view over the mmap'd sorted id column so bisect can search it in place"""
+
+    def __init__(self, reader: SnapshotReader):
+        self.reader = reader
+
+    def __len__(self) -> int:
+        return self.reader.count
+
+    def __getitem__(self, row: int) -> int:
+        return self.reader.id_at(row)
@@ -0,0 +1,246 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from etl.pack.pack_file import RECORD_HEADER
+from utils.logger import logger
+from utils.metrics import metrics
+from utils.settings import IMAGE_CACHE_DIR
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+GIF_SIGNATURES = (b"GIF87a", b"GIF89a")
+# Text and timestamp chunks don't affect pixels; colour chunks (gAMA, iCCP, sRGB, ...) are kept
+_DROP_CHUNKS = {b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+_KEEP_ORIGINAL = "="
+
+
+class Optimized(NamedTuple):
+    body: bytes
+    variants: Dict[str, bytes]  # file suffix (".webp", "_thumb96.png") -> bytes
+    cpu_seconds: float
+    cached: bool
+
+
+# -------- PNG --------
+def _png_chunks(data: bytes):
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack_from(">I4s", data, pos)
+        yield chunk_type, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if chunk_type == b"IEND":
+            return
+
+
+def _png_chunk(chunk_type: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", len(body)) + chunk_type + body + struct.pack(">I", zlib.crc32(chunk_type + body))
+
+
+def _deflate(raw: bytes, level: int, strategy: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, strategy)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def recompress_png(data: bytes, level: int = 9) -> bytes:
+    """Lossless: same pixels and filters, IDAT re-deflated at max effort into one chunk, text chunks dropped"""
+    if not data.startswith(PNG_SIGNATURE):
+        return data
+    chunks = list(_png_chunks(data))
+    raw = zlib.decompress(b"".join(body for chunk_type, body in chunks if chunk_type == b"IDAT"))
+    idat = min((_deflate(raw, level, strategy) for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED)), key=len)
+
+    out = [PNG_SIGNATURE]
+    for chunk_type, body in chunks:
+        if chunk_type in _DROP_CHUNKS:
+            continue
+        if chunk_type == b"IDAT":
+            if idat is not None:
+                out.append(_png_chunk(b"IDAT", idat))
+                idat = None
+            continue
+        out.append(_png_chunk(chunk_type, body))
+    result = b"".join(out)
+    return result if len(result) < len(data) else data
+
+
+# -------- VARIANTS (Pillow) --------
+def _variants(data: bytes, thumbnail: Optional[int], webp: bool) -> Dict[str, bytes]:
+    from PIL import Image
+
+    variants = {}
+    with Image.open(io.BytesIO(data)) as image:
+        if webp:
+            buf = io.BytesIO()
+            image.save(buf, "WEBP", lossless=True, save_all=getattr(image, "is_animated", False))
+            variants[".webp"] = buf.getvalue()
+        if thumbnail:
+            thumb = image.copy()
+            thumb.thumbnail((thumbnail, thumbnail))
+            buf = io.BytesIO()
+            thumb.save(buf, "PNG", optimize=True)
+            variants[f"_thumb{thumbnail}.png"] = buf.getvalue()
+    return variants
+
+
+def optimize_bytes(data: bytes, level: int = 9, thumbnail: Optional[int] = None, webp: bool = False) -> Optimized:
+    """Runs in a worker process; anything it can't parse (SVG, broken files) comes back unchanged"""
+    start = time.process_time()
+    body = data
+    variants = {}
+    try:
+        body = recompress_png(data, level)
+    except (zlib.error, struct.error):
+        pass
+    if (thumbnail or webp) and (data.startswith(PNG_SIGNATURE) or data.startswith(GIF_SIGNATURES)):
+        try:
+            variants = _variants(data, thumbnail, webp)
+        except (OSError, ValueError):
+            pass
+    return Optimized(body, variants, time.process_time() - start, False)
+
+
+class ImageOptimizer:
+    """Optimizes media on a process pool so the CPU work stays off the download threads; results cached by content hash"""
+
+    def __init__(
+            self,
+            workers: Optional[int] = None,
+            cache_dir: str = IMAGE_CACHE_DIR,
+            level: int = 9,
+            thumbnail: Optional[int] = None,
+            webp: bool = False,
+    ):
+        if thumbnail or webp:
+            try:
+                import PIL  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Thumbnails and WebP variants need Pillow (pip install Pillow)")
+        self.level = level
+        self.thumbnail = thumbnail
+        self.webp = webp
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        # spawn: workers don't inherit the downloader's threads, sockets or locks
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+        # Cached results depend on the options too, not just the input bytes
+        self.signature = f"l{level}-t{thumbnail or 0}-w{int(webp)}"
+
+        self._lock = threading.Lock()
+        self.files = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.variant_bytes = 0
+        self.cpu_seconds = 0.0
+
+    # -------- CACHE --------
+    def _cache_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{self.signature}")
+
+    def _load(self, digest: str, data: bytes) -> Optional[Optimized]:
+        try:
+            with open(self._cache_path(digest), "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return None
+        body, variants, pos = data, {}, 0
+        while pos < len(blob):
+            name_len, body_len = RECORD_HEADER.unpack_from(blob, pos)
+            pos += RECORD_HEADER.size
+            name = blob[pos:pos + name_len].decode()
+            value = blob[pos + name_len:pos + name_len + body_len]
+            pos += name_len + body_len
+            if name == "":
+                body = value
+            elif name != _KEEP_ORIGINAL:
+                variants[name] = value
+        return Optimized(body, variants, 0.0, True)
+
+    def _store(self, digest: str, data: bytes, result: Optimized) -> None:
+        # Same record layout as a pack; an unchanged body is stored as a marker instead of a second copy
+        records = [(_KEEP_ORIGINAL, b"") if result.body == data else ("", result.body), *result.variants.items()]
+        path = self._cache_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            for name, value in records:
+                encoded = name.encode()
+                f.write(RECORD_HEADER.pack(len(encoded), len(value)))
+                f.write(encoded)
+                f.write(value)
+        os.replace(tmp_path, path)
+
+    # -------- OPTIMIZE --------
+    def _account(self, data: bytes, result: Optimized) -> None:
+        variant_bytes = sum(len(value) for value in result.variants.values())
+        with self._lock:
+            self.files += 1
+            self.cache_hits += result.cached
+            self.bytes_in += len(data)
+            self.bytes_out += len(result.body)
+            self.variant_bytes += variant_bytes
+            self.cpu_seconds += result.cpu_seconds
+        metrics.inc("optimize_files_total", cached=str(result.cached).lower())
+        metrics.inc("optimize_bytes_saved_total", len(data) - len(result.body))
+        metrics.inc("optimize_cpu_seconds_total", result.cpu_seconds)
+
+    def submit(self, data: bytes) -> "Future[Optimized]":
+        """Future for the optimized body and variants; cache hits resolve without touching the pool"""
+        digest = hashlib.sha256(data).hexdigest()
+        cached = self._load(digest, data)
+        if cached is not None:
+            future: Future = Future()
+            future.set_result(cached)
+            self._account(data, cached)
+            return future
+
+        future = self.pool.submit(optimize_bytes, data, self.level, self.thumbnail, self.webp)
+
+        def done(f: Future) -> None:
+            if f.exception() is None:
+                self._store(digest, data, f.result())
+                self._account(data, f.result())
+
+        future.add_done_callback(done)
+        return future
+
+    def optimize(self, data: bytes) -> Optimized:
+        """Optimized result, or the input unchanged if the pool failed; optimizing never fails a download"""
+        try:
+            return self.submit(data).result()
+        except Exception as e:
+            metrics.inc("optimize_failures_total", error=type(e).__name__)
+            logger.warning(f"Image optimization failed, keeping the original: {e}")
+            return Optimized(data, {}, 0.0, False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": self.files,
+                "cache_hits": self.cache_hits,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "variant_bytes": self.variant_bytes,
+                "cpu_seconds": self.cpu_seconds,
+            }
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+
+def variant_path(path: str, suffix: str) -> str:
+    """downloads/x/front_default_x.png + ".webp" -> downloads/x/front_default_x.webp"""
+    return os.path.splitext(path)[0] + suffix
+
+
+def split_variants(path: str, result: Optimized) -> Tuple[Tuple[str, bytes], ...]:
+    """(path, bytes) for the optimized file followed by each variant"""
+    return ((path, result.body), *((variant_path(path, suffix), value) for suffix, value in result.variants.items()))
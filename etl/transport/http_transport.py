@@ -0,0 +1,219 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.metrics import metrics
+from utils.settings import (
+    GCS_MAX_CONNECTIONS,
+    GCS_RPS,
+    GITHUB_RAW_MAX_CONNECTIONS,
+    GITHUB_RAW_RPS,
+    POKEAPI_MAX_CONNECTIONS,
+    POKEAPI_RPS,
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class HostPolicy:
+    rate: float
+    burst: int
+    max_connections: int
+
+
+HOST_POLICIES: Dict[str, HostPolicy] = {
+    "pokeapi.co": HostPolicy(POKEAPI_RPS, int(POKEAPI_RPS), POKEAPI_MAX_CONNECTIONS),
+    "raw.githubusercontent.com": HostPolicy(GITHUB_RAW_RPS, int(GITHUB_RAW_RPS), GITHUB_RAW_MAX_CONNECTIONS),
+    "storage.googleapis.com": HostPolicy(GCS_RPS, int(GCS_RPS), GCS_MAX_CONNECTIONS),
+}
+DEFAULT_POLICY = HostPolicy(rate=1000, burst=1000, max_connections=256)
+
+
+class TokenBucket:
+    """Blocking token bucket; pause() stops every caller until a Retry-After has passed"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _timeout_seconds(timeout) -> Optional[float]:
+    """Longest single wait a requests timeout allows (a float or a (connect, read) tuple), None if unbounded"""
+    if isinstance(timeout, tuple):
+        timeout = max((t for t in timeout if t is not None), default=None)
+    return float(timeout) if isinstance(timeout, (int, float)) else None
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter for one host: token-bucket rate, capped connection pool and jittered retries honoring Retry-After"""
+
+    def __init__(
+            self,
+            policy: HostPolicy,
+            host: str = "*",
+            max_retries: int = 3,
+            backoff_base: float = 0.5,
+            backoff_cap: float = 30.0,
+    ):
+        # pool_block=True turns pool_maxsize into a hard per-host connection cap
+        super().__init__(
+            pool_connections=16,
+            pool_maxsize=policy.max_connections,
+            pool_block=True,
+            max_retries=Retry(total=0, read=False, redirect=5, raise_on_status=False, raise_on_redirect=False),
+        )
+        self.policy = policy
+        self.host = host
+        self.bucket = TokenBucket(policy.rate, policy.burst)
+        self.retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._stats_lock = threading.Lock()
+        self.requests_sent = 0
+        self.retries_done = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps many threads from retrying in lockstep
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _past(give_up_at: Optional[float], delay: float) -> bool:
+        return give_up_at is not None and time.monotonic() + delay > give_up_at
+
+    @staticmethod
+    def _replayable(request: requests.PreparedRequest) -> bool:
+        return request.body is None or isinstance(request.body, (bytes, str))
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        # The caller's timeout (already capped by the run deadline) also bounds the time spent waiting to retry
+        budget = _timeout_seconds(kwargs.get("timeout"))
+        give_up_at = None if budget is None else time.monotonic() + budget
+        while True:
+            self.bucket.acquire()
+            with self._stats_lock:
+                self.requests_sent += 1
+            can_retry = attempt < self.retries and self._replayable(request)
+            if isinstance(request.body, (bytes, str)):
+                metrics.inc("http_bytes_out_total", len(request.body), host=self.host)
+            start = time.perf_counter()
+            try:
+                with metrics.in_flight("http_in_flight", host=self.host):
+                    response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.observe("http_request_seconds", time.perf_counter() - start, host=self.host)
+                metrics.inc("http_requests_total", host=self.host, status=type(e).__name__)
+                delay = self._backoff(attempt)
+                if not can_retry or self._past(give_up_at, delay):
+                    raise
+            else:
+                # Time to response headers; streamed bodies are counted by whoever reads them
+                metrics.observe("http_request_seconds", time.perf_counter() - start, host=self.host)
+                metrics.inc("http_requests_total", host=self.host, status=str(response.status_code))
+                if response.status_code not in RETRY_STATUSES or not can_retry:
+                    return response
+                retry_after = retry_after_seconds(response)
+                if retry_after is not None:
+                    # The host told us when to come back: hold every thread using this host, not just this one
+                    self.bucket.pause(min(retry_after, self.backoff_cap))
+                    delay = retry_after
+                else:
+                    delay = self._backoff(attempt)
+                if delay > self.backoff_cap or self._past(give_up_at, delay):
+                    # Waiting that long would outlive the cap or the caller's deadline: hand back the 429/503
+                    return response
+                response.close()
+
+            with self._stats_lock:
+                self.retries_done += 1
+            attempt += 1
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"requests": self.requests_sent, "retries": self.retries_done}
+
+
+_adapters: Dict[str, RateLimitedAdapter] = {}
+_adapters_lock = threading.Lock()
+
+
+def get_adapter(host: str) -> RateLimitedAdapter:
+    """The single adapter (bucket + connection pool) every session in this process uses for a host"""
+    with _adapters_lock:
+        if host not in _adapters:
+            _adapters[host] = RateLimitedAdapter(HOST_POLICIES.get(host, DEFAULT_POLICY), host=host)
+        return _adapters[host]
+
+
+def mount_shared_adapters(session: requests.Session, *urls: str) -> requests.Session:
+    """Route the known hosts (plus the hosts of any extra urls) through the process-wide adapters"""
+    # Any other host shares one fallback budget
+    fallback = get_adapter("*")
+    session.mount("https://", fallback)
+    session.mount("http://", fallback)
+
+    hosts = set(HOST_POLICIES)
+    hosts.update(urlsplit(url).netloc for url in urls if url)
+    for host in hosts:
+        adapter = get_adapter(host)
+        session.mount(f"https://{host}/", adapter)
+        session.mount(f"http://{host}/", adapter)
+    return session
+
+
+def new_session(*urls: str) -> requests.Session:
+    session = requests.Session()
+    session.headers.update({"User-Agent": "Pokemon-ETL/1.0"})
+    return mount_shared_adapters(session, *urls)
+
+
+def transport_stats() -> Dict[str, dict]:
+    with _adapters_lock:
+        adapters = dict(_adapters)
+    return {host: adapter.stats() for host, adapter in adapters.items()}
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import storage
+
+from etl.upload.spooled_upload import spool, upload_file
+from utils.helper import HashingReader
+from utils.logger import logger
+
+CONTENT_PREFIX = "media"
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    digest: str
+    path: str  # where the bytes live: media/<hh>/<sha256><ext>
+    public_url: str
+
+
+class ContentAddressedStore:
+    """Uploads each distinct blob of bytes once under media/<sha256> and remembers which names point at it.
+    A name is the blob path the file would have had without dedup (pokemon/<name>/sprites/<file>)."""
+
+    def __init__(self, bucket: storage.Bucket, loader=None, flush_every: int = 5000):
+        self.bucket = bucket
+        self.loader = loader
+        self.flush_every = flush_every
+
+        self._lock = threading.Lock()
+        self._known: Optional[set] = None
+        self._in_flight = {}
+        self.mappings: List[Tuple[str, str, str]] = []
+
+        self.uploads = 0
+        self.uploads_saved = 0
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def blob_path(digest: str, ext: str) -> str:
+        return f"{CONTENT_PREFIX}/{digest[:2]}/{digest}{ext}"
+
+    def _load_known(self) -> set:
+        # One listing of the content prefix replaces an existence check per new hash
+        known = set()
+        for blob in self.bucket.client.list_blobs(self.bucket, prefix=f"{CONTENT_PREFIX}/"):
+            known.add(os.path.basename(blob.name))
+        logger.info(f"Content store: {len(known):,} objects already in gs://{self.bucket.name}/{CONTENT_PREFIX}")
+        return known
+
+    def put_stream(
+            self,
+            stream: BinaryIO,
+            name: str,
+            pokemon_name: str,
+            content_type: Optional[str] = None,
+            chunk_size: int = 65536,
+    ) -> StoredBlob:
+        """Copy a stream into a spooled temp file (in memory up to SPOOL_BYTES), hashing it on the way, then upload
+        it if the content is new and record name -> sha256. A sha256 HashingReader that has not been read yet is
+        used as is, so a body the caller already hashes is not hashed twice"""
+        fresh = isinstance(stream, HashingReader) and stream.algorithm == "sha256" and stream.size == 0
+        reader = stream if fresh else HashingReader(stream)
+        spooled, size = spool(reader, chunk_size)
+        with spooled:
+            return self._put(
+                reader.hexdigest(), size, name, pokemon_name,
+                lambda blob: upload_file(blob, spooled, size, content_type, if_generation_match=0),
+            )
+
+    def put_file(self, file_path: str, name: str, pokemon_name: str, chunk_size: int = 65536) -> StoredBlob:
+        """Like put_stream, but the file on disk is hashed in one pass and uploaded from itself"""
+        with open(file_path, "rb") as f:
+            reader = HashingReader(f)
+            while reader.read(chunk_size):
+                pass
+            f.seek(0)
+            return self._put(
+                reader.hexdigest(), reader.size, name, pokemon_name,
+                lambda blob: upload_file(blob, f, reader.size, if_generation_match=0),
+            )
+
+    def put_bytes(
+            self,
+            data: bytes,
+            name: str,
+            pokemon_name: str,
+            content_type: Optional[str] = None,
+            digest: Optional[str] = None,
+    ) -> StoredBlob:
+        digest = digest or hashlib.sha256(data).hexdigest()
+        return self._put(
+            digest, len(data), name, pokemon_name,
+            lambda blob: blob.upload_from_string(data, content_type=content_type, if_generation_match=0),
+        )
+
+    def _put(
+            self,
+            digest: str,
+            size: int,
+            name: str,
+            pokemon_name: str,
+            upload: Callable[[storage.Blob], None],
+    ) -> StoredBlob:
+        """Run upload(blob) unless media/<digest> exists or is being uploaded by another thread, then record name"""
+        path = self.blob_path(digest, os.path.splitext(name)[1])
+        key = os.path.basename(path)
+        blob = self.bucket.blob(path)
+
+        with self._lock:
+            if self._known is None:
+                self._known = self._load_known()
+            duplicate = key in self._known
+            waiter = self._in_flight.get(key)
+            if not duplicate and waiter is None:
+                self._in_flight[key] = threading.Event()
+
+        if waiter is not None:
+            # Same bytes are being uploaded by another thread right now
+            waiter.wait()
+            with self._lock:
+                if key not in self._known:
+                    raise RuntimeError(f"Concurrent upload of {path} failed")
+            duplicate = True
+
+        if duplicate:
+            with self._lock:
+                self.uploads_saved += 1
+                self.bytes_saved += size
+        else:
+            stored = False
+            try:
+                upload(blob)
+                stored = True
+                with self._lock:
+                    self.uploads += 1
+                    self.bytes_uploaded += size
+            except PreconditionFailed:
+                # Another process won the race; the object is already there
+                stored = True
+                with self._lock:
+                    self.uploads_saved += 1
+                    self.bytes_saved += size
+            finally:
+                with self._lock:
+                    if stored:
+                        self._known.add(key)
+                    self._in_flight.pop(key).set()
+
+        self._record(pokemon_name, name, digest)
+        return StoredBlob(digest, path, blob.public_url)
+
+    def _record(self, pokemon_name: str, name: str, digest: str) -> None:
+        # Keyed by the name, not the content url: identical sprites of one pokemon stay separate rows
+        if not self.loader:
+            return
+        with self._lock:
+            self.mappings.append((pokemon_name, self.bucket.blob(name).public_url, digest))
+            if len(self.mappings) < self.flush_every:
+                return
+            rows, self.mappings = self.mappings, []
+        self.loader.load("poke_media", rows)
+
+    def flush(self) -> None:
+        with self._lock:
+            rows, self.mappings = self.mappings, []
+        if self.loader and rows:
+            self.loader.load("poke_media", rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "uploads_saved": self.uploads_saved,
+                "bytes_uploaded": self.bytes_uploaded,
+                "bytes_saved": self.bytes_saved,
+            }
@@ -1,47 +1,197 @@
+import base64
 import os
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import google.auth
+import google_crc32c
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage
+from google.cloud.storage.retry import DEFAULT_RETRY
 
+from etl.pack.pack_file import index_path
+from etl.transport.http_transport import mount_shared_adapters
+from etl.upload.content_store import ContentAddressedStore
+from etl.upload.spooled_upload import spool, upload_file
 from utils.logger import logger
+from utils.metrics import metrics
 from utils.settings import PROJECT_ID, BUCKET_NAME
 
+UPLOADED = "uploaded"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+@dataclass
+class UploadResult:
+    local_path: str
+    blob_path: str
+    status: str
+    public_url: Optional[str] = None
+    error: Optional[str] = None
+
+
+def gcs_client(project: str = PROJECT_ID, credentials=None, **kwargs) -> storage.Client:
+    """Storage client whose authorized session goes through the same per-host budget as the PokeAPI and sprite
+    downloads"""
+    if credentials is None:
+        credentials, _ = google.auth.default(scopes=storage.Client.SCOPE)
+    session = mount_shared_adapters(AuthorizedSession(credentials))
+    return storage.Client(project=project, credentials=credentials, _http=session, **kwargs)
+
 
 class MediaUploader:
 
-    def __init__(self, client: Optional[storage.Client] = None):
-        self.client = client or storage.Client(project=PROJECT_ID)
+    def __init__(self, client: Optional[storage.Client] = None, dedup: bool = False, loader=None):
+        self.client = client or gcs_client()
         self.bucket = self.client.bucket(BUCKET_NAME)
-    
-    def upload_folder(self, local_folder: str, pokemon_name: str) -> List[str]:
+        # With dedup, identical bytes are stored once under media/<sha256> whatever name they arrive with
+        self.content_store = ContentAddressedStore(self.bucket, loader=loader) if dedup else None
+
+    def upload_folder(self, local_folder: str, pokemon_name: str, workers: int = 8) -> List[str]:
+        """Upload the files directly in local_folder, delete them once stored and return their public urls"""
         if not os.path.isdir(local_folder):
             return []
 
-        gcs_urls = []
-        files_uploaded = 0
-
-        try:
-            for filename in os.listdir(local_folder):
-                file_path = os.path.join(local_folder, filename)
-
-                if not os.path.isfile(file_path):
-                    continue
-
-                blob_path = f"pokemon/{pokemon_name}/{filename}"
-                blob = self.bucket.blob(blob_path)
-                try:
-                    blob.upload_from_filename(file_path)
-                    gcs_urls.append(blob.public_url)
-                    files_uploaded += 1
-                    os.remove(file_path)
-                except Exception:
-                    pass
+        files = [
+            (os.path.join(local_folder, filename), f"pokemon/{pokemon_name}/{filename}")
+            for filename in os.listdir(local_folder)
+            if os.path.isfile(os.path.join(local_folder, filename))
+        ]
+        results = self.upload_files(files, workers=workers)
 
+        gcs_urls = []
+        for result in results:
+            if result.status == FAILED:
+                continue
+            gcs_urls.append(result.public_url)
             try:
-                if not os.listdir(local_folder):
-                    os.rmdir(local_folder)
-            except Exception:
+                os.remove(result.local_path)
+            except OSError:
                 pass
-        except Exception:
-            pass
 
+        try:
+            if not os.listdir(local_folder):
+                os.rmdir(local_folder)
+        except OSError:
+            pass
         return gcs_urls
+
+    def upload_tree(self, local_root: str, pokemon_name: str, workers: int = 16) -> List[UploadResult]:
+        """Upload a downloads/<name> tree (sprites/, forms/<form>/) to pokemon/<name>/ keeping the layout"""
+        files = []
+        for dirpath, _, filenames in os.walk(local_root):
+            for filename in filenames:
+                local_path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(local_path, local_root).replace(os.sep, "/")
+                files.append((local_path, f"pokemon/{pokemon_name}/{rel_path}"))
+        return self.upload_files(files, workers=workers)
+
+    def upload_files(self, files: List[Tuple[str, str]], workers: int = 16) -> List[UploadResult]:
+        """Upload (local_path, blob_path) pairs through a bounded pool, skipping objects GCS already has"""
+        if not files:
+            return []
+        remote = {}
+        if not self.content_store:
+            # One listing per pokemon/<name>/ prefix instead of one request per file
+            for prefix in {"/".join(blob_path.split("/")[:2]) + "/" for _, blob_path in files}:
+                remote.update(self.list_remote(prefix))
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            return list(pool.map(lambda item: self._upload_one(item[0], item[1], remote), files))
+
+    def upload_packs(self, pack_paths: List[str], prefix: str = "packs", workers: int = 8) -> List[UploadResult]:
+        """One object per pack file and one per index instead of one per sprite; unchanged packs are skipped"""
+        files = []
+        for pack_path in pack_paths:
+            for path in (pack_path, index_path(pack_path)):
+                if os.path.exists(path):
+                    files.append((path, f"{prefix}/{os.path.basename(path)}"))
+        if not files:
+            return []
+        remote = self.list_remote(f"{prefix}/")
+        with ThreadPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            results = list(pool.map(lambda item: self._upload_one(item[0], item[1], remote, dedup=False), files))
+        uploaded = sum(1 for result in results if result.status == UPLOADED)
+        logger.info(f"Packs: {uploaded} uploaded, {len(results) - uploaded} skipped or failed")
+        return results
+
+    def list_remote(self, prefix: str) -> Dict[str, Tuple[int, Optional[str]]]:
+        """blob name -> (size, base64 crc32c) for everything under a prefix"""
+        return {
+            blob.name: (blob.size, blob.crc32c)
+            for blob in self.client.list_blobs(self.bucket, prefix=prefix)
+        }
+
+    @staticmethod
+    def local_crc32c(path: str) -> str:
+        checksum = google_crc32c.Checksum()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                checksum.update(chunk)
+        return base64.b64encode(checksum.digest()).decode()
+
+    def _unchanged(self, local_path: str, remote: Optional[Tuple[int, Optional[str]]]) -> bool:
+        if remote is None:
+            return False
+        size, crc32c = remote
+        if size is None or int(size) != os.path.getsize(local_path):
+            return False
+        # Same size is cheap to check; only then pay for hashing the file
+        return crc32c is not None and crc32c == self.local_crc32c(local_path)
+
+    def _upload_one(self, local_path: str, blob_path: str, remote: dict, dedup: bool = True) -> UploadResult:
+        try:
+            if self.content_store and dedup:
+                pokemon_name = blob_path.split("/")[1]
+                with metrics.timer("stage_seconds", stage="upload"):
+                    stored = self.content_store.put_file(local_path, blob_path, pokemon_name)
+                metrics.inc("upload_files_total")
+                return UploadResult(local_path, stored.path, UPLOADED, stored.public_url)
+
+            blob = self.bucket.blob(blob_path)
+            if self._unchanged(local_path, remote.get(blob_path)):
+                metrics.inc("upload_skipped_total")
+                return UploadResult(local_path, blob_path, SKIPPED, blob.public_url)
+
+            with metrics.timer("stage_seconds", stage="upload"):
+                blob.upload_from_filename(local_path, checksum="crc32c")
+            metrics.inc("upload_files_total")
+            return UploadResult(local_path, blob_path, UPLOADED, blob.public_url)
+
+        except Exception as e:
+            metrics.inc("upload_failures_total", error=type(e).__name__)
+            logger.warning(f"Upload failed for {blob_path}: {e}")
+            return UploadResult(local_path, blob_path, FAILED, error=str(e))
+
+    def upload_stream(
+            self,
+            stream: BinaryIO,
+            blob_path: str,
+            size: Optional[int] = None,
+            content_type: Optional[str] = None,
+            pokemon_name: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        """Upload from a readable stream (e.g. an HTTP response body) holding at most about 1 MiB of it in memory;
+        returns (blob path, public url), which with dedup is the media/<sha256> object, not blob_path"""
+        if self.content_store:
+            owner = pokemon_name or blob_path.split("/")[1]
+            stored = self.content_store.put_stream(stream, blob_path, owner, content_type=content_type)
+            return stored.path, stored.public_url
+
+        blob = self.bucket.blob(blob_path)
+        # Overwriting with the same bytes is idempotent, so transient errors are retried unconditionally
+        if size is not None and getattr(stream, "seekable", lambda: False)():
+            upload_file(blob, stream, size, content_type, retry=DEFAULT_RETRY)
+        else:
+            # A one-shot HTTP body can't be replayed: spool it so a retry can rewind
+            spooled, size = spool(stream)
+            with spooled:
+                upload_file(blob, spooled, size, content_type, retry=DEFAULT_RETRY)
+        return blob_path, blob.public_url
+
+    def flush(self) -> None:
+        """Write pending name -> content hash mappings to poke_media"""
+        if self.content_store:
+            self.content_store.flush()
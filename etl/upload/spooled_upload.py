@@ -0,0 +1,29 @@
+import tempfile
+from typing import BinaryIO, Tuple
+
+from google.cloud import storage
+
+# Bodies up to SPOOL_BYTES stay in memory and go up in one multipart request; larger ones spill to a temp file
+# and go up as a resumable upload, UPLOAD_CHUNK_BYTES (a multiple of 256 KiB) per request. Either way at most
+# about 1 MiB of a body is held in memory.
+SPOOL_BYTES = 1 << 20
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+
+def spool(stream: BinaryIO, chunk_size: int = 65536, max_size: int = SPOOL_BYTES) -> Tuple[BinaryIO, int]:
+    """Copy a one-shot stream (an HTTP body) into a rewindable file; returns (file at offset 0, size)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    while chunk := stream.read(chunk_size):
+        spooled.write(chunk)
+    size = spooled.tell()
+    spooled.seek(0)
+    return spooled, size
+
+
+def upload_file(blob: storage.Blob, f: BinaryIO, size: int, content_type=None, **kwargs) -> None:
+    """Upload a seekable file from its current offset with bounded memory; the library can replay it on retry"""
+    if size > SPOOL_BYTES:
+        # An unknown size makes the library use a resumable upload, which reads one chunk at a time
+        blob.chunk_size = UPLOAD_CHUNK_BYTES
+        size = None
+    blob.upload_from_file(f, size=size, content_type=content_type, **kwargs)
@@ -1,7 +1,21 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
 from psycopg2.extras import execute_values
 
-from sql_manager.queries import insert_into_ability
+from etl.transport.http_transport import new_session
+from sql_manager.queries import (
+    find_ability_ids,
+    insert_into_ability,
+    insert_into_pokemon_ability,
+    select_ability_ids,
+    upsert_ability_returning,
+)
 from sql_manager.pool import pool
+from utils.logger import logger
+from utils.settings import ABILITY_URL
 
 class Ability:
 
@@ -12,7 +26,7 @@ class Ability:
             yield (
                 row["name"],
                 url,
-                url.rstrip("/").split("/")[-1]
+                int(url.rstrip("/").split("/")[-1])
             )
 
     @staticmethod
@@ -28,9 +42,161 @@ class Ability:
                 pool.putconn(conn)
 
 
+class AbilityIndex:
+    """In-process url_id -> id_ability map, so pokes_ability links resolve without a query per pokemon"""
+
+    def __init__(self):
+        self._ids: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, url_id: int) -> bool:
+        return url_id in self._ids
+
+    def get(self, url_id: int) -> Optional[int]:
+        return self._ids.get(url_id)
+
+    def update(self, rows: Iterable[Tuple[int, int]]) -> None:
+        """Add (id_ability, url_id) rows, as returned by the upsert or the full select"""
+        with self._lock:
+            for id_ability, url_id in rows:
+                self._ids[url_id] = id_ability
+
+    def missing(self, url_ids: Iterable[int]) -> List[int]:
+        return [url_id for url_id in url_ids if url_id not in self._ids]
+
+    def link_rows(self, links: Iterable[Tuple[int, int]]) -> Iterator[Tuple[int, int]]:
+        """(ability url_id, id_pokes) -> (id_ability, id_pokes); unknown abilities raise KeyError"""
+        ids = self._ids
+        for url_id, id_pokes in links:
+            yield ids[url_id], id_pokes
+
+
+class AbilitySync:
+    """Fetches every page of /ability in parallel and upserts each page as it arrives, filling an AbilityIndex"""
+
+    def __init__(
+            self,
+            base_url: Optional[str] = ABILITY_URL,
+            page_size: int = 100,
+            workers: int = 8,
+            connection_pool=pool,
+            index: Optional[AbilityIndex] = None,
+    ):
+        # ABILITY_URL may carry a "{}" placeholder like POKE_URL does
+        self.base_url = (base_url or "https://pokeapi.co/api/v2/ability").format("").rstrip("/")
+        self.page_size = page_size
+        self.workers = workers
+        self.pool = connection_pool
+        self.index = index if index is not None else AbilityIndex()
+        self.session = new_session(self.base_url)
+
+    def _page(self, offset: int) -> dict:
+        response = self.session.get(f"{self.base_url}?limit={self.page_size}&offset={offset}", timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def pages(self) -> Iterator[List[dict]]:
+        """The first page gives the total count; the remaining offsets are fetched concurrently"""
+        first = self._page(0)
+        yield first["results"]
+        offsets = range(self.page_size, first["count"], self.page_size)
+        if not offsets:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for future in as_completed([executor.submit(self._page, offset) for offset in offsets]):
+                yield future.result()["results"]
+
+    def upsert(self, abilities: Iterable[Tuple[str, str, int]]) -> int:
+        """Upsert (name, url, url_id) rows in one statement and index the ids it returns"""
+        # A url_id may appear only once per statement with DO UPDATE
+        rows = list({url_id: (name, url, url_id) for name, url, url_id in abilities}.values())
+        if not rows:
+            return 0
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            with conn:
+                with conn.cursor() as cursor:
+                    returned = execute_values(cursor, upsert_ability_returning, rows, page_size=len(rows), fetch=True)
+        finally:
+            if conn:
+                self.pool.putconn(conn)
+        self.index.update(returned)
+        return len(returned)
+
+    def load_index(self) -> AbilityIndex:
+        """Fill the index from the table in one query (e.g. in a process that didn't run the sync)"""
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(select_ability_ids)
+                    self.index.update(cursor.fetchall())
+        finally:
+            if conn:
+                self.pool.putconn(conn)
+        return self.index
+
+    def sync(self) -> AbilityIndex:
+        start = time.perf_counter()
+        total = 0
+        for results in self.pages():
+            total += self.upsert(Ability.ability_generator(results))
+        logger.info(f"Synced {total:,} abilities in {time.perf_counter() - start:.2f}s")
+        return self.index
+
+    def resolve(self, url_ids: Iterable[int]) -> List[int]:
+        """Index the given abilities the index hasn't seen, in one query; returns those not in the table either"""
+        missing = self.index.missing(dict.fromkeys(url_ids))
+        if not missing:
+            return []
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(find_ability_ids, (missing,))
+                    self.index.update(cursor.fetchall())
+        finally:
+            if conn:
+                self.pool.putconn(conn)
+        return self.index.missing(missing)
+
+    def link(self, links: Iterable[Tuple[int, int]], names: Optional[Dict[int, Tuple[str, str]]] = None) -> int:
+        """Insert (ability url_id, id_pokes) links, resolving ids from the index; names (url_id -> (name, url))
+        lets abilities missing from the table be upserted first, other unknown abilities are skipped"""
+        links = list(links)
+        missing = self.index.missing(dict.fromkeys(url_id for url_id, _ in links))
+        if missing and names:
+            # Abilities newer than the last sync: one upsert for all of them
+            self.upsert((*names[url_id], url_id) for url_id in missing if url_id in names)
+        unknown = set(self.resolve(missing))
+        if unknown:
+            logger.warning(f"Skipping links to {len(unknown)} abilities that are not in the ability table")
+            links = [link for link in links if link[0] not in unknown]
+        rows = list(dict.fromkeys(self.index.link_rows(links)))
+        if not rows:
+            return 0
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            with conn:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, insert_into_pokemon_ability, rows, page_size=1000)
+        finally:
+            if conn:
+                self.pool.putconn(conn)
+        return len(rows)
+
+    def link_batch(self, batch) -> int:
+        """Insert the pokes_ability rows of a PokemonBatch, resolving ids from the index"""
+        return self.link(batch.rows("pokes_ability"), batch.abilities)
+
 
-# if __name__ == "__main__":
-#     response = requests.get(ABILITY_URL)
-#     data = response.json()
-#     all_abilities = data['results']
-#     Ability.keep_abilities_in_db(Ability.ability_generator(all_abilities))
\ No newline at end of file
+if __name__ == "__main__":
+    index = AbilitySync().sync()
+    print(f"{len(index):,} abilities indexed")
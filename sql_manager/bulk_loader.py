@@ -0,0 +1,157 @@
+import io
+import time
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sql_manager import queries
+from sql_manager.pool import pool
+from utils.logger import logger
+from utils.tracing import tracer
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    table: str
+    columns: Sequence[str]
+    merge: str
+    staging: str = queries.create_staging_table
+    # Idempotent DDL for databases created from an older queries.sql; run once per loader before the first batch
+    upgrade: Optional[str] = None
+
+
+TABLES: Dict[str, TableSpec] = {
+    "ability": TableSpec("ability", ("name", "url", "url_id"), queries.merge_ability),
+    "pokes": TableSpec(
+        "pokes",
+        ("id_pokes", "name", "base_experience", "height", "weight", "poke_order"),
+        queries.merge_pokemon,
+    ),
+    "types": TableSpec("types", ("id_type", "name"), queries.merge_type),
+    "stats": TableSpec("stats", ("id_stat", "name"), queries.merge_stat),
+    "pokes_type": TableSpec("pokes_type", ("id_type", "id_pokes", "slot"), queries.merge_pokemon_type),
+    "pokes_stat": TableSpec("pokes_stat", ("id_stat", "id_pokes", "base_stat", "effort"), queries.merge_pokemon_stat),
+    "poke_media": TableSpec(
+        "poke_media", ("name", "media_url", "content_hash"), queries.merge_poke_media, upgrade=queries.upgrade_poke_media
+    ),
+}
+
+# Parents first so the foreign keys / joins in later merges can see their rows. pokes_ability is not a TableSpec:
+# its links arrive as (ability url_id, pokemon id) and are resolved through the in-process AbilityIndex
+LOAD_ORDER = ("ability", "types", "stats", "pokes", "pokes_ability", "pokes_type", "pokes_stat", "poke_media")
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _batches(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    it = iter(rows)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+class BulkLoader:
+    """Loads pipeline rows with COPY into temp staging tables and one set-based upsert per batch"""
+
+    def __init__(self, batch_size: int = 5000, connection_pool=pool, ability_sync=None):
+        self.batch_size = batch_size
+        self.pool = connection_pool
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self._upgraded = set()
+        self._ability_sync = ability_sync
+
+    @property
+    def ability_sync(self):
+        """AbilitySync whose index resolves pokes_ability links; created on first use"""
+        if self._ability_sync is None:
+            from sql_manager.ability import AbilitySync
+            self._ability_sync = AbilitySync(connection_pool=self.pool)
+        return self._ability_sync
+
+    def _upgrade(self, spec: TableSpec) -> None:
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(spec.upgrade)
+        finally:
+            self.pool.putconn(conn)
+        self._upgraded.add(spec.table)
+
+    def _load_batch(self, spec: TableSpec, batch: List[tuple]) -> None:
+        stage = f"stage_{spec.table}"
+        columns = ", ".join(spec.columns)
+
+        buf = io.StringIO()
+        for row in batch:
+            buf.write("\t".join(_copy_value(v) for v in row))
+            buf.write("\n")
+        buf.seek(0)
+
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            with tracer.span("db", table=spec.table, rows=len(batch)), conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(spec.staging.format(stage=stage, table=spec.table, columns=columns))
+                    cursor.copy_expert(queries.copy_into_staging.format(stage=stage, columns=columns), buf)
+                    cursor.execute(spec.merge.format(stage=stage))
+        finally:
+            if conn:
+                self.pool.putconn(conn)
+
+    def load(self, table: str, rows: Iterable[tuple]) -> int:
+        """Stream rows into a table; each batch is one connection checkout and one transaction"""
+        total = 0
+        start = time.perf_counter()
+        if table == "pokes_ability":
+            for batch in _batches(rows, self.batch_size):
+                with tracer.span("db", table=table, rows=len(batch)):
+                    total += self.ability_sync.link(batch)
+        else:
+            spec = TABLES[table]
+            if spec.upgrade and table not in self._upgraded:
+                self._upgrade(spec)
+            for batch in _batches(rows, self.batch_size):
+                self._load_batch(spec, batch)
+                total += len(batch)
+
+        elapsed = time.perf_counter() - start
+        table_stats = self.stats.setdefault(table, {"rows": 0, "seconds": 0.0})
+        table_stats["rows"] += total
+        table_stats["seconds"] += elapsed
+        rate = total / elapsed if elapsed > 0 else 0
+        logger.info(f"Bulk loaded {total:,} rows into {table} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+        return total
+
+    def load_all(self, rows_by_table: Dict[str, Iterable[tuple]]) -> Dict[str, int]:
+        return {
+            table: self.load(table, rows_by_table[table])
+            for table in LOAD_ORDER
+            if table in rows_by_table
+        }
+
+    def rows_per_second(self, table: Optional[str] = None) -> Dict[str, float]:
+        tables = [table] if table else list(self.stats)
+        return {
+            name: (self.stats[name]["rows"] / self.stats[name]["seconds"]) if self.stats[name]["seconds"] else 0.0
+            for name in tables
+        }
+
+    def load_batch(self, batch) -> Dict[str, int]:
+        """Load a PokemonBatch: lookups, pokemon and every link table, straight from its columns"""
+        return self.load_all(batch.rows_by_table())
+
+    @staticmethod
+    def pokemon_rows(pokemons) -> Iterator[tuple]:
+        for p in pokemons:
+            yield p.id, p.name, p.base_experience, p.height, p.weight, p.poke_order
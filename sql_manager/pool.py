@@ -0,0 +1,38 @@
+import threading
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from utils.settings import DB_URL
+
+
+class LazyConnectionPool:
+    """ThreadedConnectionPool that only connects on first use, so importing sql_manager needs no database"""
+
+    def __init__(self, minconn: int = 1, maxconn: int = 20, dsn: str = DB_URL, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.dsn = dsn
+        self.connect_kwargs = connect_kwargs
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn, **self.connect_kwargs)
+            return self._pool
+
+    def getconn(self):
+        return self._get_pool().getconn()
+
+    def putconn(self, conn, close: bool = False):
+        self._get_pool().putconn(conn, close=close)
+
+    def closeall(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+
+pool = LazyConnectionPool()
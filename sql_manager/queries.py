@@ -27,4 +27,161 @@ insert_into_poke_media = """
 
 find_ability_ids = "SELECT id_ability, url_id FROM ability WHERE url_id = ANY(%s)"
 
-save_gcs_url = "SELECT id_pokes, name FROM pokes ORDER BY id_pokes"
\ No newline at end of file
+# DO UPDATE (not DO NOTHING) so RETURNING reports rows that already existed too
+upsert_ability_returning = """
+                        INSERT INTO ability(name, url, url_id)
+                        VALUES %s
+                        ON CONFLICT (url_id) DO UPDATE SET name = EXCLUDED.name, url = EXCLUDED.url
+                        RETURNING id_ability, url_id
+                    """
+
+select_ability_ids = "SELECT id_ability, url_id FROM ability"
+
+save_gcs_url = "SELECT id_pokes, name FROM pokes ORDER BY id_pokes"
+
+# -------- COPY staging + set-based merges (used by BulkLoader) --------
+create_staging_table = "CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA"
+
+copy_into_staging = "COPY {stage} ({columns}) FROM STDIN"
+
+merge_ability = """
+                        INSERT INTO ability(name, url, url_id)
+                        SELECT DISTINCT ON (url_id) name, url, url_id FROM {stage}
+                        ON CONFLICT (url_id) DO NOTHING
+                    """
+
+merge_pokemon = """
+                        INSERT INTO pokes(id_pokes, name, base_experience, height, weight, poke_order)
+                        SELECT DISTINCT ON (id_pokes) id_pokes, name, base_experience, height, weight, poke_order
+                        FROM {stage}
+                        ON CONFLICT (id_pokes) DO UPDATE SET
+                            name = EXCLUDED.name,
+                            base_experience = EXCLUDED.base_experience,
+                            height = EXCLUDED.height,
+                            weight = EXCLUDED.weight,
+                            poke_order = EXCLUDED.poke_order
+                    """
+
+merge_type = """
+                        INSERT INTO types(id_type, name)
+                        SELECT DISTINCT ON (id_type) id_type, name FROM {stage}
+                        ON CONFLICT (id_type) DO NOTHING
+                    """
+
+merge_stat = """
+                        INSERT INTO stats(id_stat, name)
+                        SELECT DISTINCT ON (id_stat) id_stat, name FROM {stage}
+                        ON CONFLICT (id_stat) DO NOTHING
+                    """
+
+merge_pokemon_type = """
+                        INSERT INTO pokes_type(id_type, id_pokes, slot)
+                        SELECT DISTINCT ON (id_type, id_pokes) id_type, id_pokes, slot FROM {stage}
+                        ON CONFLICT (id_type, id_pokes) DO UPDATE SET slot = EXCLUDED.slot
+                    """
+
+merge_pokemon_stat = """
+                        INSERT INTO pokes_stat(id_stat, id_pokes, base_stat, effort)
+                        SELECT DISTINCT ON (id_stat, id_pokes) id_stat, id_pokes, base_stat, effort FROM {stage}
+                        ON CONFLICT (id_stat, id_pokes) DO UPDATE SET
+                            base_stat = EXCLUDED.base_stat,
+                            effort = EXCLUDED.effort
+                    """
+
+# poke_media predates content_hash; BulkLoader runs this once before its first poke_media load
+upgrade_poke_media = """
+                        ALTER TABLE poke_media ADD COLUMN IF NOT EXISTS content_hash char(64);
+                        CREATE UNIQUE INDEX IF NOT EXISTS poke_media_name_url ON poke_media(name, media_url);
+                        CREATE INDEX IF NOT EXISTS poke_media_content_hash ON poke_media(content_hash)
+                    """
+
+merge_poke_media = """
+                        INSERT INTO poke_media(name, media_url, content_hash)
+                        SELECT DISTINCT ON (name, media_url) name, media_url, content_hash FROM {stage}
+                        ON CONFLICT (name, media_url) DO UPDATE SET
+                            content_hash = COALESCE(EXCLUDED.content_hash, poke_media.content_hash)
+                    """
+
+# -------- sharded runs: work batches leased with FOR UPDATE SKIP LOCKED (used by WorkQueue) --------
+create_work_batches = """
+                        CREATE TABLE IF NOT EXISTS work_batches(
+                            run_id varchar(64),
+                            batch_id int,
+                            ids int[] NOT NULL,
+                            status varchar(10) NOT NULL DEFAULT 'pending',
+                            owner varchar(100),
+                            lease_expires timestamptz,
+                            attempts int NOT NULL DEFAULT 0,
+                            updated_at timestamptz NOT NULL DEFAULT now(),
+                            PRIMARY KEY (run_id, batch_id)
+                        );
+                        CREATE INDEX IF NOT EXISTS work_batches_claim ON work_batches(run_id, status, batch_id)
+                    """
+
+insert_work_batches = """
+                        INSERT INTO work_batches(run_id, batch_id, ids)
+                        VALUES %s
+                        ON CONFLICT (run_id, batch_id) DO NOTHING
+                    """
+
+# Pending batches, or leased ones whose owner stopped heartbeating; SKIP LOCKED lets claimers pass each other
+claim_work_batch = """
+                        UPDATE work_batches w
+                        SET status = 'leased', owner = %(owner)s, attempts = w.attempts + 1,
+                            lease_expires = now() + make_interval(secs => %(lease)s), updated_at = now()
+                        WHERE (w.run_id, w.batch_id) = (
+                            SELECT run_id, batch_id FROM work_batches
+                            WHERE run_id = %(run_id)s
+                              AND (status = 'pending' OR (status = 'leased' AND lease_expires < now()))
+                              AND attempts < %(max_attempts)s
+                            ORDER BY batch_id
+                            FOR UPDATE SKIP LOCKED
+                            LIMIT 1
+                        )
+                        RETURNING w.batch_id, w.ids, w.attempts
+                    """
+
+heartbeat_work_batch = """
+                        UPDATE work_batches
+                        SET lease_expires = now() + make_interval(secs => %(lease)s), updated_at = now()
+                        WHERE run_id = %(run_id)s AND batch_id = %(batch_id)s
+                          AND owner = %(owner)s AND status = 'leased'
+                    """
+
+finish_work_batch = """
+                        UPDATE work_batches
+                        SET status = %(status)s, lease_expires = NULL, updated_at = now()
+                        WHERE run_id = %(run_id)s AND batch_id = %(batch_id)s
+                          AND owner = %(owner)s AND status = 'leased'
+                    """
+
+work_batch_progress = "SELECT status, COUNT(*) FROM work_batches WHERE run_id = %s GROUP BY status"
+
+# -------- snapshot export: rows partitioned by id_pokes / width, media follows its pokemon (used by SnapshotExporter) --------
+# Row-literal md5 per partition; a partition whose fingerprint is unchanged is copied from the previous snapshot
+snapshot_pokes_fingerprints = """
+                        SELECT id_pokes / %(width)s AS part, md5(string_agg(p::text, ',' ORDER BY id_pokes))
+                        FROM pokes p
+                        GROUP BY 1
+                    """
+
+snapshot_media_fingerprints = """
+                        SELECT COALESCE(p.id_pokes / %(width)s, -1) AS part,
+                               md5(string_agg(m::text, ',' ORDER BY m.name, m.media_url))
+                        FROM poke_media m LEFT JOIN pokes p ON p.name = m.name
+                        GROUP BY 1
+                    """
+
+snapshot_pokes_rows = """
+                        SELECT id_pokes, name, base_experience, height, weight, poke_order
+                        FROM pokes
+                        WHERE id_pokes / %(width)s = ANY(%(parts)s)
+                        ORDER BY id_pokes
+                    """
+
+snapshot_media_rows = """
+                        SELECT COALESCE(p.id_pokes / %(width)s, -1) AS part, p.id_pokes, m.name, m.media_url, m.content_hash
+                        FROM poke_media m LEFT JOIN pokes p ON p.name = m.name
+                        WHERE COALESCE(p.id_pokes / %(width)s, -1) = ANY(%(parts)s)
+                        ORDER BY 1, p.id_pokes, m.name, m.media_url
+                    """
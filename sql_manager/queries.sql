@@ -5,6 +5,8 @@ create table ability(
 		url_id int
 )
 
+create unique index ability_url_id on ability(url_id)
+
 create table pokes(
 		id_pokes int primary key,
 		base_experience int,
@@ -22,6 +24,39 @@ create table pokes_ability(
 		PRIMARY KEY (id_ability, id_pokes),
 		FOREIGN KEY (id_ability) REFERENCES ability(id_ability),
 		FOREIGN KEY (id_pokes) REFERENCES pokes(id_pokes)
+)
+
+
+
+
+create table types(
+		id_type int primary key,
+		name varchar(30)
+)
+
+create table stats(
+		id_stat int primary key,
+		name varchar(30)
+)
+
+create table pokes_type(
+		id_type INT,
+		id_pokes INT,
+		slot INT,
+		PRIMARY KEY (id_type, id_pokes),
+		FOREIGN KEY (id_type) REFERENCES types(id_type),
+		FOREIGN KEY (id_pokes) REFERENCES pokes(id_pokes)
+)
+
+create table pokes_stat(
+		id_stat INT,
+		id_pokes INT,
+		base_stat INT,
+		effort INT,
+		PRIMARY KEY (id_stat, id_pokes),
+		FOREIGN KEY (id_stat) REFERENCES stats(id_stat),
+		FOREIGN KEY (id_pokes) REFERENCES pokes(id_pokes)
+)
 
 
 
@@ -29,5 +64,26 @@ create table pokes_ability(
 create table poke_media(
         id serial primary key,
         name varchar(50),
-        media_url varchar(200)
-)
\ No newline at end of file
+        media_url varchar(200),
+        content_hash char(64)
+)
+
+alter table poke_media add column if not exists content_hash char(64)
+
+create unique index if not exists poke_media_name_url on poke_media(name, media_url)
+
+create index if not exists poke_media_content_hash on poke_media(content_hash)
+
+create table if not exists work_batches(
+        run_id varchar(64),
+        batch_id int,
+        ids int[] not null,
+        status varchar(10) not null default 'pending',
+        owner varchar(100),
+        lease_expires timestamptz,
+        attempts int not null default 0,
+        updated_at timestamptz not null default now(),
+        PRIMARY KEY (run_id, batch_id)
+)
+
+create index if not exists work_batches_claim on work_batches(run_id, status, batch_id)
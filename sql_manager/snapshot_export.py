@@ -0,0 +1,128 @@
+import hashlib
+import os
+import time
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from etl.snapshot.snapshot_file import SnapshotReader, SnapshotWriter
+from sql_manager import queries
+from sql_manager.pool import pool
+from utils.logger import logger
+from utils.settings import SNAPSHOT_PATH
+
+
+def _grouped(rows: Iterable[tuple], key) -> Iterator[Tuple[int, List[tuple]]]:
+    for part, group in groupby(rows, key=key):
+        yield part, list(group)
+
+
+class SnapshotExporter:
+    """Streams pokes and poke_media through server-side cursors into a columnar snapshot file; partitions whose
+    fingerprint matches the previous snapshot are copied from it instead of being read again"""
+
+    def __init__(
+            self,
+            path: str = SNAPSHOT_PATH,
+            connection_pool=pool,
+            width: int = 256,
+            itersize: int = 2000,
+    ):
+        self.path = path
+        self.pool = connection_pool
+        self.width = width
+        self.itersize = itersize
+
+    def _fingerprints(self, cursor) -> Dict[int, str]:
+        """Partition -> md5 of its pokes and media rows, computed in the database so only hashes travel"""
+        found: Dict[int, List[str]] = {}
+        for i, query in enumerate((queries.snapshot_pokes_fingerprints, queries.snapshot_media_fingerprints)):
+            cursor.execute(query, {"width": self.width})
+            for part, digest in cursor.fetchall():
+                found.setdefault(part, ["", ""])[i] = digest
+        return {part: hashlib.md5("|".join(digests).encode()).hexdigest() for part, digests in sorted(found.items())}
+
+    def _stream(self, conn, parts: List[int]) -> Iterator[Tuple[int, List[tuple], List[tuple]]]:
+        """(part, pokes rows, media rows) for each changed partition, in order, holding one partition in memory"""
+        if not parts:
+            return
+        params = {"width": self.width, "parts": parts}
+        with conn.cursor(name="snapshot_pokes") as pokes, conn.cursor(name="snapshot_media") as media:
+            pokes.itersize = media.itersize = self.itersize
+            pokes.execute(queries.snapshot_pokes_rows, params)
+            media.execute(queries.snapshot_media_rows, params)
+            pokes_groups = _grouped(pokes, key=lambda row: row[0] // self.width)
+            media_groups = _grouped(media, key=lambda row: row[0])
+            next_pokes, next_media = next(pokes_groups, None), next(media_groups, None)
+            for part in parts:
+                pokes_rows: List[tuple] = []
+                media_rows: List[tuple] = []
+                if next_pokes and next_pokes[0] == part:
+                    pokes_rows = next_pokes[1]
+                    next_pokes = next(pokes_groups, None)
+                if next_media and next_media[0] == part:
+                    media_rows = [row[1:] for row in next_media[1]]
+                    next_media = next(media_groups, None)
+                yield part, pokes_rows, media_rows
+
+    def _previous(self) -> Optional[SnapshotReader]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            reader = SnapshotReader(self.path)
+        except ValueError as e:
+            logger.warning(f"Rebuilding snapshot from scratch: {e}")
+            return None
+        if reader.width != self.width:
+            reader.close()
+            return None
+        return reader
+
+    def export(self, full: bool = False) -> dict:
+        """Rebuild the snapshot (only changed partitions unless full) and swap it in atomically"""
+        start = time.perf_counter()
+        previous = None if full else self._previous()
+        old = {entry["part"]: entry["fingerprint"] for entry in previous.partitions} if previous else {}
+        writer = SnapshotWriter(self.path, self.width)
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    # One consistent view for the fingerprints and both row streams
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                    fingerprints = self._fingerprints(cursor)
+                changed = [part for part, fingerprint in fingerprints.items() if old.get(part) != fingerprint]
+                streamed = self._stream(conn, changed)
+                for part, fingerprint in fingerprints.items():
+                    if part in changed:
+                        _, pokes_rows, media_rows = next(streamed)
+                        writer.add_partition(part, fingerprint, pokes_rows, media_rows)
+                    else:
+                        writer.copy_partition(previous, part)
+                streamed.close()
+            size = writer.finish()
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            self.pool.putconn(conn)
+            if previous:
+                previous.close()
+
+        stats = {
+            "rows": sum(entry["rows"] for entry in writer.partitions),
+            "media_rows": writer.media_rows,
+            "partitions": len(fingerprints),
+            "rebuilt": len(changed),
+            "bytes": size,
+            "seconds": time.perf_counter() - start,
+        }
+        logger.info(
+            f"Snapshot {self.path}: {stats['rows']:,} pokemon, {stats['media_rows']:,} media, "
+            f"{stats['rebuilt']}/{stats['partitions']} partitions rebuilt in {stats['seconds']:.2f}s"
+        )
+        return stats
+
+
+if __name__ == "__main__":
+    stats = SnapshotExporter().export()
+    print(f"{stats['rows']:,} pokemon, {stats['media_rows']:,} media -> {stats['bytes']:,} bytes")
@@ -0,0 +1,150 @@
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from psycopg2.extras import execute_values
+
+from sql_manager import queries
+from sql_manager.pool import pool
+from utils.logger import logger
+from utils.settings import WORK_BATCH_SIZE, WORK_LEASE_SECONDS
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Lease:
+    batch_id: int
+    ids: List[int]
+    attempt: int
+    lost: bool = False
+
+
+class WorkQueue:
+    """Postgres work table shared by every worker of a run; batches are leased, heartbeated and re-leased on expiry"""
+
+    def __init__(
+            self,
+            run_id: str,
+            connection_pool=pool,
+            lease_seconds: int = WORK_LEASE_SECONDS,
+            max_attempts: int = 3,
+            owner: Optional[str] = None,
+    ):
+        self.run_id = run_id
+        self.pool = connection_pool
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    def _execute(self, query: str, params=None, fetch: bool = False):
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params)
+                    if fetch:
+                        return cursor.fetchall()
+                    return cursor.rowcount
+        finally:
+            if conn:
+                self.pool.putconn(conn)
+
+    def setup(self) -> None:
+        self._execute(queries.create_work_batches)
+
+    def enqueue(self, ids: Iterable[int], batch_size: int = WORK_BATCH_SIZE) -> int:
+        """Split ids into numbered batches; idempotent, so every node may seed the same run"""
+        it = iter(sorted(ids))
+        rows = []
+        while batch := list(islice(it, batch_size)):
+            rows.append((self.run_id, len(rows), batch))
+
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            with conn:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, queries.insert_work_batches, rows)
+        finally:
+            if conn:
+                self.pool.putconn(conn)
+        return len(rows)
+
+    def claim(self) -> Optional[Lease]:
+        rows = self._execute(queries.claim_work_batch, {
+            "owner": self.owner,
+            "lease": self.lease_seconds,
+            "run_id": self.run_id,
+            "max_attempts": self.max_attempts,
+        }, fetch=True)
+        if not rows:
+            return None
+        batch_id, ids, attempt = rows[0]
+        return Lease(batch_id, list(ids), attempt)
+
+    def heartbeat(self, lease: Lease) -> bool:
+        """Extend the lease; False means it expired and another worker may own the batch now"""
+        extended = self._execute(queries.heartbeat_work_batch, {
+            "lease": self.lease_seconds,
+            "run_id": self.run_id,
+            "batch_id": lease.batch_id,
+            "owner": self.owner,
+        })
+        if not extended:
+            lease.lost = True
+        return bool(extended)
+
+    def finish(self, lease: Lease, ok: bool) -> None:
+        # A failed batch goes back to pending until it has used up its attempts
+        status = DONE if ok else (FAILED if lease.attempt >= self.max_attempts else PENDING)
+        updated = self._execute(queries.finish_work_batch, {
+            "status": status,
+            "run_id": self.run_id,
+            "batch_id": lease.batch_id,
+            "owner": self.owner,
+        })
+        if not updated:
+            logger.warning(f"Batch {lease.batch_id} of run {self.run_id} was re-leased before {self.owner} finished it")
+
+    @contextmanager
+    def leased(self, lease: Lease) -> Iterator[Lease]:
+        """Heartbeat in the background while the batch is processed; done on success, released on error"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    if not self.heartbeat(lease):
+                        return
+                except Exception as e:
+                    logger.warning(f"Heartbeat for batch {lease.batch_id} failed: {e}")
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield lease
+        except Exception:
+            stop.set()
+            thread.join()
+            self.finish(lease, ok=False)
+            raise
+        stop.set()
+        thread.join()
+        if lease.lost:
+            # Another worker owns the batch now; its outcome, not ours, decides the status
+            logger.warning(f"Batch {lease.batch_id} of run {self.run_id} was lost by {self.owner}; not marking it done")
+            return
+        self.finish(lease, ok=True)
+
+    def progress(self) -> Dict[str, int]:
+        rows = self._execute(queries.work_batch_progress, (self.run_id,), fetch=True)
+        return {status: count for status, count in rows}
@@ -0,0 +1,56 @@
+import json
+import random
+
+import pytest
+
+from etl.extract.json_projection import project
+
+DOCUMENTS = [
+    {"id": 1, "name": "bulbasaur", "weight": 6.9, "height": -1.5e-07, "order": 1e+300, "moves": [{"x": 1.25}, 0.5]},
+    {"id": -0, "name": "é☃ \"quoted\" \\ back", "sprites": {"a": None, "b": [True, False, -12.75E+3]}, "stats": []},
+    {"forms": [{"name": "f", "url": "u"}], "abilities": {}, "types": [[], {}, [1.0, 2.5e1]], "extra": "1.5"},
+]
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    kind = rng.randrange(7 if depth < 3 else 4)
+    if kind == 0:
+        return rng.choice([rng.randint(-10 ** 6, 10 ** 6), rng.uniform(-1e3, 1e3), rng.uniform(-1, 1) * 10 ** rng.randint(-30, 30)])
+    if kind == 1:
+        return "".join(rng.choice("ab\"\\é☃ 1.") for _ in range(rng.randrange(6)))
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind == 3:
+        return rng.randint(-99, 99)
+    if kind == 4:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+def test_every_chunk_size_matches_json_loads(document):
+    data = json.dumps(document).encode()
+    expected = json.loads(data)
+    for size in range(1, len(data) + 1):
+        assert project(chunked(data, size), fields=expected) == expected, size
+
+
+@pytest.mark.parametrize("separators", [(",", ":"), (", ", ": ")])
+def test_fuzzed_documents_match_json_loads(separators):
+    rng = random.Random(12)
+    for _ in range(300):
+        document = {f"f{i}": random_value(rng) for i in range(rng.randrange(1, 6))}
+        data = json.dumps(document, separators=separators, ensure_ascii=rng.random() < 0.5).encode()
+        expected = json.loads(data)
+        wanted = [key for key in expected if rng.random() < 0.6]
+        for size in (1, 2, 3, 5, 7, 16):
+            assert project(chunked(data, size), fields=wanted) == {k: expected[k] for k in wanted}, (data, size)
+
+
+def test_truncated_number_at_end_of_stream_still_fails():
+    with pytest.raises(json.JSONDecodeError):
+        project(chunked(b'{"id": 1.', 2), fields=["id"])
@@ -0,0 +1,98 @@
+import os
+import time
+
+import pytest
+
+pgserver = pytest.importorskip("pgserver")
+
+from bench.fake_servers import start_fake_pokeapi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def db_url(tmp_path_factory):
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pg")), cleanup_mode="stop")
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture
+def run(db_url, tmp_path, monkeypatch):
+    """Fresh working directory, a fake PokeAPI and the shared pool pointed at the test database"""
+    from etl.extract import response_cache
+    from sql_manager.pool import pool
+
+    monkeypatch.chdir(tmp_path)
+    # The process-wide response cache lives under the working directory
+    monkeypatch.setattr(response_cache, "_shared_cache", None)
+    # Spawned workers start from a clean interpreter: they find the database and the code through the environment
+    monkeypatch.setenv("DB_URL", db_url)
+    monkeypatch.setenv("PYTHONPATH", ROOT)
+    monkeypatch.setattr(pool, "dsn", db_url)
+    pool.closeall()
+    server = start_fake_pokeapi()
+    yield f"{server.base_url}/api/v2"
+    server.shutdown()
+    pool.closeall()
+
+
+def statuses(run_id: str):
+    from sql_manager.work_queue import WorkQueue
+
+    queue = WorkQueue(run_id)
+    return queue._execute(
+        "SELECT batch_id, status, attempts FROM work_batches WHERE run_id = %s ORDER BY batch_id", (run_id,), fetch=True
+    )
+
+
+def test_expired_lease_is_reclaimed(run):
+    from sql_manager.work_queue import DONE, WorkQueue
+
+    first = WorkQueue("expiry", lease_seconds=1, owner="a")
+    first.setup()
+    first.enqueue([1, 2, 3], batch_size=3)
+    lease = first.claim()
+    assert first.claim() is None
+
+    time.sleep(1.5)
+    second = WorkQueue("expiry", lease_seconds=1, owner="b")
+    taken = second.claim()
+    assert (taken.batch_id, taken.attempt) == (lease.batch_id, 2)
+    assert not first.heartbeat(lease) and lease.lost
+
+    # The stale owner's outcome is ignored; the new owner's stands
+    first.finish(lease, ok=False)
+    second.finish(taken, ok=True)
+    assert statuses("expiry") == [(0, DONE, 2)]
+
+
+def test_failed_media_releases_the_batch_and_the_retry_fetches_it(run, monkeypatch):
+    from etl.download import sharded_runner
+    from etl.download.media_downloader import FastThreadMediaDownloader
+
+    fetch_media = FastThreadMediaDownloader.fetch_media
+    failed = set()
+
+    def flaky(self, url):
+        if url.endswith("/pokemon/3/front_default.png") and url not in failed:
+            failed.add(url)
+            raise ConnectionError("reset")
+        return fetch_media(self, url)
+
+    monkeypatch.setattr(FastThreadMediaDownloader, "fetch_media", flaky)
+    assert sharded_runner.seed_run("retry", 4, run, batch_size=2) == 2
+    sharded_runner.worker_main("retry", 0, run, lease_seconds=30)
+
+    assert statuses("retry") == [(0, "done", 1), (1, "done", 2)]
+    assert os.path.exists("downloads/poke-3/sprites/front_default_poke-3.png")
+
+
+def test_local_worker_processes_share_a_run(run):
+    from etl.download import sharded_runner
+
+    progress = sharded_runner.run_sharded("shared", 3, api_url=run, limit=12, batch_size=2, lease_seconds=30)
+
+    assert progress == {"done": 6}
+    assert all(attempts == 1 for _, _, attempts in statuses("shared"))
+    assert sorted(os.listdir("downloads")) == sorted(f"poke-{i}" for i in range(1, 13))
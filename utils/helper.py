@@ -1,8 +1,37 @@
-def extract_urls(data: dict) -> list[str]:
-    urls = []
+import hashlib
+from typing import Iterator, Tuple
+
+
+def iter_media_urls(data, prefix: str = "") -> Iterator[Tuple[str, str]]:
+    """Yield (key_path, url) for every http string in nested dicts; key paths are joined with underscores"""
     if isinstance(data, dict):
-        for v in data.values():
-            urls.extend(extract_urls(v))
+        for key, value in data.items():
+            yield from iter_media_urls(value, f"{prefix}_{key}" if prefix else key)
     elif isinstance(data, str) and data.startswith("http"):
-        urls.append(data)
-    return urls
+        yield prefix or "sprite", data
+
+
+def extract_urls(data: dict) -> list[str]:
+    return [url for _, url in iter_media_urls(data)]
+
+
+class HashingReader:
+    """File-like wrapper that hashes and counts bytes as they are read"""
+
+    def __init__(self, raw, algorithm: str = "sha256"):
+        self.raw = raw
+        self.size = 0
+        self.algorithm = algorithm
+        self._hash = hashlib.new(algorithm)
+
+    def read(self, *args) -> bytes:
+        chunk = self.raw.read(*args)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+    def tell(self) -> int:
+        return self.size
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
@@ -0,0 +1,224 @@
+import atexit
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import logger
+from utils.settings import METRICS_PORT, METRICS_SNAPSHOT_PATH
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Optional[dict]) -> Key:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+class _Shard:
+    """One thread's private counters; only that thread writes to it, so no lock on the hot path"""
+
+    def __init__(self):
+        self.counters: Dict[Key, float] = {}
+        self.histograms: Dict[Key, List] = {}
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._lock = threading.Lock()
+        self._gauges: Dict[Key, float] = {}
+        self.started = time.time()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    # -------- WRITES --------
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        counters = self._shard().counters
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        histograms = self._shard().histograms
+        key = _key(name, labels)
+        hist = histograms.get(key)
+        if hist is None:
+            # [bucket counts..., +Inf count], sum
+            hist = histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        hist[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        hist[1] += seconds
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def add_gauge(self, name: str, delta: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def timer(self, name: str, **labels) -> "_Timer":
+        return _Timer(self, name, labels)
+
+    def in_flight(self, name: str, **labels) -> "_InFlight":
+        return _InFlight(self, name, labels)
+
+    # -------- READS --------
+    def _merged(self):
+        with self._lock:
+            shards = list(self._shards)
+            gauges = dict(self._gauges)
+        counters: Dict[Key, float] = {}
+        histograms: Dict[Key, List] = {}
+        for shard in shards:
+            # Copy first: the owning thread may add keys while we iterate
+            for key, value in list(shard.counters.items()):
+                counters[key] = counters.get(key, 0) + value
+            for key, (counts, total) in list(shard.histograms.items()):
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return counters, gauges, histograms
+
+    def snapshot(self) -> dict:
+        counters, gauges, histograms = self._merged()
+
+        def labelled(key: Key) -> dict:
+            return {"name": key[0], "labels": dict(key[1])}
+
+        return {
+            "uptime_s": round(time.time() - self.started, 3),
+            "counters": [{**labelled(k), "value": v} for k, v in sorted(counters.items())],
+            "gauges": [{**labelled(k), "value": v} for k, v in sorted(gauges.items())],
+            "histograms": [
+                {
+                    **labelled(k),
+                    "count": sum(counts),
+                    "sum": round(total, 6),
+                    "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], counts)),
+                }
+                for k, (counts, total) in sorted(histograms.items())
+            ],
+        }
+
+    def prometheus(self) -> str:
+        counters, gauges, histograms = self._merged()
+
+        def fmt(name: str, labels, extra: Optional[Tuple[str, str]] = None) -> str:
+            pairs = list(labels) + ([extra] if extra else [])
+            if not pairs:
+                return name
+            return name + "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{fmt(name, labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{fmt(name, labels)} {value}")
+        for (name, labels), (counts, total) in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{fmt(name + '_bucket', labels, ('le', bound))} {cumulative}")
+            lines.append(f"{fmt(name + '_sum', labels)} {total}")
+            lines.append(f"{fmt(name + '_count', labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        logger.info(f"Metrics snapshot written to {path}")
+
+
+class _Timer:
+    def __init__(self, registry: MetricsRegistry, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _InFlight:
+    def __init__(self, registry: MetricsRegistry, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.registry.add_gauge(self.name, 1, **self.labels)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.add_gauge(self.name, -1, **self.labels)
+        return False
+
+
+metrics = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = metrics.prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics (Prometheus text) and /metrics.json on a local port; port 0 disables it"""
+    global _server
+    if not port or _server is not None:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return _server
+
+
+def enable_snapshot_at_exit(path: str = METRICS_SNAPSHOT_PATH) -> None:
+    if path:
+        atexit.register(metrics.write_snapshot, path)
@@ -1,16 +1,67 @@
 import os
 
-import dotenv
+_loaded = False
 
-dotenv.load_dotenv()
 
-URL = os.getenv("POKE_URL")
-ABILITY_URL = os.getenv("ABILITY_URL")
+def _load() -> dict:
+    """Read .env and the environment once, on first access to any setting rather than at import"""
+    import dotenv
 
-DB_URL = os.getenv("DB_URL")
+    dotenv.load_dotenv()
+    return dict(
+        URL=os.getenv("POKE_URL"),
+        ABILITY_URL=os.getenv("ABILITY_URL"),
 
-PROJECT_ID = os.getenv("PROJECT_ID")
-BUCKET_NAME = os.getenv("BUCKET_NAME")
+        DB_URL=os.getenv("DB_URL"),
 
-POKE_GCS_URL = os.getenv("POKE_GCS_URL")
-HOME = os.getenv("HOME")
+        PROJECT_ID=os.getenv("PROJECT_ID"),
+        BUCKET_NAME=os.getenv("BUCKET_NAME"),
+
+        POKE_GCS_URL=os.getenv("POKE_GCS_URL"),
+        HOME=os.getenv("HOME"),
+
+        HTTP_CACHE_DIR=os.getenv("HTTP_CACHE_DIR", ".cache/http"),
+        HTTP_CACHE_MAX_MB=int(os.getenv("HTTP_CACHE_MAX_MB", "512")),
+        HTTP_CACHE_OFFLINE=os.getenv("HTTP_CACHE_OFFLINE", "0") == "1",
+        # Optimized images (and their thumbnail/WebP variants) keyed by the sha256 of the original
+        IMAGE_CACHE_DIR=os.getenv("IMAGE_CACHE_DIR", ".cache/images"),
+
+        MANIFEST_PATH=os.getenv("MANIFEST_PATH", "manifest.sqlite"),
+        # Columnar export of pokes + poke_media for readers that shouldn't query the database
+        SNAPSHOT_PATH=os.getenv("SNAPSHOT_PATH", "snapshots/pokedex.snap"),
+
+        # Process-wide per-host budgets: requests/second, burst, max open connections
+        POKEAPI_RPS=float(os.getenv("POKEAPI_RPS", "100")),
+        POKEAPI_MAX_CONNECTIONS=int(os.getenv("POKEAPI_MAX_CONNECTIONS", "64")),
+        GITHUB_RAW_RPS=float(os.getenv("GITHUB_RAW_RPS", "400")),
+        GITHUB_RAW_MAX_CONNECTIONS=int(os.getenv("GITHUB_RAW_MAX_CONNECTIONS", "256")),
+        GCS_RPS=float(os.getenv("GCS_RPS", "400")),
+        GCS_MAX_CONNECTIONS=int(os.getenv("GCS_MAX_CONNECTIONS", "128")),
+
+        METRICS_PORT=int(os.getenv("METRICS_PORT", "0")),
+        METRICS_SNAPSHOT_PATH=os.getenv("METRICS_SNAPSHOT_PATH", ""),
+        # Opt-in Chrome/Perfetto trace written at exit; TRACE_SAMPLE_RATE is the share of pokemon traced
+        TRACE_PATH=os.getenv("TRACE_PATH", ""),
+        TRACE_SAMPLE_RATE=float(os.getenv("TRACE_SAMPLE_RATE", "0.05")),
+
+        # Sharded runs: a worker that misses heartbeats for this long loses its batch to another worker
+        WORK_LEASE_SECONDS=int(os.getenv("WORK_LEASE_SECONDS", "60")),
+        WORK_BATCH_SIZE=int(os.getenv("WORK_BATCH_SIZE", "25")),
+
+        # Tail latency: a request still running past this percentile of recent latencies gets one duplicate,
+        # with duplicates capped at HEDGE_BUDGET_RATIO of all requests. RUN_DEADLINE_SECONDS=0 means no deadline.
+        HEDGE_PERCENTILE=float(os.getenv("HEDGE_PERCENTILE", "0.95")),
+        HEDGE_BUDGET_RATIO=float(os.getenv("HEDGE_BUDGET_RATIO", "0.05")),
+        RUN_DEADLINE_SECONDS=float(os.getenv("RUN_DEADLINE_SECONDS", "0")),
+    )
+
+
+def __getattr__(name: str):
+    # `from utils.settings import X` lands here the first time; after that every setting is a plain module global
+    global _loaded
+    if not _loaded and not name.startswith("__"):
+        globals().update(_load())
+        _loaded = True
+        if name in globals():
+            return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
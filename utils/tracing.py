@@ -0,0 +1,266 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import logger
+
+# (name, item, start ns, end ns, thread id, args)
+MIN_WAIT_NS = 1_000_000  # shorter gaps on a critical path are scheduling noise, not waiting
+Event = Tuple[str, Optional[str], int, int, int, Optional[dict]]
+
+
+class _Span:
+    def __init__(self, tracer: "Tracer", name: str, item: Optional[str], args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.item = item
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # The sampling decision waits until here so the item can be named inside the span (e.g. after a fetch)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.item, self.start, time.perf_counter_ns(), **self.args)
+        return False
+
+
+class _NoSpan:
+    """Shared stand-in while tracing is off; attributes set on it (span.item = ...) are dropped"""
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """Sampled per-item spans. Items (pokemon names) are sampled by hash, so every span of a sampled pokemon is
+    kept on whichever thread it ran; spans with item=None (stages, batches) are always kept while tracing is on"""
+
+    def __init__(self, sample_rate: float = 0.0, max_events: int = 500_000):
+        self.sample_rate = sample_rate
+        self.max_events = max_events
+        self._local = threading.local()
+        self._buffers: List[List[Event]] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.dropped = 0
+        self.origin = time.perf_counter_ns()
+        self.process_name: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def configure(self, sample_rate: float, process_name: Optional[str] = None) -> None:
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.process_name = process_name
+        self.origin = time.perf_counter_ns()
+
+    def sampled(self, item: Optional[str]) -> bool:
+        if item is None or self.sample_rate >= 1:
+            return self.enabled
+        return zlib.crc32(item.encode()) < self.sample_rate * 0xFFFFFFFF
+
+    # -------- WRITES --------
+    def span(self, name: str, item: Optional[str] = None, **args):
+        if not self.sample_rate:
+            return _NO_SPAN
+        return _Span(self, name, item, args)
+
+    def record(self, name: str, item: Optional[str], start_ns: int, end_ns: int, **args) -> None:
+        if not self.sampled(item):
+            return
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = []
+            with self._lock:
+                self._buffers.append(buffer)
+                self._threads[threading.get_ident()] = threading.current_thread().name
+        # Unlocked counters: off by a few under contention, which is fine for a memory cap
+        if self.recorded >= self.max_events:
+            self.dropped += 1
+            return
+        self.recorded += 1
+        buffer.append((name, item, start_ns, end_ns, self._track(), args or None))
+
+    def _track(self) -> int:
+        """Thread id, or the asyncio task's id on an event loop, where overlapping spans share one thread"""
+        # A running loop means asyncio is already imported; looking it up keeps it out of every other startup
+        asyncio = sys.modules.get("asyncio")
+        loop = asyncio._get_running_loop() if asyncio else None
+        if loop is None:
+            return threading.get_ident()
+        task = asyncio.current_task(loop)
+        if task is None:
+            return threading.get_ident()
+        track = id(task)
+        if track not in self._threads:
+            with self._lock:
+                self._threads[track] = task.get_name()
+        return track
+
+    # -------- READS --------
+    def events(self) -> List[Event]:
+        with self._lock:
+            buffers = list(self._buffers)
+        return sorted((event for buffer in buffers for event in list(buffer)), key=lambda e: e[2])
+
+    def chrome_trace(self, summary: Optional[dict] = None) -> dict:
+        """Chrome trace event format (chrome://tracing, ui.perfetto.dev): one complete event per span"""
+        pid = os.getpid()
+        with self._lock:
+            threads = sorted(self._threads.items())
+        trace_events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads
+        ]
+        if self.process_name:
+            # Traces of several worker processes can be loaded together; the label tells their pids apart
+            trace_events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.process_name}})
+        for name, item, start, end, tid, args in self.events():
+            trace_events.append({
+                "name": name,
+                "cat": "stage" if item is None else "item",
+                "ph": "X",
+                "ts": (start - self.origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": {"item": item, **(args or {})},
+            })
+        return {
+            "traceEvents": trace_events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "process": self.process_name,
+                "sample_rate": self.sample_rate,
+                "dropped": self.dropped,
+                "summary": summary or self.summary(),
+            },
+        }
+
+    def summary(self, top: int = 5) -> dict:
+        """Per-span latency, and where the critical path of each sampled item spent its time"""
+        by_name: Dict[str, List[float]] = {}
+        by_item: Dict[str, List[Event]] = {}
+        for event in self.events():
+            by_name.setdefault(event[0], []).append((event[3] - event[2]) / 1e9)
+            if event[1] is not None:
+                by_item.setdefault(event[1], []).append(event)
+
+        spans = {}
+        for name, durations in sorted(by_name.items()):
+            durations.sort()
+            spans[name] = {
+                "count": len(durations),
+                "total_s": round(sum(durations), 3),
+                "p50_ms": round(durations[(len(durations) - 1) // 2] * 1000, 1),
+                "p95_ms": round(durations[int(0.95 * (len(durations) - 1))] * 1000, 1),
+            }
+        shares: Dict[str, float] = {}
+        paths = []
+        for item, events in by_item.items():
+            path = critical_path(events)
+            for name, seconds in path:
+                shares[name] = shares.get(name, 0.0) + seconds
+            paths.append((sum(seconds for _, seconds in path), item, path))
+        paths.sort(reverse=True)
+        total = sum(shares.values()) or 1.0
+        return {
+            "items": len(by_item),
+            "spans": spans,
+            "critical_path_share": {name: round(s / total, 3) for name, s in sorted(shares.items(), key=lambda kv: -kv[1])},
+            "slowest": [
+                {"item": item, "elapsed_s": round(elapsed, 3), "path": [[name, round(s, 4)] for name, s in path]}
+                for elapsed, item, path in paths[:top]
+            ],
+        }
+
+    def report(self, path: Optional[str] = None) -> None:
+        """Write the trace (when a path is given) and print the critical-path summary"""
+        if not self.enabled:
+            return
+        s = self.summary()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(self.chrome_trace(s), f)
+            logger.info(f"Trace written to {path} (open in ui.perfetto.dev)")
+        label = f"[{self.process_name}] " if self.process_name else ""
+        print(f"\n🔬 {label}Traced {s['items']:,} items at {self.sample_rate:.0%} sampling ({self.dropped:,} spans dropped)")
+        print("🧭 Critical path: " + ", ".join(f"{name} {share:.0%}" for name, share in s["critical_path_share"].items()))
+        for slow in s["slowest"]:
+            totals: Dict[str, float] = {}
+            for name, seconds in slow["path"]:
+                totals[name] = totals.get(name, 0.0) + seconds
+            steps = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in sorted(totals.items(), key=lambda kv: -kv[1]))
+            print(f"   🐢 {slow['item']:<24} {slow['elapsed_s']:6.2f}s  {steps} ({len(slow['path'])} steps)")
+
+
+def critical_path(events: List[Event]) -> List[Tuple[str, float]]:
+    """Walk back from the span that finished last, each step taking the latest span that ended before the current
+    one started; gaps between steps (queueing, waiting for a pool slot) are reported as wait"""
+    remaining = sorted(events, key=lambda e: e[3])
+    current = remaining.pop()
+    path = [(current[0], (current[3] - current[2]) / 1e9)]
+    while remaining:
+        i = len(remaining) - 1
+        while i >= 0 and remaining[i][3] > current[2]:
+            i -= 1
+        if i < 0:
+            break
+        previous = remaining[i]
+        del remaining[i:]
+        if current[2] - previous[3] >= MIN_WAIT_NS:
+            path.append(("wait", (current[2] - previous[3]) / 1e9))
+        path.append((previous[0], (previous[3] - previous[2]) / 1e9))
+        current = previous
+    return path[::-1]
+
+
+tracer = Tracer()
+
+
+def process_trace_path(path: str, process_name: str) -> str:
+    """traces/run.json -> traces/run.worker-0.json, so processes sharing a trace path don't overwrite each other"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{process_name.replace(' ', '-')}{ext or '.json'}"
+
+
+def enable_tracing_at_exit(
+        path: Optional[str] = None,
+        sample_rate: Optional[float] = None,
+        process_name: Optional[str] = None,
+) -> Optional[str]:
+    """Trace at sample_rate and write path when the process exits; no-op unless a path or TRACE_PATH is set.
+    A process_name labels the process in the trace and gets its own file; returns the path written at exit"""
+    # Read here rather than at import so importing the tracer never loads .env
+    from utils.settings import TRACE_PATH, TRACE_SAMPLE_RATE
+
+    path = path or TRACE_PATH
+    sample_rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if not path:
+        return None
+    if process_name:
+        path = process_trace_path(path, process_name)
+    tracer.configure(sample_rate, process_name)
+    atexit.register(tracer.report, path)
+    return path